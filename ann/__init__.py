@@ -0,0 +1,25 @@
+"""
+Artificial Neural Network without Tensorflow, Keras, PyTorch
+---
+
+The layers, the network and everything needed to train and run it. Importing the package only imports
+numpy and the standard library: no data is loaded, nothing is trained and nothing is plotted. The MNIST
+dataset (mnist), plotting (plotting) and the training script (nn.py) are separate.
+
+```
+from ann import Network, Flatten, Dense, optimizers
+
+nw = Network(optimizer = optimizers.SGD(lr = 0.01, momentum = 0.9))
+nw.add(Flatten(normalize = 255))
+nw.add(Dense(784, 10, activation = "softmax"))
+```
+"""
+
+from .activations import (relu, relu_der, softmax, softmax_der, linear, linear_der, ACTIVATIONS,
+                          register_activation, get_activation)
+from .precision import Precision
+from .layers import SuperLayer, Flatten, Dense, SparseDense, QuantizedDense, LAYER_TYPES
+from .convolution import Conv2D, MaxPool2D, AvgPool2D
+from .network import Network
+from . import optimizers
+from . import metrics
@@ -0,0 +1,186 @@
+"""
+Activation functions
+---
+
+Every activation function and its derivative take the net output of a layer and an optional "out" buffer
+to write the result into, so layers can apply them in place. Activations are looked up by name in the
+ACTIVATIONS registry; new ones can be added with register_activation().
+"""
+
+import numpy as np
+
+################################################################################
+#
+# ACTIVATIONS
+#
+################################################################################
+
+def relu(x,out = None):
+    """
+    Performs the relu activation function.
+    If element is <= 0, return 0, else return the element
+
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to write the result into. Can be x itself.
+
+    Output:
+    ------
+    x: numpy.ndarray
+    """
+    return np.maximum(x, 0, out = out)
+
+def relu_der(x,out = None):
+    """
+    Calculates derivative of relu, used in error back propagation
+    If element is <= 0, return 0, else return 1
+    
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to write the result into. Can be x itself.
+    
+    Output:
+    ------
+    x: numpy.ndarray
+    """
+    if out is None:
+        return (x > 0).astype(x.dtype)
+    return np.greater(x, 0, out = out)
+
+def softmax(x,out = None):
+    """
+    Performs the softmax activation function.
+    Turns a vector of K real numbers to a vector of K real numbers, each between 0 and 1
+    that sum to 1. The row maximum is subtracted before exponentiating, so large inputs
+    don't overflow.
+    
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to write the result into. Can be x itself.
+    
+    Output:
+    ------
+    x: numpy.ndarray            
+    """
+    out = np.subtract(x, x.max(axis = 1, keepdims = True), out = out)
+    np.exp(out, out = out)
+    out /= out.sum(axis = 1, keepdims = True)
+    return out
+
+def softmax_der(x,out = None):
+    """
+    Derivative of softmax, used in error back propagation. Softmax is only used together with
+    cross entropy loss, whose gradient (prediction - true) already includes the softmax derivative,
+    so this returns 1 for every element.
+    
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to write the result into. Can be x itself.
+    
+    Output:
+    ------
+    x: numpy.ndarray
+    """
+    if out is None:
+        return np.ones_like(x)
+    out.fill(1)
+    return out
+
+def linear(x,out = None):
+    """
+    Performs the linear activation function
+    Returns the input without any modification
+    
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to copy the input into.
+    
+    Output:
+    ------
+    x: numpy.ndarray
+    """
+    if out is None or out is x:
+        return x
+    np.copyto(out, x)
+    return out
+
+def linear_der(x,out = None):
+    """
+    Calculates derivative of the linear activation function, which is 1 for every element
+    
+    Input:
+    -----
+    x: numpy.ndarray
+        Array of shape (batch, features)
+    out: numpy.ndarray
+        Optional buffer of the same shape to write the result into. Can be x itself.
+    
+    Output:
+    ------
+    x: numpy.ndarray
+    """
+    if out is None:
+        return np.ones_like(x)
+    out.fill(1)
+    return out
+
+#Registry of activation functions. Maps the name used in Dense(activation = ...) to the 
+#activation function and its derivative
+ACTIVATIONS = {
+    "relu": (relu, relu_der),
+    "softmax": (softmax, softmax_der),
+    "linear": (linear, linear_der),
+}
+
+def register_activation(name,function,derivative):
+    """
+    Adds a new activation function to the registry, so it can be used by layers as activation = name.
+    Both functions must take an array of shape (batch, features) and an optional "out" buffer.
+    
+    Input:
+    -----
+    name: str
+        Name of the activation function
+    function: callable
+        The activation function, function(x, out = None)
+    derivative: callable
+        Derivative of the activation function, derivative(x, out = None)
+    
+    Output:
+    -------
+        None
+    """
+    ACTIVATIONS[name] = (function, derivative)
+
+def get_activation(name):
+    """
+    Looks up an activation function and its derivative in the registry
+    
+    Input:
+    -----
+    name: str
+        Name of the activation function
+    
+    Output:
+    -------
+    (function, derivative): tuple
+    """
+    try:
+        return ACTIVATIONS[name]
+    except KeyError:
+        raise Exception("Unsupported activation function: "+str(name))
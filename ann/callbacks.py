@@ -0,0 +1,309 @@
+"""
+Callbacks
+---
+
+Callbacks control Network.fit while it trains. fit calls their hooks at the start and end of training,
+of every epoch and after every batch, and stops training when one of them sets network.stop_training.
+
+```
+nw.fit(x = train_data, y = train_labels, epochs = 50, validation_split = 0.1, batch_size = 64,
+       callbacks = [callbacks.EarlyStopping("epoch_acc", patience = 3, restore_best_weights = True),
+                    callbacks.ReduceLROnPlateau("epoch_loss", factor = 0.5, patience = 2),
+                    callbacks.Budget(seconds = 600)])
+```
+
+Built-in callbacks:
+
+- EarlyStopping: stops when a metric hasn't improved for "patience" epochs
+- ReduceLROnPlateau: multiplies the learning rate by "factor" when a metric hasn't improved for
+  "patience" epochs
+- BestWeights: keeps an in-memory copy of the weights of the best epoch, and puts them back at the end
+- Budget: stops after a number of seconds or samples, or at a wall-clock deadline, in the middle of an
+  epoch if needed
+
+The metrics are the ones fit records: "epoch_loss" (average training loss, lower is better) and
+"epoch_acc" (validation accuracy, higher is better, only in epochs that were validated). With background
+validation (validation_mode = "thread" or "process") the accuracy of an epoch is only known after the
+next epoch, so monitor "epoch_loss" or validate in the foreground.
+
+New callbacks subclass Callback and override the hooks they need.
+"""
+
+import time
+import numpy as np
+
+#Whether higher or lower values of a metric are better
+MODES = {"epoch_acc": "max", "epoch_loss": "min"}
+
+class Callback:
+    """
+    Base class of the callbacks. The hooks do nothing.
+
+    logs (epoch end): dict
+        epoch_loss: average training loss of the epoch
+        epoch_acc: validation accuracy received during the epoch, None if there was none
+        epoch_time: seconds the epoch took
+        samples: number of samples trained on in the epoch
+    """
+
+    def on_train_begin(self,network):
+        pass
+
+    def on_epoch_begin(self,network,epoch):
+        pass
+
+    def on_batch_end(self,network,batch,loss,size):
+        """
+        Called after every batch, with the batch's index in the epoch, its summed loss and its number of
+        samples
+        """
+        pass
+
+    def on_epoch_end(self,network,epoch,logs):
+        pass
+
+    def on_train_end(self,network):
+        pass
+
+class Monitor(Callback):
+    """
+    Base class of callbacks that follow a metric and count the epochs since it last improved.
+
+    Parameters:
+    -----------
+    monitor: str
+        Name of the metric in the logs: "epoch_acc" or "epoch_loss". Default = "epoch_acc"
+    min_delta: double
+        Smallest change that counts as an improvement. Default = 0.0
+    mode: str
+        "max" or "min". Default = None (from the metric, See MODES)
+    best: double
+        Best value seen
+    wait: int
+        Number of epochs with a value that didn't improve on best
+    """
+
+    def __init__(self,monitor = "epoch_acc",min_delta = 0.0,mode = None):
+        if mode is None:
+            if monitor not in MODES:
+                raise Exception("Unknown metric "+str(monitor)+", give its mode (\"max\" or \"min\")")
+            mode = MODES[monitor]
+        if mode not in ("max", "min"):
+            raise Exception("Unsupported mode: "+str(mode))
+        self.monitor = monitor
+        self.min_delta = min_delta
+        self.mode = mode
+        self.best = None
+        self.wait = 0
+
+    def on_train_begin(self,network):
+        self.best = None
+        self.wait = 0
+
+    def improved(self,value):
+        if self.best is None:
+            return True
+        if self.mode == "max":
+            return value > self.best + self.min_delta
+        return value < self.best - self.min_delta
+
+    def update(self,logs):
+        """
+        Updates best and wait with the metric of an epoch.
+
+        Output:
+        -------
+        improved: bool
+            None if the epoch has no value of the metric (Eg. it wasn't validated)
+        """
+        value = logs.get(self.monitor)
+        if value is None or not np.isfinite(value):
+            return None
+        if self.improved(value):
+            self.best = value
+            self.wait = 0
+            return True
+        self.wait += 1
+        return False
+
+class BestWeights(Monitor):
+    """
+    Keeps a copy of the weights of the epoch with the best value of a metric, in memory, and copies them
+    back into the network when training ends. Other parameters, See Monitor.
+
+    Parameters:
+    -----------
+    restore: bool
+        Put the best weights back at the end of training. Default = True
+    best_epoch: int
+        Epoch the weights are from
+    weights: list
+        Copies of the parameters, in the order of Network.params()
+    """
+
+    def __init__(self,monitor = "epoch_acc",min_delta = 0.0,mode = None,restore = True):
+        super().__init__(monitor, min_delta, mode)
+        self.restore = restore
+        self.best_epoch = None
+        self.weights = None
+
+    def on_train_begin(self,network):
+        super().on_train_begin(network)
+        self.best_epoch = None
+        self.weights = None
+
+    def on_epoch_end(self,network,epoch,logs):
+        if self.update(logs):
+            self.save(network)
+            self.best_epoch = epoch
+
+    def save(self,network):
+        if self.weights is None:
+            self.weights = [np.array(param) for param, grad in network.params()]
+        else:
+            for saved, (param, grad) in zip(self.weights, network.params()):
+                np.copyto(saved, param)
+
+    def restore_weights(self,network):
+        """
+        Copies the saved weights into the network's parameters, in place
+        """
+        for saved, (param, grad) in zip(self.weights, network.params()):
+            np.copyto(param, saved)
+        network.reset_master()
+
+    def on_train_end(self,network):
+        if self.restore and self.weights is not None:
+            print("Restoring the weights of epoch "+str(self.best_epoch)+" ("+self.monitor+" "+str(round(self.best, 4))+")")
+            self.restore_weights(network)
+
+class EarlyStopping(Monitor):
+    """
+    Stops training when a metric hasn't improved for "patience" epochs that have a value of it. Other
+    parameters, See Monitor.
+
+    Parameters:
+    -----------
+    patience: int
+        Default = 3
+    restore_best_weights: bool
+        Put back the weights of the best epoch when training stops (See BestWeights). Default = False
+    stopped_epoch: int
+        Epoch training was stopped after, None if it wasn't
+    """
+
+    def __init__(self,monitor = "epoch_acc",patience = 3,min_delta = 0.0,mode = None,restore_best_weights = False):
+        super().__init__(monitor, min_delta, mode)
+        self.patience = patience
+        self.best_weights = BestWeights(monitor, min_delta, mode) if restore_best_weights else None
+        self.stopped_epoch = None
+
+    def on_train_begin(self,network):
+        super().on_train_begin(network)
+        self.stopped_epoch = None
+        if self.best_weights is not None:
+            self.best_weights.on_train_begin(network)
+
+    def on_epoch_end(self,network,epoch,logs):
+        if self.best_weights is not None:
+            self.best_weights.on_epoch_end(network, epoch, logs)
+        if self.update(logs) is False and self.wait >= self.patience:
+            print("Early stopping: "+self.monitor+" hasn't improved for "+str(self.wait)+" epochs")
+            self.stopped_epoch = epoch
+            network.stop_training = True
+
+    def on_train_end(self,network):
+        if self.best_weights is not None:
+            self.best_weights.on_train_end(network)
+
+class ReduceLROnPlateau(Monitor):
+    """
+    Multiplies the learning rate by "factor" when a metric hasn't improved for "patience" epochs. The
+    learning rate is the optimizer's (before its schedule), or every layer's without an optimizer.
+    Hogwild workers keep the learning rate they started with. Other parameters, See Monitor.
+
+    Parameters:
+    -----------
+    factor: double
+        Default = 0.5
+    patience: int
+        Default = 2
+    min_lr: double
+        The learning rate isn't reduced below it. Default = 0.0
+    cooldown: int
+        Number of epochs after a reduction during which the metric isn't followed. Default = 0
+    """
+
+    def __init__(self,monitor = "epoch_loss",factor = 0.5,patience = 2,min_delta = 0.0,mode = None,min_lr = 0.0,cooldown = 0):
+        super().__init__(monitor, min_delta, mode)
+        if not 0 < factor < 1:
+            raise Exception("factor must be between 0 and 1")
+        self.factor = factor
+        self.patience = patience
+        self.min_lr = min_lr
+        self.cooldown = cooldown
+        self.cooldown_left = 0
+
+    def on_train_begin(self,network):
+        super().on_train_begin(network)
+        self.cooldown_left = 0
+
+    def on_epoch_end(self,network,epoch,logs):
+        if self.cooldown_left > 0:
+            self.cooldown_left -= 1
+            self.wait = 0
+        if self.update(logs) is False and self.wait >= self.patience:
+            owners = [network.optimizer] if network.optimizer is not None else [l for l in network.layers if hasattr(l, "lr")]
+            for owner in owners:
+                owner.lr = max(owner.lr * self.factor, self.min_lr)
+            if owners:
+                print("Reducing the learning rate to "+str(owners[0].lr))
+            self.wait = 0
+            self.cooldown_left = self.cooldown
+
+class Budget(Callback):
+    """
+    Stops training when a time or sample budget is used up, checked after every batch (after every epoch
+    with hogwild). The epoch is ended early and recorded as usual.
+
+    Parameters:
+    -----------
+    seconds: double
+        Wall-clock seconds from the start of fit. Default = None
+    samples: int
+        Number of samples trained on. Default = None
+    deadline: double
+        Time (as returned by time.time()) at which training stops. Default = None
+    """
+
+    def __init__(self,seconds = None,samples = None,deadline = None):
+        self.seconds = seconds
+        self.samples = samples
+        self.deadline = deadline
+        self.start = None
+        self.seen = 0
+
+    def on_train_begin(self,network):
+        self.start = time.time()
+        self.seen = 0
+
+    def on_batch_end(self,network,batch,loss,size):
+        self.seen += size
+        self.check(network)
+
+    def on_epoch_end(self,network,epoch,logs):
+        #Hogwild training has no batch hooks
+        self.check(network)
+
+    def check(self,network):
+        now = time.time()
+        reason = None
+        if self.seconds is not None and now - self.start >= self.seconds:
+            reason = str(self.seconds)+" seconds"
+        elif self.deadline is not None and now >= self.deadline:
+            reason = "the deadline"
+        elif self.samples is not None and self.seen >= self.samples:
+            reason = str(self.samples)+" samples"
+        if reason is not None and not network.stop_training:
+            print("\nBudget of "+reason+" reached")
+            network.stop_training = True
@@ -0,0 +1,138 @@
+"""
+Checkpoint file format
+---
+
+A checkpoint is a single binary file:
+
+```
+magic       8 bytes   b"ANNCKPT\0"
+version     uint32    little endian, currently 1
+reserved    uint32
+header_len  uint64    length of the header in bytes
+header      JSON      utf-8, describes the network and every stored array
+padding               up to the next multiple of ALIGNMENT
+data                  all arrays, contiguous, each starting at a multiple of ALIGNMENT
+```
+
+The header lists every array with its offset in the data section, shape and dtype. Since the arrays are
+stored contiguously and aligned, load() can memory map the data section once and return zero copy views
+of it, so inference processes only read the weights they use, and processes loading the same file share
+the pages.
+
+This module only reads and writes the file; Network.save() and Network.load() decide what goes in it.
+"""
+
+import os
+import json
+import struct
+import numpy as np
+
+MAGIC = b"ANNCKPT\0"
+VERSION = 1
+ALIGNMENT = 64
+
+def align(n):
+    """
+    Rounds n up to the next multiple of ALIGNMENT
+    """
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def save(path,header,arrays):
+    """
+    Writes a checkpoint. The file is written under a temporary name and then renamed, so an interrupted
+    save never leaves a broken checkpoint behind, and processes that have the old file memory mapped
+    keep their (still valid) mapping.
+
+    Input:
+    -----
+    path: str
+    header: dict
+        JSON serializable description of the network. An "arrays" entry is added, describing each
+        array in "arrays" (offset, shape, dtype); other entries refer to arrays by their index.
+    arrays: list
+        List of numpy.ndarray
+
+    Output:
+    -------
+        None
+    """
+    entries = []
+    offset = 0
+    for arr in arrays:
+        entries.append({"offset": offset, "shape": list(arr.shape), "dtype": arr.dtype.str})
+        offset = align(offset + arr.nbytes)
+    header = dict(header, arrays = entries)
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = align(len(MAGIC) + 16 + len(header_bytes))
+
+    tmp_path = path+".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<IIQ", VERSION, 0, len(header_bytes)))
+        f.write(header_bytes)
+        for arr, entry in zip(arrays, entries):
+            f.write(b"\0" * (start + entry["offset"] - f.tell()))
+            f.write(memoryview(np.ascontiguousarray(arr)).cast("B"))
+    os.replace(tmp_path, path)
+
+def read_header(path):
+    """
+    Reads the header of a checkpoint, without touching the arrays.
+
+    Input:
+    -----
+    path: str
+
+    Output:
+    -------
+    (header, start): tuple
+        The header (dict) and the file offset of the data section
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise Exception("Not a checkpoint file: "+path)
+        version, reserved, header_len = struct.unpack("<IIQ", f.read(16))
+        if version > VERSION:
+            raise Exception("Unsupported checkpoint version "+str(version)+" (supported up to "+str(VERSION)+")")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    return header, align(len(MAGIC) + 16 + header_len)
+
+def load(path,mmap_mode = "r"):
+    """
+    Reads a checkpoint.
+
+    Input:
+    -----
+    path: str
+    mmap_mode: str
+        "r": arrays are read only views of a memory map of the file (zero copy, shared between processes)
+        "c": copy on write views of a memory map; arrays can be modified without changing the file
+        None: arrays are read into memory
+        Default = "r"
+
+    Output:
+    -------
+    (header, arrays): tuple
+        The header (dict) and the list of arrays, in the order they were saved
+    """
+    header, start = read_header(path)
+    entries = header["arrays"]
+    size = os.path.getsize(path) - start
+    if mmap_mode is None:
+        data = np.empty(max(size, 0), dtype = np.uint8)
+        with open(path, "rb") as f:
+            f.seek(start)
+            f.readinto(memoryview(data))
+    elif size > 0:
+        data = np.memmap(path, dtype = np.uint8, mode = mmap_mode, offset = start, shape = (size,))
+    else:
+        data = np.zeros(0, dtype = np.uint8)
+
+    arrays = []
+    for entry in entries:
+        dtype = np.dtype(entry["dtype"])
+        nbytes = int(np.prod(entry["shape"])) * dtype.itemsize
+        if entry["offset"] + nbytes > size:
+            raise Exception("Truncated checkpoint file: "+path)
+        arrays.append(data[entry["offset"]:entry["offset"]+nbytes].view(dtype).reshape(entry["shape"]))
+    return header, arrays
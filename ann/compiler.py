@@ -0,0 +1,399 @@
+"""
+Execution plans
+---
+
+Network.compile() turns the chain of layers into an ExecutionPlan, which runs the forward pass and
+backpropagation without going through the layers' compute() and backprop():
+
+- Activation functions and their derivatives are looked up once, when the plan is built.
+- Layers that do nothing on their own are left out: a Flatten layer is only a reshape, and its
+  normalization (and the cast of the input to the compute dtype) is fused into a single ufunc writing
+  straight into the input buffer of the next Dense layer. A linear activation writes nothing.
+- The activations, errors and input buffers of all layers are views of one preallocated arena. Every
+  buffer is only needed for part of a step (its live interval); buffers whose intervals don't overlap
+  share memory. During inference the outputs of alternate layers share memory; during training,
+  backpropagation writes the errors of a layer over its net output and the errors of its input over
+  the previous layer's output, as those are no longer needed.
+
+The arena is sized for the largest batch seen, so a step allocates no arrays (apart from a few (batch, 1)
+temporaries in softmax). The gradients are written into the layers' own gradient arrays (delta_wt,
+delta_bias), so optimizers, data parallel training and checkpoints work as before.
+
+Layers other than Flatten and Dense are run through their own compute() and backprop(). Compiled plans
+support the float32 and float64 precision policies. The inference arena is per thread, so compiled
+networks can be used for inference from several threads at once.
+"""
+
+import threading
+import numpy as np
+from .activations import get_activation
+
+def allocate(requests):
+    """
+    Assigns arena offsets to buffers, so that buffers with overlapping live intervals don't overlap in
+    memory. Buffers are placed in order of their first use, each at the lowest offset where it fits.
+
+    Input:
+    -----
+    requests: list
+        List of (name, nbytes, first, last): the buffer is used from step "first" to step "last", inclusive
+
+    Output:
+    -------
+    (offsets, size): tuple
+        Dict mapping each name to its offset in bytes, and the total size of the arena
+    """
+    placed = []
+    offsets = {}
+    size = 0
+    for name, nbytes, first, last in sorted(requests, key = lambda r: (r[2], -r[1])):
+        #Blocks in use at the same time as this one, in order of offset
+        busy = sorted((off, off + n) for off, n, f, l in placed if f <= last and first <= l)
+        offset = 0
+        for start, stop in busy:
+            if offset + nbytes <= start:
+                break
+            offset = max(offset, align(stop))
+        placed.append((offset, nbytes, first, last))
+        offsets[name] = offset
+        size = max(size, offset + nbytes)
+    return offsets, size
+
+def align(n,alignment = 64):
+    return (n + alignment - 1) // alignment * alignment
+
+class Arena:
+    """
+    One preallocated block of memory holding the buffers of a plan, as (capacity, width) arrays.
+
+    Parameters:
+    -----------
+    capacity: int
+        Largest batch size the buffers have room for
+    buffers: dict
+        Maps buffer names to arrays of shape (capacity, width)
+    """
+
+    def __init__(self,requests,capacity,dtype):
+        """
+        Input:
+        -----
+        requests: list
+            List of (name, width, first, last)
+        capacity: int
+        dtype: numpy.dtype
+        """
+        self.capacity = capacity
+        itemsize = np.dtype(dtype).itemsize
+        offsets, size = allocate([(name, align(capacity * width * itemsize), first, last)
+                                  for name, width, first, last in requests])
+        self.memory = np.empty(max(size, 1), dtype = np.uint8)
+        self.buffers = {}
+        for name, width, first, last in requests:
+            self.buffers[name] = np.ndarray((capacity, width), dtype = dtype, buffer = self.memory, offset = offsets[name])
+        self.nbytes = size
+
+    def get(self,name,n):
+        return self.buffers[name][:n]
+
+class DenseStep:
+    """
+    A Dense layer in the plan, with its activation resolved and, when it follows a Flatten layer, the
+    Flatten's normalization fused into its input.
+    """
+
+    def __init__(self,layer,flatten = None):
+        self.layer = layer
+        self.flatten = flatten
+        self.activation, self.derivative = get_activation(layer.activation)
+        self.linear = layer.activation == "linear"
+        self.width = layer.output_size
+        #Buffer the errors of the input are written into, None if they aren't needed
+        self.bp_target = None
+
+class LayerStep:
+    """
+    Any other layer, run through its own compute() and backprop()
+    """
+
+    def __init__(self,layer,flatten = None):
+        self.layer = layer
+        self.flatten = flatten
+        self.output_shape = None
+
+class ExecutionPlan:
+    """
+    Static execution plan of a network, built by Network.compile().
+
+    Parameters:
+    -----------
+    network: Network
+    steps: list
+        DenseStep and LayerStep objects, in order. Flatten layers are folded into the following step.
+    dtype: numpy.dtype
+        Compute dtype of the buffers
+    """
+
+    def __init__(self,network,batch_size = 256):
+        if network.precision.dtype != network.precision.compute_dtype or network.precision.scaled():
+            raise Exception("compile() doesn't support the "+network.precision.name+" precision policy")
+        self.network = network
+        self.dtype = network.precision.compute_dtype
+        self.batch_size = batch_size
+        self.steps = []
+        flatten = None
+        for layer in network.layers:
+            if type(layer).__name__ == "Flatten":
+                if flatten is not None:
+                    #Only the last of several Flatten layers in a row is folded
+                    self.steps.append(LayerStep(flatten))
+                flatten = layer
+                continue
+            if type(layer).__name__ == "Dense":
+                self.steps.append(DenseStep(layer, flatten))
+            else:
+                self.steps.append(LayerStep(layer, flatten))
+            flatten = None
+        self.trailing_flatten = flatten
+        if not self.steps:
+            raise Exception("compile() needs at least one layer other than Flatten")
+        for i, step in enumerate(self.steps):
+            if isinstance(step, DenseStep) and i > 0 and step.layer.needs_input_grad():
+                prev = self.steps[i - 1]
+                if isinstance(prev, DenseStep) and not prev.linear and step.flatten is None:
+                    step.bp_target = "out"+str(i - 1)
+                else:
+                    step.bp_target = "grad"+str(i - 1)
+        self.train_arena = None
+        self.local = threading.local()
+
+    ################################################################################
+    #
+    # BUFFERS
+    #
+    ################################################################################
+
+    def train_requests(self):
+        """
+        Buffers needed for training and their live intervals. Step i's forward pass is at time i and its
+        backpropagation at time 2*L - i, where L is the number of steps; the loss gradient is computed
+        at time L.
+        """
+        L = len(self.steps)
+        back = lambda i: 2 * L - i
+        requests = []
+        for i, step in enumerate(self.steps):
+            if not isinstance(step, DenseStep):
+                continue
+            if step.flatten is not None or i == 0:
+                #Input of the first Dense layer (or one after a Flatten), cast and normalized. Read again by
+                #backpropagation, for the weight gradient
+                requests.append(("input"+str(i), step.layer.input_size, i, back(i)))
+            #The net output is overwritten by the errors during backpropagation
+            requests.append(("net"+str(i), step.width, i, back(i)))
+            if not step.linear:
+                #The output is read by the next step's backpropagation, then overwritten by its input errors,
+                #which this step's backpropagation reads
+                requests.append(("out"+str(i), step.width, i, back(i)))
+        for j, step in enumerate(self.steps):
+            if isinstance(step, DenseStep) and step.bp_target == "grad"+str(j - 1):
+                #Errors of the input that can't be written over the previous output
+                requests.append((step.bp_target, step.layer.input_size, back(j), back(j - 1)))
+        last = self.steps[-1]
+        if isinstance(last, DenseStep):
+            requests.append(("loss_grad", last.width, L, back(L - 1)))
+        return requests
+
+    def infer_requests(self):
+        """
+        Buffers needed for inference: each step's output is only needed by the next step
+        """
+        requests = []
+        for i, step in enumerate(self.steps):
+            if not isinstance(step, DenseStep):
+                continue
+            if step.flatten is not None or i == 0:
+                requests.append(("input"+str(i), step.layer.input_size, i, i))
+            requests.append(("net"+str(i), step.width, i, i + 1))
+        return requests
+
+    def arena(self,training,n):
+        """
+        Returns the arena for training or inference, reallocating it if it has no room for n samples
+        """
+        if training:
+            arena = self.train_arena
+        else:
+            arena = getattr(self.local, "arena", None)
+        if arena is None or arena.capacity < n:
+            requests = self.train_requests() if training else self.infer_requests()
+            arena = Arena(requests, max(n, self.batch_size), self.dtype)
+            if training:
+                self.train_arena = arena
+            else:
+                self.local.arena = arena
+        return arena
+
+    def nbytes(self):
+        """
+        Size of the training and inference arenas (of the calling thread) in bytes
+        """
+        return {"train": self.train_arena.nbytes if self.train_arena is not None else 0,
+                "infer": self.local.arena.nbytes if getattr(self.local, "arena", None) is not None else 0}
+
+    ################################################################################
+    #
+    # EXECUTION
+    #
+    ################################################################################
+
+    def stage_input(self,i,step,data,arena,n):
+        """
+        Flattens, normalizes and casts the input of a Dense step into its input buffer, in one ufunc
+        """
+        data = data.reshape(n, -1)
+        buf = arena.get("input"+str(i), n)
+        if step.flatten is not None:
+            return np.divide(data, step.flatten.normalize, out = buf, dtype = self.dtype)
+        np.copyto(buf, data, casting = "unsafe")
+        return buf
+
+    def forward(self,x):
+        """
+        Forward pass of a batch, keeping what backpropagation needs in the training arena
+
+        Input:
+        -----
+        x: numpy.ndarray
+            Batch of samples
+
+        Output:
+        -------
+        out: numpy.ndarray
+            Output of the last layer, a view of the arena
+        """
+        n = x.shape[0]
+        arena = self.arena(True, n)
+        self.n = n
+        data = x
+        for i, step in enumerate(self.steps):
+            if isinstance(step, DenseStep):
+                layer = step.layer
+                if step.flatten is not None or i == 0:
+                    data = self.stage_input(i, step, data, arena, n)
+                step.data = data
+                net = np.dot(data, layer.weight, out = arena.get("net"+str(i), n))
+                net += layer.bias
+                if step.linear:
+                    data = net
+                else:
+                    data = step.activation(net, out = arena.get("out"+str(i), n))
+            else:
+                if step.flatten is not None:
+                    data = np.divide(data, step.flatten.normalize, dtype = self.dtype).reshape(n, -1)
+                step.layer.data = data
+                data = step.layer.compute()
+                step.output_shape = data.shape
+        if self.trailing_flatten is not None:
+            data = np.divide(data, self.trailing_flatten.normalize, dtype = self.dtype).reshape(n, -1)
+        return data
+
+    def loss_grad(self,out,true):
+        """
+        Gradient of softmax and cross entropy (out - true), in the arena
+        """
+        if not isinstance(self.steps[-1], DenseStep):
+            return out - true
+        return np.subtract(out, true, out = self.train_arena.get("loss_grad", self.n))
+
+    def backward(self,bp_data):
+        """
+        Backpropagation of the batch of the last forward(), leaving the gradients in the layers
+
+        Input:
+        -----
+        bp_data: numpy.ndarray
+            Gradient of the loss with respect to the output of the last layer
+        """
+        n = self.n
+        arena = self.train_arena
+        if self.trailing_flatten is not None:
+            bp_data = bp_data / self.trailing_flatten.normalize
+        for i in range(len(self.steps) - 1, -1, -1):
+            step = self.steps[i]
+            if not isinstance(step, DenseStep):
+                bp_data = step.layer.backprop(bp_data.reshape(step.output_shape))
+                if bp_data is None:
+                    return
+                if step.flatten is not None:
+                    bp_data = bp_data / step.flatten.normalize
+                continue
+            layer = step.layer
+
+            #Errors of the net output, written over the net output
+            delta = arena.get("net"+str(i), n)
+            step.derivative(delta, out = delta)
+            delta *= bp_data
+
+            #Gradients of the weights and bias, in the layer's own gradient arrays
+            delta_wt = np.dot(step.data.T, delta, out = layer.buffer("delta_wt", layer.weight.shape, self.dtype))
+            delta_wt /= n
+            delta_bias = np.sum(delta, axis = 0, keepdims = True, out = layer.buffer("delta_bias", layer.bias.shape, self.dtype))
+            delta_bias /= n
+
+            #Errors of the input: over the previous step's output when it is a compiled Dense step (which
+            #backpropagation doesn't need anymore), else into a buffer of their own
+            if step.bp_target is None:
+                return
+            bp_data = np.dot(delta, layer.weight.T, out = arena.get(step.bp_target, n))
+            if step.flatten is not None:
+                bp_data /= step.flatten.normalize
+
+    def forward_backward(self,x,ohe_labels):
+        """
+        Same as Network.forward_backward(), using the plan
+        """
+        network = self.network
+        out = self.forward(x)
+        network.out = out
+        last = self.steps[-1]
+        logits = None
+        if isinstance(last, DenseStep) and last.layer.activation == "softmax":
+            logits = self.train_arena.get("net"+str(len(self.steps) - 1), self.n)
+        error = network.lossfunction(ohe_labels, out, logits)
+        self.backward(self.loss_grad(out, ohe_labels))
+        return error
+
+    def infer(self,x):
+        """
+        Forward pass for inference, in the calling thread's inference arena. Activations are applied in
+        place.
+
+        Input:
+        -----
+        x: numpy.ndarray
+            Batch of samples
+
+        Output:
+        -------
+        out: numpy.ndarray
+            Output of the last layer, a view of the arena valid until the next call
+        """
+        n = x.shape[0]
+        arena = self.arena(False, n)
+        data = x
+        for i, step in enumerate(self.steps):
+            if isinstance(step, DenseStep):
+                layer = step.layer
+                if step.flatten is not None or i == 0:
+                    data = self.stage_input(i, step, data, arena, n)
+                net = np.dot(data, layer.weight, out = arena.get("net"+str(i), n))
+                net += layer.bias
+                data = net if step.linear else step.activation(net, out = net)
+            else:
+                if step.flatten is not None:
+                    data = step.flatten.infer(data)
+                data = step.layer.infer(data)
+        if self.trailing_flatten is not None:
+            data = self.trailing_flatten.infer(data)
+        return data
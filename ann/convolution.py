@@ -0,0 +1,544 @@
+"""
+Convolutional layers
+---
+
+Conv2D, MaxPool2D and AvgPool2D layers for NCHW batches (batch, channels, rows, cols), Eg. the MNIST
+images as loaded by mnist.load_mnist(). They follow the same protocol as Dense: compute(), infer(),
+backprop(), update_wt() and params().
+
+No Python loop runs over the samples or the pixels. np.lib.stride_tricks.sliding_window_view gives a zero
+copy view of all windows of the input, which a convolution turns into one matrix (im2col) and multiplies
+with its weights in a single GEMM. Pooling reduces the same views. During backpropagation the errors are
+carried back to the input with one vectorized addition per position inside the window (Eg. 9 for a 3x3
+kernel).
+
+```
+nw.add(Conv2D(1, 8, 3, padding = 1, activation = "relu", normalize = 255, input_shape = (1, 28, 28)))
+nw.add(MaxPool2D(2))
+nw.add(Conv2D(8, 16, 3, padding = 1, activation = "relu"))
+nw.add(MaxPool2D(2))
+nw.add(Flatten())
+nw.add(Dense(16*7*7, 10, activation = "softmax"))
+```
+
+The shape of every layer's output is known once the first layer has an input_shape (See describe()).
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .activations import get_activation
+from .layers import SuperLayer, LAYER_TYPES
+
+def pair(value):
+    """
+    (value, value) for an int, else the value as a tuple
+    """
+    return (value, value) if isinstance(value, int) else tuple(value)
+
+def windows(data,kernel,stride):
+    """
+    Zero copy view of all windows of a NCHW batch.
+
+    Input:
+    -----
+    data: numpy.ndarray
+        (batch, channels, rows, cols)
+    kernel: tuple
+        (rows, cols) of a window
+    stride: tuple
+        (rows, cols) steps between two windows
+
+    Output:
+    -------
+    windows: numpy.ndarray
+        (batch, channels, out_rows, out_cols, kernel rows, kernel cols)
+    """
+    view = sliding_window_view(data, kernel, axis = (2, 3))
+    return view[:, :, ::stride[0], ::stride[1]]
+
+def scatter_windows(grad,window_grads,kernel,stride,out_shape):
+    """
+    Adds the gradients of all windows back to the positions of the input they were taken from: the
+    reverse of windows(). One vectorized addition per position in the window.
+
+    Input:
+    -----
+    grad: numpy.ndarray
+        (batch, channels, rows, cols) zeroed array receiving the gradients
+    window_grads: numpy.ndarray
+        (batch, channels, out_rows, out_cols, kernel rows, kernel cols)
+    kernel: tuple
+    stride: tuple
+    out_shape: tuple
+        (out_rows, out_cols)
+    """
+    rows = stride[0] * (out_shape[0] - 1) + 1
+    cols = stride[1] * (out_shape[1] - 1) + 1
+    for i in range(kernel[0]):
+        for j in range(kernel[1]):
+            grad[:, :, i:i+rows:stride[0], j:j+cols:stride[1]] += window_grads[:, :, :, :, i, j]
+
+class Conv2D(SuperLayer):
+    """
+    Class used to represent a 2D convolution layer
+
+    Parameters:
+    -----------
+    name: str
+        Used for identification and displaying layer information. Default = "Conv2D"
+    in_channels: int
+        Number of channels of the input
+    out_channels: int
+        Number of filters, i.e. channels of the output
+    kernel_size: int or tuple
+        Size of the filters, (rows, cols)
+    stride: int or tuple
+        Step between two windows. Default = 1
+    padding: int or tuple
+        Number of zero rows and cols added on both sides of the input. Default = 0
+    lr: double
+        Learning rate for the layer. Default = 0.01
+    activation: str
+        Specifies the activation function for the layer. Default = "linear"
+    normalize: int
+        The input is divided by it, as in Flatten. Only useful for the first layer. Default = 1
+    input_shape: tuple
+        (channels, rows, cols) of one sample. Optional for the first layer, set by Network.add() for the
+        others, and updated from the data. Used for the output shape and the MACs. Default = None
+    output_shape: tuple
+        (channels, rows, cols) of the output of one sample, once input_shape is known
+    weight: numpy.ndarray
+        Filters as one matrix of shape (in_channels * kernel rows * kernel cols, out_channels): row
+        (c * kernel rows + i) * kernel cols + j holds the weights of input channel c at position (i, j).
+        Initialized like Dense.
+    bias: numpy.ndarray
+        (1, out_channels)
+    data: numpy.ndarray
+        Holds the input batch
+    cols: numpy.ndarray
+        The windows of the last input batch as one matrix (im2col), kept for backpropagation
+    net: numpy.ndarray
+        Net output, (batch * out rows * out cols, out_channels)
+    output: numpy.ndarray
+        (batch, out_channels, out rows, out cols), a view of the activation of net
+    delta_wt, delta_bias: numpy.ndarray
+        Gradients of the weight and bias, averaged over the batch
+    dtype, compute_dtype: numpy.dtype
+        Set by the Network's precision policy, as for Dense
+    param_names, grad_names: tuple
+        ("weight", "bias") and ("delta_wt", "delta_bias")
+    """
+    param_names = ("weight", "bias")
+    grad_names = ("delta_wt", "delta_bias")
+
+    def __init__(self,in_channels,out_channels,kernel_size,stride = 1,padding = 0,lr = 0.01,activation = 'linear',
+                 name = "Conv2D",normalize = 1,input_shape = None):
+        self.name = name
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = pair(kernel_size)
+        self.stride = pair(stride)
+        self.padding = pair(padding)
+        self.lr = lr
+        self.activation = activation
+        self.normalize = normalize
+        self.dtype = np.dtype(np.float32)
+        self.compute_dtype = np.dtype(np.float32)
+        fan_in = in_channels * self.kernel_size[0] * self.kernel_size[1]
+        self.weight = np.random.uniform(-0.25,0.25,size = (fan_in,out_channels)).astype(self.dtype)
+        self.bias = np.random.uniform(-0.25,0.25,size = (1,out_channels)).astype(self.dtype)
+        self.input_shape = None
+        self.output_shape = None
+        if input_shape is not None:
+            self.build(input_shape)
+        self.data = None
+        self.cols = None
+        self.net = None
+        self.output = None
+        self.prev = None
+        self.next = None
+        self.delta_wt = None
+        self.delta_bias = None
+        self.delta = None
+        self.mask = None
+
+    def build(self,input_shape):
+        """
+        Sets the shape of the input of one sample, (channels, rows, cols), and computes the output shape
+        """
+        if input_shape[0] != self.in_channels:
+            raise Exception(self.name+" expects "+str(self.in_channels)+" input channels, got "+str(input_shape[0]))
+        self.input_shape = tuple(input_shape)
+        rows = (input_shape[1] + 2 * self.padding[0] - self.kernel_size[0]) // self.stride[0] + 1
+        cols = (input_shape[2] + 2 * self.padding[1] - self.kernel_size[1]) // self.stride[1] + 1
+        self.output_shape = (self.out_channels, rows, cols)
+
+    def set_precision(self,precision):
+        """
+        Applies the Network's precision policy to the layer, as Dense.set_precision()
+        """
+        self.dtype = precision.dtype
+        self.compute_dtype = precision.compute_dtype
+        self.weight = self.weight.astype(self.dtype)
+        self.bias = self.bias.astype(self.dtype)
+        if self.mask is not None:
+            self.mask = self.mask.astype(self.dtype)
+        self.delta_wt = None
+        self.delta_bias = None
+        self.delta = None
+
+    def im2col(self,data):
+        """
+        Normalizes and pads a batch and arranges all its windows as the rows of one matrix.
+
+        Input:
+        ------
+        data: numpy.ndarray
+            (batch, in_channels, rows, cols)
+
+        Output:
+        ------
+        cols: numpy.ndarray
+            (batch * out rows * out cols, in_channels * kernel rows * kernel cols)
+        """
+        if data.shape[1:] != self.input_shape:
+            self.build(data.shape[1:])
+        cd = self.compute_dtype
+        if self.normalize != 1:
+            data = np.divide(data, self.normalize, dtype = cd)
+        ph, pw = self.padding
+        if ph or pw:
+            data = np.pad(data, ((0, 0), (0, 0), (ph, ph), (pw, pw)))
+        view = windows(data, self.kernel_size, self.stride)
+        #(batch, out rows, out cols, channels, kernel rows, kernel cols): the copy into one matrix
+        n = data.shape[0]
+        return view.transpose(0, 2, 3, 1, 4, 5).astype(cd).reshape(n * self.output_shape[1] * self.output_shape[2], -1)
+
+    def to_nchw(self,net,n):
+        """
+        View of a (batch * out rows * out cols, out_channels) matrix as a NCHW batch
+        """
+        return net.reshape(n, self.output_shape[1], self.output_shape[2], self.out_channels).transpose(0, 3, 1, 2)
+
+    def compute(self):
+        """
+        Convolves the input batch with the filters (one GEMM over all windows), adds the bias and applies
+        the activation function.
+
+        Output:
+        ------
+        self.output: numpy.ndarray
+            (batch, out_channels, out rows, out cols)
+        """
+        n = self.data.shape[0]
+        cd = self.compute_dtype
+        self.cols = self.im2col(self.data)
+        net = np.dot(self.cols, self.weight.astype(cd, copy = False))
+        net += self.bias
+        activation = get_activation(self.activation)[0]
+        output = activation(net)
+        if self.next is not None:
+            output = output.astype(self.dtype, copy = False)
+            net = net.astype(self.dtype, copy = False)
+        self.net = net
+        self.output = self.to_nchw(output, n)
+        return self.output
+
+    def infer(self,data,out = None):
+        """
+        Same as compute(), but used for inference only: doesn't store the training state.
+
+        Input:
+        ------
+        data: numpy.ndarray
+            (batch, in_channels, rows, cols)
+        out: numpy.ndarray
+            Optional buffer returned by an earlier call with at least as many samples, reused.
+
+        Output:
+        ------
+        out: numpy.ndarray
+        """
+        n = data.shape[0]
+        cd = self.compute_dtype
+        cols = self.im2col(data)
+        #The buffer is a NCHW view of a (rows, out_channels) matrix; the matrix is its base
+        net = None
+        if out is not None and out.base is not None and out.base.shape[1:] == (self.out_channels,) and out.base.shape[0] >= cols.shape[0]:
+            net = out.base[:cols.shape[0]]
+        net = np.dot(cols, self.weight.astype(cd, copy = False), out = net)
+        net += self.bias
+        activation = get_activation(self.activation)[0]
+        return self.to_nchw(activation(net, out = net), n)
+
+    def backprop(self,bp_data):
+        """
+        Backpropagation through the convolution: computes the gradients of the filters and bias, averaged
+        over the batch, and returns the errors of the input.
+
+        Input:
+        -----
+        bp_data: numpy.ndarray
+            Errors of the output, (batch, out_channels, out rows, out cols) or flattened to (batch, -1)
+
+        Output:
+        -------
+        bp_data: numpy.ndarray
+            Errors of the input, (batch, in_channels, rows, cols). None if no preceeding layer has weights.
+        """
+        n = bp_data.shape[0]
+        cd = self.compute_dtype
+        out_rows, out_cols = self.output_shape[1], self.output_shape[2]
+        bp_data = bp_data.reshape((n,) + self.output_shape)
+
+        #Errors of the net output, in the (batch * out rows * out cols, out_channels) layout of net
+        derivative = get_activation(self.activation)[1]
+        delta = derivative(self.net, out = self.buffer("delta", self.net.shape, cd))
+        delta.reshape(n, out_rows, out_cols, self.out_channels)[...] *= bp_data.transpose(0, 2, 3, 1)
+
+        delta_wt = np.dot(self.cols.T, delta, out = self.buffer("delta_wt", self.weight.shape, cd))
+        delta_wt /= n
+        delta_bias = np.sum(delta, axis = 0, keepdims = True, out = self.buffer("delta_bias", self.bias.shape, cd))
+        delta_bias /= n
+
+        if not self.needs_input_grad():
+            return None
+        #Errors of every window, added back to the (padded) input positions they came from
+        kh, kw = self.kernel_size
+        window_grads = np.dot(delta, self.weight.T.astype(cd, copy = False))
+        window_grads = window_grads.reshape(n, out_rows, out_cols, self.in_channels, kh, kw).transpose(0, 3, 1, 2, 4, 5)
+        ph, pw = self.padding
+        rows, cols = self.input_shape[1], self.input_shape[2]
+        grad = np.zeros((n, self.in_channels, rows + 2 * ph, cols + 2 * pw), dtype = cd)
+        scatter_windows(grad, window_grads, self.kernel_size, self.stride, (out_rows, out_cols))
+        grad = grad[:, :, ph:ph+rows, pw:pw+cols]
+        if self.normalize != 1:
+            grad /= self.normalize
+        return grad.astype(self.dtype, copy = False)
+
+    def update_wt(self):
+        """
+        Updates the filters and bias with plain gradient descent, as Dense.update_wt()
+        """
+        self.weight -= np.multiply(self.delta_wt, self.lr)
+        self.bias -= np.multiply(self.delta_bias, self.lr)
+        self.apply_mask()
+
+    def apply_mask(self):
+        """
+        Sets the pruned weights back to 0, if the layer was pruned
+        """
+        if self.mask is not None:
+            np.multiply(self.weight, self.mask, out = self.weight)
+
+    def params(self):
+        """
+        Returns the parameters of the layer together with their gradients, for use by an optimizer.
+        """
+        return [(getattr(self, p), getattr(self, g)) for p, g in zip(self.param_names, self.grad_names)]
+
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"in_channels": self.in_channels, "out_channels": self.out_channels,
+                "kernel_size": list(self.kernel_size), "stride": list(self.stride), "padding": list(self.padding),
+                "lr": self.lr, "activation": self.activation, "name": self.name, "normalize": self.normalize,
+                "input_shape": list(self.input_shape) if self.input_shape is not None else None}
+
+    def macs(self):
+        """
+        Multiply-accumulates of the forward pass of one sample, None until the input shape is known
+        """
+        if self.output_shape is None:
+            return None
+        return self.output_shape[1] * self.output_shape[2] * self.weight.size
+
+    def flops(self,phase):
+        """
+        Number of floating point operations of the last call of a phase, used by the profiler.
+
+        Input:
+        -----
+        phase: str
+            "forward", "backward" or "update"
+
+        Output:
+        -------
+        flops: int
+        """
+        n = self.data.shape[0] if self.data is not None else 0
+        macs = self.macs() or 0
+        outputs = int(np.prod(self.output_shape)) if self.output_shape is not None else 0
+        if phase == "forward":
+            return 2 * n * macs + 2 * n * outputs
+        if phase == "backward":
+            flops = 2 * n * outputs + 2 * n * macs
+            if self.needs_input_grad():
+                flops += 2 * n * macs
+            return flops
+        return 2 * (self.weight.size + self.bias.size)
+
+class Pool2D(SuperLayer):
+    """
+    Base class of the pooling layers: reduces every window of every channel to one value. Subclasses
+    implement reduce() and window_grads().
+
+    Parameters:
+    -----------
+    name: str
+        Used for identification and displaying layer information.
+    pool_size: int or tuple
+        Size of the windows, (rows, cols). Default = 2
+    stride: int or tuple
+        Step between two windows. Default = None (pool_size, i.e. windows don't overlap)
+    input_shape: tuple
+        (channels, rows, cols) of one sample. Set by Network.add() when the layer before knows its output
+        shape, and updated from the data. Default = None
+    output_shape: tuple
+        (channels, rows, cols) of the output of one sample, once input_shape is known
+    data: numpy.ndarray
+        Holds the input batch
+    output: numpy.ndarray
+        (batch, channels, out rows, out cols)
+    dtype: numpy.dtype
+        Set by the Network's precision policy
+    param_names, grad_names: tuple
+        Pooling layers have no parameters
+    """
+    param_names = ()
+    grad_names = ()
+
+    def __init__(self,pool_size = 2,stride = None,name = "Pool2D",input_shape = None):
+        self.name = name
+        self.pool_size = pair(pool_size)
+        self.stride = pair(stride) if stride is not None else self.pool_size
+        self.dtype = np.dtype(np.float32)
+        self.input_shape = None
+        self.output_shape = None
+        if input_shape is not None:
+            self.build(input_shape)
+        self.data = None
+        self.output = None
+        self.prev = None
+        self.next = None
+
+    def build(self,input_shape):
+        """
+        Sets the shape of the input of one sample, (channels, rows, cols), and computes the output shape
+        """
+        self.input_shape = tuple(input_shape)
+        rows = (input_shape[1] - self.pool_size[0]) // self.stride[0] + 1
+        cols = (input_shape[2] - self.pool_size[1]) // self.stride[1] + 1
+        self.output_shape = (input_shape[0], rows, cols)
+
+    def set_precision(self,precision):
+        self.dtype = precision.dtype
+
+    def windows(self,data):
+        if data.shape[1:] != self.input_shape:
+            self.build(data.shape[1:])
+        return windows(data, self.pool_size, self.stride)
+
+    def compute(self):
+        """
+        Pools the input batch.
+
+        Output:
+        ------
+        self.output: numpy.ndarray
+            (batch, channels, out rows, out cols)
+        """
+        self.output = self.reduce(self.windows(self.data))
+        return self.output
+
+    def infer(self,data,out = None):
+        """
+        Same as compute(), but used for inference only.
+        """
+        view = self.windows(data)
+        return self.reduce(view, out if out is not None and out.shape == view.shape[:4] else None)
+
+    def backprop(self,bp_data):
+        """
+        Carries the errors of the output back to the inputs of each window.
+
+        Input:
+        -----
+        bp_data: numpy.ndarray
+            Errors of the output, (batch, channels, out rows, out cols) or flattened to (batch, -1)
+
+        Output:
+        -------
+        bp_data: numpy.ndarray
+            Errors of the input, (batch, channels, rows, cols). None if no preceeding layer has weights.
+        """
+        if not self.needs_input_grad():
+            return None
+        n = bp_data.shape[0]
+        bp_data = bp_data.reshape((n,) + self.output_shape)
+        grad = np.zeros((n,) + self.input_shape, dtype = bp_data.dtype)
+        window_grads = self.window_grads(self.windows(self.data), bp_data)
+        scatter_windows(grad, window_grads, self.pool_size, self.stride, self.output_shape[1:])
+        return grad
+
+    def update_wt(self):
+        """
+        Pooling layers have no parameters. Written to maintain uniformity between classes
+        """
+        pass
+
+    def params(self):
+        return []
+
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"pool_size": list(self.pool_size), "stride": list(self.stride), "name": self.name,
+                "input_shape": list(self.input_shape) if self.input_shape is not None else None}
+
+    def macs(self):
+        """
+        Pooling doesn't multiply, the comparisons or additions are not counted
+        """
+        return 0
+
+    def flops(self,phase):
+        if phase == "update" or self.data is None or self.output_shape is None:
+            return 0
+        return self.data.shape[0] * int(np.prod(self.output_shape)) * self.pool_size[0] * self.pool_size[1]
+
+class MaxPool2D(Pool2D):
+    """
+    Max pooling: every window is reduced to its largest value. The errors go to the position of the
+    largest value of each window (to all of them, if several are equal).
+    """
+
+    def __init__(self,pool_size = 2,stride = None,name = "MaxPool2D",input_shape = None):
+        super().__init__(pool_size, stride, name, input_shape)
+
+    def reduce(self,view,out = None):
+        return np.max(view, axis = (4, 5), out = out)
+
+    def window_grads(self,view,bp_data):
+        mask = view == self.output[:, :, :, :, None, None]
+        return mask * bp_data[:, :, :, :, None, None]
+
+class AvgPool2D(Pool2D):
+    """
+    Average pooling: every window is reduced to its mean. The errors are shared equally by the inputs of
+    each window.
+    """
+
+    def __init__(self,pool_size = 2,stride = None,name = "AvgPool2D",input_shape = None):
+        super().__init__(pool_size, stride, name, input_shape)
+
+    def reduce(self,view,out = None):
+        return np.mean(view, axis = (4, 5), out = out, dtype = self.dtype)
+
+    def window_grads(self,view,bp_data):
+        size = self.pool_size[0] * self.pool_size[1]
+        return np.broadcast_to((bp_data / size)[:, :, :, :, None, None], view.shape)
+
+LAYER_TYPES.update({"Conv2D": Conv2D, "MaxPool2D": MaxPool2D, "AvgPool2D": AvgPool2D})
@@ -0,0 +1,177 @@
+"""
+Validation during training
+---
+
+Network.fit uses an Evaluator to compute the validation accuracy after each epoch. The validation set is
+passed through the network in large batches (See Network.evaluate()), and to keep validation from
+dominating short epochs it can be:
+
+- run only every "freq" epochs,
+- run on a fixed random subsample of the validation set,
+- run in the background, on a snapshot of the weights, while the next epoch trains. With "thread" the
+  evaluation runs in a thread of the training process (numpy releases the GIL during the matrix
+  multiplications); with "process" it runs in a forked process, which doesn't compete for the GIL at all.
+
+```
+nw.fit(x = train_data, y = train_labels, epochs = 10, validation_split = 0.1, batch_size = 64,
+       validation_freq = 2, validation_subsample = 2000, validation_mode = "thread")
+```
+
+Results of background evaluations are collected after each epoch, and all pending ones at the end of fit.
+The "process" mode needs the "fork" start method (Eg. Linux).
+"""
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+class Evaluator:
+    """
+    Computes the validation accuracy of a network, in the foreground or in the background.
+
+    Parameters:
+    -----------
+    network: Network
+    x: numpy.ndarray
+        Validation data
+    y: numpy.ndarray
+        Validation classes
+    batch_size: int
+        Number of samples passed through the network at once. Default = 1024
+    freq: int
+        Evaluate every "freq" epochs. Default = 1
+    subsample: int or double
+        If given, evaluate on a fixed random subset of the validation set: the number of samples (int) or
+        the fraction of the validation set (double). Default = None (whole validation set)
+    mode: str
+        None: evaluate in the training thread, before the next epoch starts
+        "thread": evaluate a snapshot of the network in a background thread
+        "process": evaluate a snapshot of the network in a forked process
+        Default = None
+    seed: int
+        Seed of the subsample. Default = 0
+    """
+
+    def __init__(self,network,x,y,batch_size = 1024,freq = 1,subsample = None,mode = None,seed = 0):
+        if mode not in (None, "thread", "process"):
+            raise Exception("Unsupported validation mode: "+str(mode))
+        if subsample is not None:
+            size = int(subsample * x.shape[0]) if isinstance(subsample, float) else int(subsample)
+            if size < x.shape[0]:
+                #Sorted, so the subsample is read from the validation set in order
+                idx = np.sort(np.random.RandomState(seed).choice(x.shape[0], size, replace = False))
+                x = x[idx]
+                y = y[idx]
+        self.network = network
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.freq = freq
+        self.mode = mode
+        self.pending = []
+        self.executor = ThreadPoolExecutor(max_workers = 1) if mode == "thread" else None
+
+    def due(self,epoch):
+        """
+        Checks if the network is evaluated after epoch "epoch" (counting from 0)
+        """
+        return (epoch + 1) % self.freq == 0
+
+    def submit(self,epoch):
+        """
+        Evaluates the network as it is after epoch "epoch", if due. In the background modes this only
+        takes a snapshot of the weights and starts the evaluation.
+
+        Input:
+        -----
+        epoch: int
+        """
+        if not self.due(epoch):
+            return
+        if self.mode is None:
+            self.pending.append((epoch, Done(self.network.evaluate(self.x, self.y, self.batch_size))))
+        elif self.mode == "thread":
+            snapshot = self.network.snapshot()
+            self.pending.append((epoch, self.executor.submit(snapshot.evaluate, self.x, self.y, self.batch_size)))
+        else:
+            self.pending.append((epoch, ForkedCall(self.network.snapshot().evaluate, self.x, self.y, self.batch_size)))
+
+    def collect(self,wait = False):
+        """
+        Returns the results of the evaluations that have finished, in the order they were submitted.
+
+        Input:
+        -----
+        wait: bool
+            Wait for all pending evaluations. Default = False
+
+        Output:
+        -------
+        results: list
+            List of (epoch, accuracy)
+        """
+        results = []
+        while self.pending and (wait or self.pending[0][1].done()):
+            epoch, call = self.pending.pop(0)
+            results.append((epoch, call.result()))
+        return results
+
+    def close(self):
+        """
+        Waits for the background evaluations that haven't been collected, discards their results and
+        stops the background thread.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait = True)
+        for epoch, call in self.pending:
+            call.result()
+        self.pending = []
+
+class Done:
+    """
+    Result of an evaluation that ran in the foreground
+    """
+
+    def __init__(self,value):
+        self.value = value
+
+    def done(self):
+        return True
+
+    def result(self):
+        return self.value
+
+class ForkedCall:
+    """
+    Runs fn(*args) in a forked process. The process inherits everything it needs through the fork,
+    and only sends back the result.
+    """
+
+    def __init__(self,fn,*args):
+        context = multiprocessing.get_context("fork")
+        self.conn, child_conn = context.Pipe(duplex = False)
+        self.process = context.Process(target = self.run, args = (child_conn, fn, args), daemon = True)
+        self.process.start()
+        child_conn.close()
+        self.value = None
+
+    @staticmethod
+    def run(conn,fn,args):
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            conn.send((False, repr(e)))
+        conn.close()
+
+    def done(self):
+        return self.process is None or self.conn.poll()
+
+    def result(self):
+        if self.process is not None:
+            ok, self.value = self.conn.recv()
+            self.conn.close()
+            self.process.join()
+            self.process = None
+            if not ok:
+                raise Exception("Validation process failed: "+self.value)
+        return self.value
@@ -0,0 +1,889 @@
+"""
+Layers
+---
+
+Flatten and Dense layers, and the inference only SparseDense and QuantizedDense layers. A layer gets
+its input in "data", computes its output with compute(), and during training gets the gradient of the
+loss with respect to its output in backprop(), which leaves the gradients of its parameters in the layer
+and returns the gradient with respect to its input.
+"""
+
+import numpy as np
+from .activations import relu, relu_der, softmax, softmax_der, linear, linear_der, get_activation
+from .sparse import CSRMatrix, break_even_density
+
+################################################################################
+#
+# LAYERS
+#
+################################################################################
+
+class SuperLayer:
+    """
+    class SuperLayer
+    ----------------
+    
+    Includes activation functions and derivative functions that will be used by 
+    all types of layers (Eg. Dense). The functions themselves live in the ACTIVATIONS
+    registry; new ones can be added with register_activation() and this class will be
+    extended by all the other layer classes. Also holds the helpers shared by the layers
+    that backpropagate (needs_input_grad(), buffer()).
+    """
+    relu = staticmethod(relu)
+    relu_der = staticmethod(relu_der)
+    softmax = staticmethod(softmax)
+    softmax_der = staticmethod(softmax_der)
+    linear = staticmethod(linear)
+    linear_der = staticmethod(linear_der)
+
+    def needs_input_grad(self):
+        """
+        Checks if any of the preceeding layers has weights, and so needs the errors of this layer's input
+        during backpropagation.
+        
+        Output:
+        -------
+        _: bool
+        """
+        layer = self.prev
+        while layer is not None:
+            if hasattr(layer, "weight"):
+                return True
+            layer = layer.prev
+        return False
+
+    def buffer(self,name,shape,dtype):
+        """
+        Returns the buffer stored in attribute "name", reallocating it only if it is too small or has a different
+        shape or dtype. Buffers whose first dimension is the batch size are allocated for the largest batch seen 
+        and a view of the first shape[0] rows is returned, so a smaller last batch doesn't cause a reallocation.
+        
+        Input:
+        -----
+        name: str
+            Name of the attribute holding the buffer
+        shape: tuple
+            Required shape
+        dtype: numpy.dtype
+            Required dtype
+        
+        Output:
+        -------
+        buffer: numpy.ndarray
+        """
+        buf = getattr(self, name)
+        if buf is None or buf.shape[0] < shape[0] or buf.shape[1:] != tuple(shape[1:]) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype = dtype)
+            setattr(self, name, buf)
+        return buf[:shape[0]]
+
+class Flatten:
+    """
+    Class used to represent a flat input
+    
+    Parameters:
+    -----------
+        name: str
+            Used for identification and displaying layer information
+        normalize: int
+            Used for normalizing the input. Default = 1 (No normalization)
+        data: numpy.ndarray 
+            Holds the 2D array to be flattened
+        prev: Flatten or Dense 
+            Specifies the layer before this layer
+        next: Flatten or Dense
+            Specifies the layer after this layer
+        dtype: numpy.dtype
+            Type of the flattened output. Set by the Network's precision policy. Default = float32
+        param_names: tuple
+            Names of the attributes holding parameters. Flatten has none
+        grad_names: tuple
+            Names of the attributes holding the gradients of the parameters. Flatten has none
+    """
+    param_names = ()
+    grad_names = ()
+    
+    def __init__(self,name = "Flatten",normalize = 1):
+        self.name = name
+        self.normalize = normalize
+        self.data = None
+        self.prev = None
+        self.next = None
+        self.dtype = np.dtype(np.float32)
+    
+    def set_precision(self,precision):
+        """
+        Applies the Network's precision policy to the layer
+        
+        Input:
+        -----
+        precision: Precision
+        """
+        self.dtype = precision.dtype
+    
+    def compute(self):
+        """
+        Normalizes and converts a 2D array to a 1D array. A batch of samples of shape
+        (batch, channels, rows, cols) is converted to a (batch, channels*rows*cols) array,
+        a single sample of shape (1, rows, cols) to a (1, rows*cols) array.
+        The data is cast to the layer's dtype here, one batch at a time, so integer data (Eg. uint8 
+        pixels memory mapped from the dataset) never has to be converted as a whole.
+        
+        Input:
+        -----
+        data: numpy.matrix
+        
+        Output:
+        ------
+        _: numpy.ndarray     
+        """
+        return np.divide(self.data, self.normalize, dtype = self.dtype).reshape(self.data.shape[0],-1)
+    
+    def infer(self,data,out = None):
+        """
+        Same as compute(), but used for inference only. Takes the data as a parameter instead of 
+        reading self.data, doesn't store anything on the layer and can write the result into a 
+        preallocated buffer.
+        
+        Input:
+        -----
+        data: numpy.ndarray
+            Batch of samples of shape (batch, channels, rows, cols)
+        out: numpy.ndarray
+            Optional buffer of shape (batch, channels*rows*cols) to write the result into.
+        
+        Output:
+        ------
+        out: numpy.ndarray
+        """
+        return np.divide(data.reshape(data.shape[0],-1), self.normalize, out = out, dtype = self.dtype)
+    
+    def backprop(self,bp_data):
+        """
+        Carries the errors back to the shape of the input, Eg. for a Conv2D or pooling layer before
+        this one, divided by normalize like the input was. None (no layer before needs them) is passed on.
+        """
+        if bp_data is None:
+            return None
+        bp_data = bp_data.reshape(self.data.shape)
+        if self.normalize != 1:
+            bp_data = bp_data / self.normalize
+        return bp_data
+    
+    def update_wt(self):
+        """
+        Doesnt have any use in Flatten. Written to maintain uniformity between classes
+        """
+        pass
+    
+    def params(self):
+        """
+        Flatten has no parameters. Written to maintain uniformity between classes
+        """
+        return []
+    
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"name": self.name, "normalize": self.normalize}
+    
+    def flops(self,phase):
+        """
+        Number of floating point operations of the last call of a phase, used by the profiler. 
+        Only the forward pass does any work: one division per element.
+        
+        Input:
+        -----
+        phase: str
+            "forward", "backward" or "update"
+        
+        Output:
+        -------
+        flops: int
+        """
+        if phase == "forward" and self.data is not None:
+            return self.data.size
+        return 0
+
+class Dense(SuperLayer):
+    """
+    Class used to represent a fully connected layer
+    
+    Parameters:
+    -----------
+    name: str
+        Used for identification and displaying layer information.
+    input_size: int
+        Size of the input data. Used to initialize weight matrix.
+    output_size: int
+        Size of the output data. Used to initialize weight matrix and bias.
+    weight: numpy.matrix
+        Weights initialzed to random numbers between -0.25, 0.25.
+    bias: numpy.ndarray
+        Bias values initialized to random numbers between -0.25, 0.25.
+    data: numpy.ndarray 
+        Holds the data to work upon.
+    net: numpy.ndarray 
+        Holds the net output produced by multiplying data and weights.
+    activation: str
+        Specifies the activation function for the layer. Default = "linear"
+    output: numpy.ndarray 
+        Holds the output produced after applying the activation function.
+    prev: Flatten or Dense 
+        Specifies the layer before this layer.
+    next: Flatten or Dense
+        Specifies the layer after this layer.
+    lr: double
+        Learning rate for the layer. Default = 0.01. 
+    delta_wt: numpy.ndarray
+        This is used while back propagation to update weights of the layer. Automatically calculated during backpropagation.
+    delta_bias: numpy.ndarray
+        This is used while back propagation to update the bias of the layer. Automatically calculated during backpropagation.
+    delta: numpy.ndarray
+        Buffer holding the errors of this layer's net output (bp_data masked by the activation's derivative).
+        Reused between batches.
+    delta_in: numpy.ndarray
+        Buffer holding the errors of this layer's input, which are passed on to the preceeding layer. Reused between batches.
+    dtype: numpy.dtype
+        Type that the weights, bias and outputs are stored in. Set by the Network's precision policy. Default = float32
+    compute_dtype: numpy.dtype
+        Type that matrix multiplications accumulate in and that gradients are kept in. Default = float32
+    param_names: tuple
+        Names of the attributes holding parameters: ("weight", "bias")
+    grad_names: tuple
+        Names of the attributes holding the gradients of the parameters, in the same order: ("delta_wt", "delta_bias")
+    mask: numpy.ndarray
+        Set by pruning.prune(): 0 for the pruned weights and 1 for the others. Pruned weights are set to 0 again 
+        after every weight update, so they stay pruned while training. Default = None (no pruning)
+    """
+    param_names = ("weight", "bias")
+    grad_names = ("delta_wt", "delta_bias")
+    
+    def __init__(self,input_size,output_size,lr = 0.01,activation = 'linear',name = "Dense"):
+        self.name = name
+        self.input_size = input_size
+        self.output_size = output_size
+        self.dtype = np.dtype(np.float32)
+        self.compute_dtype = np.dtype(np.float32)
+        self.weight = np.random.uniform(-0.25,0.25,size = (input_size,output_size)).astype(self.dtype)
+        self.bias = np.random.uniform(-0.25,0.25,size = (1,output_size)).astype(self.dtype)
+        self.data = None
+        self.net = None
+        self.activation = activation
+        self.output = None
+        self.prev = None
+        self.next = None
+        self.lr = lr
+        self.delta_wt = None
+        self.delta_bias = None
+        self.delta = None
+        self.delta_in = None
+        self.mask = None
+
+    def set_precision(self,precision):
+        """
+        Applies the Network's precision policy to the layer: converts the weights and bias to the policy's
+        storage dtype and drops the buffers, which are reallocated with the new types.
+        
+        Input:
+        -----
+        precision: Precision
+        """
+        self.dtype = precision.dtype
+        self.compute_dtype = precision.compute_dtype
+        self.weight = self.weight.astype(self.dtype)
+        self.bias = self.bias.astype(self.dtype)
+        if self.mask is not None:
+            self.mask = self.mask.astype(self.dtype)
+        self.delta_wt = None
+        self.delta_bias = None
+        self.delta = None
+        self.delta_in = None
+
+    def compute(self):
+        """
+        Multiplies the input data with the layer's weights, adds layer's bias and applies the 
+        specified activation function. Returns the output as np.ndarray, that serves as the input
+        for next layer, or is the final output of the network
+        
+        Input:
+        ------
+        data: numpy.ndarray
+        
+        Output:
+        ------
+        self.output: numpy.ndarray
+        """
+        #The matmul accumulates in compute_dtype. The casts are no-ops unless the weights are stored in a 
+        #smaller type (mixed_float16)
+        cd = self.compute_dtype
+        net = np.dot(self.data.astype(cd, copy = False), self.weight.astype(cd, copy = False))
+        net += self.bias
+        
+        #Looks up the activation function specified in the registry and applies it. The output and net output
+        #of the last layer stay in compute_dtype, so that the loss is computed from unrounded logits
+        activation = get_activation(self.activation)[0]
+        self.output = activation(net)
+        if self.next is not None:
+            self.output = self.output.astype(self.dtype, copy = False)
+            net = net.astype(self.dtype, copy = False)
+        self.net = net
+        return self.output
+
+    def infer(self,data,out = None):
+        """
+        Same as compute(), but used for inference only. Takes the data as a parameter, doesn't 
+        store the training-only state (self.data, self.net, self.output) and computes the 
+        matmul, bias and activation in place in a preallocated buffer.
+        
+        Input:
+        ------
+        data: numpy.ndarray
+            Batch of inputs of shape (batch, input_size)
+        out: numpy.ndarray
+            Optional buffer of shape (batch, output_size) to write the result into. Must have the 
+            layer's compute_dtype.
+        
+        Output:
+        ------
+        out: numpy.ndarray
+        """
+        cd = self.compute_dtype
+        out = np.dot(data.astype(cd, copy = False), self.weight.astype(cd, copy = False), out = out)
+        out += self.bias
+        activation = get_activation(self.activation)[0]
+        return activation(out, out = out)
+
+    def backprop(self,bp_data):
+        """
+        Automatically performs the backpropagation. Takes in a parameter bp_data which is the errors backpropagated for
+        layers after this layer, i.e. the gradient of the loss with respect to this layer's output. Also calculates new 
+        bp_data, the gradient with respect to this layer's input, which will be used by layer before this layer.
+        Works on a whole batch at once: each row of bp_data belongs to one sample, and delta_wt and delta_bias are 
+        averaged over the batch so that one weight update is made per batch.
+        
+        The errors are masked by the activation's derivative once, after which the weight gradient and the new bp_data 
+        each take a single matrix multiplication. All results are written into buffers that are reused between batches.
+        For a softmax output layer, bp_data is expected to be the gradient of the cross entropy loss with respect to the
+        net output (prediction - true), see softmax_der().
+        
+        Input:
+        -----
+        bp_data: numpy.ndarray
+            Data from succeeding layers used for back propagation.
+            
+        Output:
+        -------
+        bp_data: numpy.ndarray
+            Updated input array "bp_data" that will be used by preceeding layers in the network during backpropagation.
+            None if no preceeding layer has weights, as nothing would use it.
+        """
+        n = bp_data.shape[0]
+        cd = self.compute_dtype
+        
+        #Errors of the net output: bp_data masked by the derivative of the activation
+        derivative = get_activation(self.activation)[1]
+        delta = derivative(self.net, out = self.buffer("delta", (n, self.output_size), cd))
+        np.multiply(delta, bp_data, out = delta)
+        
+        #Gradients of the weights and bias, averaged over all samples in the batch
+        delta_wt = np.dot(self.data.T.astype(cd, copy = False), delta, out = self.buffer("delta_wt", self.weight.shape, cd))
+        delta_wt /= n
+        delta_bias = np.sum(delta, axis = 0, keepdims = True, out = self.buffer("delta_bias", self.bias.shape, cd))
+        delta_bias /= n
+        
+        #Errors of the input, carried back through the weights. Skipped when there is no layer with weights before 
+        #this one (Eg. the first Dense layer after Flatten), as they would be thrown away.
+        if not self.needs_input_grad():
+            return None
+        delta_in = np.dot(delta, self.weight.T.astype(cd, copy = False), out = self.buffer("delta_in", (n, self.input_size), cd))
+        return delta_in.astype(self.dtype, copy = False)
+
+    def update_wt(self):
+        """
+        Updates the weight and bias of the layer after each backpropagation, using plain gradient
+        descent with the layer's learning rate. The arrays are updated in place. Not used when the 
+        Network has an optimizer.
+        
+        """
+        self.weight -= np.multiply(self.delta_wt, self.lr)
+        self.bias -= np.multiply(self.delta_bias, self.lr)
+        self.apply_mask()
+
+    def apply_mask(self):
+        """
+        Sets the pruned weights back to 0, if the layer was pruned
+        """
+        if self.mask is not None:
+            np.multiply(self.weight, self.mask, out = self.weight)
+
+    def params(self):
+        """
+        Returns the parameters of the layer together with their gradients, for use by an optimizer.
+        
+        Output:
+        -------
+        params: list
+            [(weight, delta_wt), (bias, delta_bias)]
+        """
+        return [(getattr(self, p), getattr(self, g)) for p, g in zip(self.param_names, self.grad_names)]
+
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"input_size": self.input_size, "output_size": self.output_size, "lr": self.lr, 
+                "activation": self.activation, "name": self.name}
+
+    def flops(self,phase):
+        """
+        Number of floating point operations of the last call of a phase, used by the profiler.
+        A multiply-add counts as 2 operations.
+        
+        Input:
+        -----
+        phase: str
+            "forward", "backward" or "update"
+        
+        Output:
+        -------
+        flops: int
+        """
+        n = self.data.shape[0] if self.data is not None else 0
+        macs = self.input_size * self.output_size
+        if phase == "forward":
+            #matmul, bias, activation
+            return 2 * n * macs + 2 * n * self.output_size
+        if phase == "backward":
+            #mask, weight gradient, bias gradient, input gradient (if needed)
+            flops = 2 * n * self.output_size + 2 * n * macs + n * self.output_size
+            if self.needs_input_grad():
+                flops += 2 * n * macs
+            return flops
+        #param -= lr * grad
+        return 2 * (macs + self.output_size)
+
+class InferenceDense(SuperLayer):
+    """
+    Base class of the fully connected layers that are made from a trained Dense layer for inference only
+    (SparseDense, QuantizedDense). They store their weights in another format, and only differ in how they
+    multiply a batch of inputs with them: subclasses implement product(data), which returns the net output
+    without the bias. The bias is in "bias", the activation's name in "activation".
+    """
+    grad_names = ()
+    
+    def compute(self):
+        """
+        Multiplies the input data with the layer's weights (See product()), adds the bias and applies the 
+        activation function, like Dense.compute()
+        
+        Output:
+        ------
+        self.output: numpy.ndarray
+        """
+        net = self.product(self.data) + self.bias
+        activation = get_activation(self.activation)[0]
+        self.output = activation(net)
+        if self.next is not None:
+            self.output = self.output.astype(self.dtype, copy = False)
+            net = net.astype(self.dtype, copy = False)
+        self.net = net
+        return self.output
+    
+    def infer(self,data,out = None):
+        """
+        Same as compute(), but used for inference only, like Dense.infer()
+        
+        Input:
+        ------
+        data: numpy.ndarray
+            Batch of inputs of shape (batch, input_size)
+        out: numpy.ndarray
+            Optional buffer of shape (batch, output_size) to write the result into.
+        
+        Output:
+        ------
+        out: numpy.ndarray
+        """
+        out = np.add(self.product(data), self.bias, out = out, dtype = self.compute_dtype)
+        activation = get_activation(self.activation)[0]
+        return activation(out, out = out)
+    
+    def backprop(self,bp_data):
+        raise Exception(type(self).__name__+" layers are for inference only, train the Dense layer before converting it")
+    
+    def update_wt(self):
+        """
+        The layer isn't trained. Written to maintain uniformity between classes
+        """
+        pass
+    
+    def params(self):
+        """
+        The layer has no trainable parameters. Written to maintain uniformity between classes
+        """
+        return []
+
+class SparseDense(InferenceDense):
+    """
+    Class used to represent a fully connected layer with sparse weights, for inference only. The weights
+    are stored transposed, as a (output_size, input_size) CSR matrix (See sparse.py), so only the non zero
+    weights are stored and multiplied. Usually made from a pruned Dense layer with from_dense() or 
+    pruning.sparsify().
+    
+    Parameters:
+    -----------
+    name: str
+        Used for identification and displaying layer information.
+    input_size: int
+        Size of the input data.
+    output_size: int
+        Size of the output data.
+    activation: str
+        Specifies the activation function for the layer. Default = "linear"
+    nnz: int
+        Number of stored weights. Used to allocate the weights when the layer is recreated from a checkpoint.
+    sparse_input: bool
+        The input is mostly zeros (Eg. MNIST pixels). Keeps a dense copy of the weights, and for every batch
+        uses the cheapest of three products: the sparse weights with the inputs, the non zero inputs with
+        the dense weights, or the dense matrix multiplication. The dense one is costed with the density
+        measured by sparse.break_even_density(). Default = False
+    weight_data, weight_indices, weight_indptr: numpy.ndarray
+        The CSR arrays of the transposed weights: values, column (input) indices and row (output) pointers
+    bias: numpy.ndarray
+        Bias values, (1, output_size)
+    dense_weight: numpy.ndarray
+        Dense copy of the transposed weights made with sparse_input, (output_size, input_size). Default = None
+    data: numpy.ndarray 
+        Holds the data to work upon.
+    net: numpy.ndarray 
+        Holds the net output produced by multiplying data and weights.
+    output: numpy.ndarray 
+        Holds the output produced after applying the activation function.
+    prev: Flatten, Dense or SparseDense 
+        Specifies the layer before this layer.
+    next: Flatten, Dense or SparseDense
+        Specifies the layer after this layer.
+    dtype: numpy.dtype
+        Type that the weights, bias and outputs are stored in. Set by the Network's precision policy. Default = float32
+    compute_dtype: numpy.dtype
+        Type that the products are computed in. Default = float32
+    param_names: tuple
+        Names of the attributes holding parameters: ("weight_data", "weight_indices", "weight_indptr", "bias")
+    cache_names: tuple
+        Names of the attributes holding arrays made from the parameters and kept between calls: ("dense_weight",)
+    grad_names: tuple
+        SparseDense layers aren't trained, so they have no gradients
+    """
+    param_names = ("weight_data", "weight_indices", "weight_indptr", "bias")
+    cache_names = ("dense_weight",)
+    
+    def __init__(self,input_size,output_size,activation = 'linear',name = "SparseDense",nnz = 0,sparse_input = False):
+        self.name = name
+        self.input_size = input_size
+        self.output_size = output_size
+        self.activation = activation
+        self.sparse_input = sparse_input
+        self.dtype = np.dtype(np.float32)
+        self.compute_dtype = np.dtype(np.float32)
+        self.weight_data = np.zeros(nnz, dtype = self.dtype)
+        self.weight_indices = np.zeros(nnz, dtype = np.int32)
+        self.weight_indptr = np.zeros(output_size + 1, dtype = np.int64)
+        self.bias = np.zeros((1, output_size), dtype = self.dtype)
+        self.matrix = None
+        self.dense_weight = None
+        self.data = None
+        self.net = None
+        self.output = None
+        self.prev = None
+        self.next = None
+    
+    @classmethod
+    def from_dense(cls,layer,sparse_input = False):
+        """
+        Makes a SparseDense layer holding the non zero weights of a (pruned) Dense layer
+        
+        Input:
+        -----
+        layer: Dense
+        sparse_input: bool
+            See the class description. Default = False
+        
+        Output:
+        -------
+        sparse: SparseDense
+        """
+        matrix = CSRMatrix.from_dense(layer.weight.T)
+        sparse = cls(layer.input_size, layer.output_size, layer.activation, "Sparse"+layer.name, matrix.nnz, sparse_input)
+        sparse.weight_data = matrix.data
+        sparse.weight_indices = matrix.indices
+        sparse.weight_indptr = matrix.indptr
+        sparse.bias = layer.bias.copy()
+        return sparse
+    
+    def set_precision(self,precision):
+        """
+        Applies the Network's precision policy to the layer: converts the weights and bias to the policy's
+        storage dtype.
+        
+        Input:
+        -----
+        precision: Precision
+        """
+        self.dtype = precision.dtype
+        self.compute_dtype = precision.compute_dtype
+        self.weight_data = self.weight_data.astype(self.dtype)
+        self.bias = self.bias.astype(self.dtype)
+    
+    @property
+    def nnz(self):
+        return self.weight_data.shape[0]
+    
+    def csr(self):
+        """
+        Returns the weights as a CSRMatrix, made again if the weight arrays were replaced (Eg. by Network.load())
+        """
+        m = self.matrix
+        if m is None or m.data is not self.weight_data or m.indices is not self.weight_indices or m.indptr is not self.weight_indptr:
+            self.matrix = CSRMatrix(self.weight_data, self.weight_indices, self.weight_indptr, 
+                                    (self.output_size, self.input_size))
+            self.dense_weight = None
+        return self.matrix
+    
+    def product(self,data):
+        """
+        Multiplies a batch of inputs with the sparse weights, or with sparse_input, with the cheapest of the
+        sparse weight, sparse input and dense products (See the class description).
+        
+        Input:
+        ------
+        data: numpy.ndarray
+            Batch of inputs of shape (batch, input_size)
+        
+        Output:
+        ------
+        net: numpy.ndarray
+            (batch, output_size), without the bias
+        """
+        data = data.astype(self.compute_dtype, copy = False)
+        weight = self.csr()
+        if self.sparse_input:
+            n = data.shape[0]
+            #Stored values gathered by each sparse product, and the multiply-adds of the dense one, which
+            #cost "density" times as much each
+            density = break_even_density(self.output_size, self.input_size, n)
+            costs = (weight.nnz * n, np.count_nonzero(data) * self.output_size, 
+                     density * n * self.input_size * self.output_size)
+            cheapest = int(np.argmin(costs))
+            if cheapest > 0 and self.dense_weight is None:
+                #Transposed, (output_size, input_size)
+                self.dense_weight = weight.to_dense().astype(self.compute_dtype)
+            if cheapest == 1:
+                return CSRMatrix.from_dense(data).dot_rows(self.dense_weight).T
+            if cheapest == 2:
+                return np.dot(data, self.dense_weight.T)
+        return weight.dot_rows(data)
+    
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"input_size": self.input_size, "output_size": self.output_size, "activation": self.activation, 
+                "name": self.name, "nnz": self.nnz, "sparse_input": self.sparse_input}
+    
+    def flops(self,phase):
+        """
+        Number of floating point operations of the last forward pass, used by the profiler: one multiply-add
+        per stored weight and sample, the bias and the activation.
+        
+        Input:
+        -----
+        phase: str
+            "forward", "backward" or "update"
+        
+        Output:
+        -------
+        flops: int
+        """
+        if phase != "forward" or self.data is None:
+            return 0
+        n = self.data.shape[0]
+        return 2 * n * self.nnz + 2 * n * self.output_size
+
+#Largest number of inputs whose int8 products are summed exactly in float32: every partial sum of
+#products of a uint8 input (minus its zero point, at most 255) and an int8 weight (at most 127) is an
+#integer below 2**24, which float32 represents exactly.
+EXACT_ROWS = 2**24 // (255 * 127)
+
+class QuantizedDense(InferenceDense):
+    """
+    Class used to represent a fully connected layer with int8 weights, for inference only. Usually made 
+    from a trained Dense layer by quantization.quantize().
+    
+    The weights are quantized symmetrically per output channel: weight ~ weight_q * weight_scale, with 
+    weight_q int8 in [-127, 127]. The inputs are quantized to uint8 with a scale and zero point found by
+    calibration: data ~ (data_q - input_zero_point) * input_scale, with data_q in [0, 255]. The products
+    of the integers are accumulated in int32, and the result is scaled back to float32:
+        net = input_scale * weight_scale * sum((data_q - input_zero_point) * weight_q) + bias
+    numpy has no fast integer matrix multiplication, so the integer products are computed with float32 
+    matrix multiplications of at most EXACT_ROWS inputs at a time, which are exact, and summed in int32.
+    Each block of EXACT_ROWS rows of the weights is widened to float32 just for its multiplication, so only
+    the int8 weights stay in memory.
+    
+    Parameters:
+    -----------
+    name: str
+        Used for identification and displaying layer information.
+    input_size: int
+        Size of the input data.
+    output_size: int
+        Size of the output data.
+    activation: str
+        Specifies the activation function for the layer. Default = "linear"
+    weight_q: numpy.ndarray
+        int8 weights, (input_size, output_size)
+    weight_scale: numpy.ndarray
+        float32 scale of each output channel, (1, output_size)
+    bias: numpy.ndarray
+        float32 bias, (1, output_size)
+    input_scale: numpy.ndarray
+        float32 scale of the inputs, (1,)
+    input_zero_point: numpy.ndarray
+        Integer input that stands for 0, (1,) int32
+    data: numpy.ndarray 
+        Holds the data to work upon.
+    net: numpy.ndarray 
+        Holds the net output.
+    output: numpy.ndarray 
+        Holds the output produced after applying the activation function.
+    prev, next: layer
+        The layers before and after this layer.
+    dtype: numpy.dtype
+        Type that the outputs are stored in. Set by the Network's precision policy. Default = float32
+    compute_dtype: numpy.dtype
+        Type of the net output. Default = float32
+    param_names: tuple
+        Names of the attributes holding parameters: ("weight_q", "weight_scale", "bias", "input_scale", "input_zero_point")
+    grad_names: tuple
+        QuantizedDense layers aren't trained, so they have no gradients
+    """
+    param_names = ("weight_q", "weight_scale", "bias", "input_scale", "input_zero_point")
+    
+    def __init__(self,input_size,output_size,activation = 'linear',name = "QuantizedDense"):
+        self.name = name
+        self.input_size = input_size
+        self.output_size = output_size
+        self.activation = activation
+        self.dtype = np.dtype(np.float32)
+        self.compute_dtype = np.dtype(np.float32)
+        self.weight_q = np.zeros((input_size, output_size), dtype = np.int8)
+        self.weight_scale = np.ones((1, output_size), dtype = np.float32)
+        self.bias = np.zeros((1, output_size), dtype = np.float32)
+        self.input_scale = np.ones(1, dtype = np.float32)
+        self.input_zero_point = np.zeros(1, dtype = np.int32)
+        self.data = None
+        self.net = None
+        self.output = None
+        self.prev = None
+        self.next = None
+    
+    def set_precision(self,precision):
+        """
+        Applies the Network's precision policy to the layer. Only the type of the outputs changes, the 
+        parameters stay int8 and float32.
+        
+        Input:
+        -----
+        precision: Precision
+        """
+        self.dtype = precision.dtype
+    
+    def quantize_input(self,data):
+        """
+        Quantizes a batch of inputs to uint8 with the calibrated scale and zero point, and subtracts the
+        zero point.
+        
+        Input:
+        ------
+        data: numpy.ndarray
+            Batch of inputs of shape (batch, input_size)
+        
+        Output:
+        ------
+        data_q: numpy.ndarray
+            float32 array of integers in [-input_zero_point, 255 - input_zero_point]
+        """
+        zero_point = float(self.input_zero_point[0])
+        data_q = np.divide(data, self.input_scale[0], dtype = np.float32)
+        np.rint(data_q, out = data_q)
+        return np.clip(data_q, -zero_point, 255 - zero_point, out = data_q)
+    
+    def product(self,data):
+        """
+        Multiplies a batch of inputs with the weights: the quantized inputs and weights are multiplied with
+        int32 accumulation, and the result is scaled back to float32.
+        
+        Input:
+        ------
+        data: numpy.ndarray
+            Batch of inputs of shape (batch, input_size)
+        
+        Output:
+        ------
+        net: numpy.ndarray
+            (batch, output_size), without the bias
+        """
+        data_q = self.quantize_input(data)
+        weight_q = self.weight_q
+        #Inputs that are 0 for the whole batch (Eg. after a relu) don't contribute. If most of them are,
+        #only the rows of the weights of the others are gathered and widened.
+        used = np.flatnonzero(np.any(data_q, axis = 0))
+        if 2 * used.shape[0] < self.input_size:
+            data_q = data_q[:, used]
+            weight_q = weight_q[used]
+        rows = weight_q.shape[0]
+        acc = None
+        for start in range(0, rows, EXACT_ROWS):
+            stop = min(start + EXACT_ROWS, rows)
+            #float32 copy of one block of the weights, freed after its multiplication
+            part = np.dot(data_q[:, start:stop], weight_q[start:stop].astype(np.float32))
+            if acc is None and stop == rows:
+                #A single part is exact as it is
+                return np.multiply(part, self.input_scale[0] * self.weight_scale, out = part)
+            part = part.astype(np.int32)
+            acc = part if acc is None else np.add(acc, part, out = acc)
+        return np.multiply(acc, self.input_scale[0] * self.weight_scale, dtype = np.float32)
+    
+    def get_config(self):
+        """
+        Returns the arguments needed to recreate the layer, used when saving the network
+        """
+        return {"input_size": self.input_size, "output_size": self.output_size, "activation": self.activation, 
+                "name": self.name}
+    
+    def flops(self,phase):
+        """
+        Number of operations of the last forward pass, used by the profiler. A multiply-add counts as 2.
+        
+        Input:
+        -----
+        phase: str
+            "forward", "backward" or "update"
+        
+        Output:
+        -------
+        flops: int
+        """
+        if phase != "forward" or self.data is None:
+            return 0
+        n = self.data.shape[0]
+        return 2 * n * self.input_size * self.output_size + 4 * n * self.output_size
+
+#Layer classes by name, used to recreate the layers of a saved network
+LAYER_TYPES = {
+    "Flatten": Flatten,
+    "Dense": Dense,
+    "SparseDense": SparseDense,
+    "QuantizedDense": QuantizedDense,
+}
@@ -0,0 +1,312 @@
+"""
+Losses and metrics
+---
+
+Vectorized loss functions and evaluation metrics. Everything works on whole batches: predictions are
+arrays of shape (batch, classes) (probabilities or logits) or (batch,) (class ids), and true labels can
+be given either one hot encoded, (batch, classes), or as class ids, (batch,).
+
+Losses return one value per sample, in nats (natural logarithm). The streaming metrics (Mean, Accuracy,
+TopKAccuracy, ConfusionMatrix) accumulate over any number of batches, so a dataset can be evaluated
+chunk by chunk without keeping all predictions in memory:
+
+```
+acc = Accuracy()
+for pred, labels in zip(nw.predict_batches(x), label_batches):
+    acc.update(pred, labels)
+print(acc.result())
+```
+"""
+
+import numpy as np
+
+def class_ids(true):
+    """
+    Converts labels to class ids: one hot encoded labels (2D) are reduced with argmax, class ids (1D)
+    are returned as they are.
+    """
+    true = np.asarray(true)
+    if true.ndim == 2:
+        return np.argmax(true, axis = 1)
+    return true
+
+def one_hot(true,num_classes,dtype = np.float32):
+    """
+    Converts labels to one hot encoded labels. Labels that already are one hot encoded (2D) are returned
+    as they are.
+    """
+    true = np.asarray(true)
+    if true.ndim == 2:
+        return true
+    ohe = np.zeros((true.shape[0], num_classes), dtype = dtype)
+    ohe[np.arange(true.shape[0]), true] = 1
+    return ohe
+
+################################################################################
+#
+# LOSSES
+#
+################################################################################
+
+def log_softmax(logits):
+    """
+    Log of the softmax of each row, computed with log-sum-exp: log(softmax(z)) = z - max(z) - log(sum(exp(z - max(z)))).
+    Never takes the log of 0, so it stays finite for any finite logits.
+
+    Input:
+    -----
+    logits: numpy.ndarray
+        Array of shape (batch, classes)
+
+    Output:
+    -------
+    log_probs: numpy.ndarray
+        Array of shape (batch, classes)
+    """
+    shifted = logits - logits.max(axis = 1, keepdims = True)
+    return shifted - np.log(np.exp(shifted).sum(axis = 1, keepdims = True))
+
+def softmax_cross_entropy(logits,true):
+    """
+    Cross entropy of softmax(logits), fused with the softmax so that it is computed with log-sum-exp
+    instead of taking the log of probabilities that may have underflowed to 0.
+
+    Input:
+    -----
+    logits: numpy.ndarray
+        Net output of the softmax layer, (batch, classes)
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+
+    Output:
+    -------
+    loss: numpy.ndarray
+        Loss of each sample, (batch,)
+    """
+    log_probs = log_softmax(logits)
+    true = np.asarray(true)
+    if true.ndim == 2:
+        return -np.einsum("ij,ij->i", true, log_probs)
+    return -log_probs[np.arange(true.shape[0]), true]
+
+def cross_entropy(probs,true,epsilon = 1e-12):
+    """
+    Cross entropy of probabilities. Probabilities are clipped to at least epsilon, so that a probability
+    that underflowed to 0 gives a large but finite loss. Use softmax_cross_entropy() when the logits
+    are available.
+
+    Input:
+    -----
+    probs: numpy.ndarray
+        Predicted probabilities, (batch, classes)
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+
+    Output:
+    -------
+    loss: numpy.ndarray
+        Loss of each sample, (batch,)
+    """
+    true = np.asarray(true)
+    if true.ndim == 2:
+        return -np.einsum("ij,ij->i", true, np.log(np.maximum(probs, epsilon)))
+    return -np.log(np.maximum(probs[np.arange(true.shape[0]), true], epsilon))
+
+def cross_entropy_grad(probs,true):
+    """
+    Gradient of softmax followed by cross entropy with respect to the logits, for each sample: probs - true
+
+    Input:
+    -----
+    probs: numpy.ndarray
+        Output of the softmax layer, (batch, classes)
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+
+    Output:
+    -------
+    grad: numpy.ndarray
+        (batch, classes)
+    """
+    return probs - one_hot(true, probs.shape[1], probs.dtype)
+
+################################################################################
+#
+# METRICS
+#
+################################################################################
+
+def accuracy(pred,true):
+    """
+    Fraction of samples whose predicted class is the true class.
+
+    Input:
+    -----
+    pred: numpy.ndarray
+        Predicted class ids (batch,), or probabilities/logits (batch, classes)
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+
+    Output:
+    -------
+    acc: double
+    """
+    pred = class_ids(pred)
+    true = class_ids(true)
+    if pred.shape[0] != true.shape[0]:
+        raise Exception("Unequal lengths: "+str(pred.shape[0])+"!="+str(true.shape[0]))
+    if pred.shape[0] == 0:
+        return 0.0
+    return float(np.count_nonzero(pred == true)) / pred.shape[0]
+
+def mse(pred,true):
+    """
+    Mean squared error of each sample, averaged over the outputs. With predicted probabilities and one
+    hot targets it is the Brier score divided by the number of classes. Not used for training: the
+    network trains with cross entropy.
+
+    Input:
+    -----
+    pred: numpy.ndarray
+        (batch, outputs)
+    true: numpy.ndarray
+        (batch, outputs), or class ids for one hot targets
+
+    Output:
+    -------
+    loss: numpy.ndarray
+        Loss of each sample, (batch,)
+    """
+    diff = pred - one_hot(true, pred.shape[1], pred.dtype)
+    return np.einsum("ij,ij->i", diff, diff) / pred.shape[1]
+
+def top_k_correct(probs,true,k = 5):
+    """
+    Boolean array telling for each sample whether the true class is among the k highest scoring classes.
+    Uses np.argpartition, so the classes are not fully sorted.
+
+    Input:
+    -----
+    probs: numpy.ndarray
+        Probabilities or logits, (batch, classes)
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+    k: int
+
+    Output:
+    -------
+    correct: numpy.ndarray
+        (batch,)
+    """
+    true = class_ids(true)
+    k = min(k, probs.shape[1])
+    top = np.argpartition(probs, -k, axis = 1)[:, -k:]
+    return (top == true[:, None]).any(axis = 1)
+
+def top_k_accuracy(probs,true,k = 5):
+    """
+    Fraction of samples whose true class is among the k highest scoring classes.
+    """
+    correct = top_k_correct(probs, true, k)
+    return float(np.count_nonzero(correct)) / correct.shape[0] if correct.shape[0] else 0.0
+
+def confusion_matrix(pred,true,num_classes):
+    """
+    Confusion matrix: entry [i, j] is the number of samples of true class i predicted as class j.
+
+    Input:
+    -----
+    pred: numpy.ndarray
+        Predicted class ids, or probabilities/logits
+    true: numpy.ndarray
+        True labels, one hot encoded or class ids
+    num_classes: int
+
+    Output:
+    -------
+    matrix: numpy.ndarray
+        (num_classes, num_classes) array of counts
+    """
+    pred = class_ids(pred)
+    true = class_ids(true)
+    counts = np.bincount(true * num_classes + pred, minlength = num_classes * num_classes)
+    return counts.reshape(num_classes, num_classes)
+
+################################################################################
+#
+# STREAMING METRICS
+#
+################################################################################
+
+class Mean:
+    """
+    Streaming mean of per sample values (Eg. losses)
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = 0.0
+        self.count = 0
+
+    def update(self,values):
+        values = np.asarray(values)
+        self.total += float(values.sum())
+        self.count += values.size
+
+    def result(self):
+        return self.total / self.count if self.count else 0.0
+
+class Accuracy:
+    """
+    Streaming accuracy: update() with the predictions and labels of each chunk, result() at the end.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.correct = 0
+        self.count = 0
+
+    def update(self,pred,true):
+        pred = class_ids(pred)
+        true = class_ids(true)
+        self.correct += int(np.count_nonzero(pred == true))
+        self.count += pred.shape[0]
+
+    def result(self):
+        return self.correct / self.count if self.count else 0.0
+
+class TopKAccuracy(Accuracy):
+    """
+    Streaming top-k accuracy. update() needs probabilities or logits, not class ids.
+    """
+
+    def __init__(self,k = 5):
+        self.k = k
+        super().__init__()
+
+    def update(self,probs,true):
+        correct = top_k_correct(probs, true, self.k)
+        self.correct += int(np.count_nonzero(correct))
+        self.count += correct.shape[0]
+
+class ConfusionMatrix:
+    """
+    Streaming confusion matrix
+    """
+
+    def __init__(self,num_classes):
+        self.num_classes = num_classes
+        self.reset()
+
+    def reset(self):
+        self.matrix = np.zeros((self.num_classes, self.num_classes), dtype = np.int64)
+
+    def update(self,pred,true):
+        self.matrix += confusion_matrix(pred, true, self.num_classes)
+
+    def result(self):
+        return self.matrix
@@ -0,0 +1,177 @@
+"""
+MNIST / IDX dataset loader
+---
+
+Reads the MNIST files (or any other IDX file) without decoding the whole dataset into memory.
+
+1. Each gzipped IDX file is decompressed only once, into an uncompressed cache file next to it.
+2. The cache file is opened with np.memmap, so the data is only read from disk (and shared between
+   processes through the page cache) when a batch is actually used.
+3. The IDX header is parsed to find the data type and shape, instead of skipping a fixed number of bytes.
+4. Images stay uint8. Casting to float happens per batch, when a batch is fed to the network
+   (See Flatten.compute).
+5. Works offline: files that already exist locally are never downloaded again.
+
+```
+train_data, train_labels, test_data, test_labels = load_mnist()
+```
+"""
+
+import os
+import gzip
+import shutil
+import struct
+import urllib.request
+import numpy as np
+
+URL_TRAIN_DATA    = 'http://yann.lecun.com/exdb/mnist/train-images-idx3-ubyte.gz'
+URL_TRAIN_LABELS  = 'http://yann.lecun.com/exdb/mnist/train-labels-idx1-ubyte.gz'
+URL_TEST_DATA     = 'http://yann.lecun.com/exdb/mnist/t10k-images-idx3-ubyte.gz'
+URL_TEST_LABELS   = 'http://yann.lecun.com/exdb/mnist/t10k-labels-idx1-ubyte.gz'
+FILE_TRAIN_DATA   = 'train_data.gz'
+FILE_TRAIN_LABELS = 'train_labels.gz'
+FILE_TEST_DATA    = 'test_data.gz'
+FILE_TEST_LABELS  = 'test_labels.gz'
+
+#Data types of the IDX format, indexed by the type code in the 3rd byte of the header.
+#All multi byte values in IDX files are big endian.
+IDX_TYPES = {
+    0x08: np.dtype(np.uint8),
+    0x09: np.dtype(np.int8),
+    0x0B: np.dtype('>i2'),
+    0x0C: np.dtype('>i4'),
+    0x0D: np.dtype('>f4'),
+    0x0E: np.dtype('>f8'),
+}
+
+def read_idx_header(f):
+    """
+    Parses the header of an IDX file. The header is 2 zero bytes, a byte with the data type code,
+    a byte with the number of dimensions and then the size of each dimension as a big endian
+    32 bit integer.
+
+    Input:
+    -----
+    f: file
+        IDX file opened in binary mode, positioned at the start of the file.
+
+    Output:
+    -------
+    (dtype, shape, offset): tuple
+        Data type of the elements, shape of the data and the size of the header in bytes
+        (where the data starts).
+    """
+    magic = f.read(4)
+    if len(magic) != 4 or magic[0] != 0 or magic[1] != 0:
+        raise Exception("Not an IDX file: "+str(getattr(f, "name", f)))
+    if magic[2] not in IDX_TYPES:
+        raise Exception("Unsupported IDX data type: "+hex(magic[2]))
+    ndim = magic[3]
+    shape = struct.unpack(">"+"I"*ndim, f.read(4*ndim))
+    return IDX_TYPES[magic[2]], shape, 4+4*ndim
+
+def download(url,path):
+    """
+    Downloads url to path, unless path already exists.
+    The file is written under a temporary name first, so an interrupted download is never mistaken
+    for a complete file.
+
+    Input:
+    -----
+    url: str
+    path: str
+
+    Output:
+    -------
+        None
+    """
+    if os.path.exists(path):
+        return
+    urllib.request.urlretrieve(url, path+".part")
+    os.replace(path+".part", path)
+
+def decompress(path,cache_path = None):
+    """
+    Decompresses a gzipped file once, into cache_path. If the cache already exists and is newer
+    than the compressed file, nothing is done.
+
+    Input:
+    -----
+    path: str
+        Gzipped file
+    cache_path: str
+        Where to write the decompressed file. Default = path without the ".gz" extension, plus ".idx"
+
+    Output:
+    -------
+    cache_path: str
+    """
+    if cache_path is None:
+        cache_path = (path[:-3] if path.endswith(".gz") else path)+".idx"
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return cache_path
+    with gzip.open(path, 'rb') as src, open(cache_path+".part", 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(cache_path+".part", cache_path)
+    return cache_path
+
+def open_idx(path):
+    """
+    Opens an IDX file as a read only np.memmap, with the shape and data type given by its header.
+    Gzipped files are decompressed into the on disk cache first (see decompress()).
+
+    Input:
+    -----
+    path: str
+        IDX file, compressed (".gz") or not
+
+    Output:
+    -------
+    data: numpy.memmap
+    """
+    if path.endswith(".gz"):
+        path = decompress(path)
+    with open(path, 'rb') as f:
+        dtype, shape, offset = read_idx_header(f)
+    expected = offset + int(np.prod(shape)) * dtype.itemsize
+    if os.path.getsize(path) < expected:
+        raise Exception("Truncated IDX file: "+path)
+    return np.memmap(path, dtype = dtype, mode = 'r', offset = offset, shape = shape)
+
+def load_mnist(data_dir = ".",download_missing = True):
+    """
+    Loads the MNIST training and testing data. Images are returned as uint8 memory maps in NCHW
+    format, (samples, 1, 28, 28), and labels as int32 arrays.
+
+    Input:
+    -----
+    data_dir: str
+        Directory holding the (gzipped) MNIST files. Default = current directory
+    download_missing: bool
+        Download files that are not in data_dir. If False, missing files raise an exception, so
+        nothing is ever fetched over the network. Default = True
+
+    Output:
+    -------
+    (train_data, train_labels, test_data, test_labels): tuple
+    """
+    files = [
+        (URL_TRAIN_DATA, FILE_TRAIN_DATA),
+        (URL_TRAIN_LABELS, FILE_TRAIN_LABELS),
+        (URL_TEST_DATA, FILE_TEST_DATA),
+        (URL_TEST_LABELS, FILE_TEST_LABELS),
+    ]
+    arrays = []
+    for url, name in files:
+        path = os.path.join(data_dir, name)
+        cache_path = path[:-3]+".idx"
+        if not os.path.exists(path) and not os.path.exists(cache_path):
+            if not download_missing:
+                raise Exception("File not found: "+path)
+            download(url, path)
+        arrays.append(open_idx(path if os.path.exists(path) else cache_path))
+
+    train_data, train_labels, test_data, test_labels = arrays
+    train_data = train_data.reshape(train_data.shape[0], 1, train_data.shape[1], train_data.shape[2])
+    test_data = test_data.reshape(test_data.shape[0], 1, test_data.shape[1], test_data.shape[2])
+    return train_data, train_labels.astype(np.int32), test_data, test_labels.astype(np.int32)
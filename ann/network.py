@@ -0,0 +1,1116 @@
+"""
+Network
+---
+
+The Network holds a stack of layers and trains them (fit), runs inference (predict, evaluate) and saves
+and loads them (save, load).
+"""
+
+import time
+import math
+import types
+import numpy as np
+from . import optimizers
+from . import profiler
+from . import checkpoint
+from . import metrics
+from . import pipeline
+from .precision import Precision
+from .parameters import ParameterStore
+from .layers import LAYER_TYPES
+
+class Network:
+    """
+    Class to manage  addition of layers, training and testing data in a Neural Network. 
+    Defines the architecture of the xNN
+    
+    Parameters:
+    -----------
+    layers: list
+        Holds a list of all layers in the Neural Network
+    ypred: numpy.ndarray 
+        Predictions made by the network on test data (xtest)
+    curr: Flatten or Dense
+        Points to the current layer in the network. This is used to specify the preceeding and succeeding layers of any layer
+    out: numpy.ndarray
+        Holds the final output of the network
+    epoch_loss: list
+        Holds the average losses per epoch for all epochs
+    epoch_acc: list
+        Holds the validation accuracy of every validated epoch
+    epoch_time: list
+        Holds the time taken per epoch for all epochs
+    optimizer: optimizers.Optimizer
+        Updates the parameters of all layers after each backpropagation (Eg. optimizers.Adam()). If None, 
+        each layer updates its own weights with plain gradient descent and its own learning rate (lr).
+        Default = None
+    precision: Precision
+        Precision policy applied to every layer added to the network. Can also be given by name, 
+        Eg. "mixed_float16". Default = "float32"
+    epoch_efficiency: list
+        Holds the worker utilization per epoch, when training with more than one worker
+    epoch_speedup: list
+        Holds the training throughput per epoch relative to one process, when training with more than one
+        worker (See parallel.ParallelTrainer.speedup())
+    profiler: profiler.Profiler
+        Records per layer timings of the training loop when enabled with profile(). Default = None
+    epoch: int
+        Number of epochs trained so far. Saved with the network, so training can be resumed.
+    plan: compiler.ExecutionPlan
+        Execution plan used for the forward pass and backpropagation after compile(). Default = None
+    store: parameters.ParameterStore
+        Flat arrays holding all parameters and gradients after pack_params(). Default = None
+    stop_training: bool
+        Set by a callback to stop fit after the current batch (See callbacks.py)
+    master: list
+        float32 master copies of the parameters with mixed_float16 precision, which the updates are applied 
+        to (See master_step()). Default = None
+    """
+    
+    def __init__(self,optimizer = None,precision = "float32"):
+        np.random.seed(0)
+        self.layers = []
+        self.ypred = None
+        self.curr = None
+        self.out = None
+        self.epoch_acc = []
+        self.epoch_loss = []
+        self.epoch_time = []
+        self.epoch_efficiency = []
+        self.epoch_speedup = []
+        self.optimizer = optimizer
+        self.profiler = None
+        self.plan = None
+        self.store = None
+        self.stop_training = False
+        self.master = None
+        self.epoch = 0
+        self.precision = Precision(precision) if isinstance(precision, str) else precision
+    def add(self,layer):
+        """
+        Adds a new layer to the neural network. Sets the previous and next layer of each layer. 
+        When adding the 1st layer, self.curr is set to None. So for the 1st layer, performing
+        layer.prev = self.curr will set the layer's previous layer as None, which is how it should be
+        After adding the 1st layer, self.curr is set to the 1st layer, and so, when you add 2nd and subsequent
+        layers, the previous layer will be correctly set.
+        
+        Input:
+        -----
+        layer: Dense, Flatten, Conv2D, ...
+            Object of one of the layer classes
+            
+        Output:
+        -------
+            None
+        """
+        self.layers.append(layer)
+        layer.set_precision(self.precision)
+        #The layers changed, so a compiled plan, the parameter store and the master weights are out of date
+        self.plan = None
+        self.store = None
+        self.master = None
+        layer.prev = self.curr
+        self.curr = layer
+        if layer.prev:
+            layer.prev.next = layer
+            #Convolution and pooling layers take the shape of their input from the layer before
+            if getattr(layer, "input_shape", 1) is None and getattr(layer.prev, "output_shape", None) is not None:
+                layer.build(layer.prev.output_shape)
+        
+
+    def fit(self,x,y = None,epochs = 1, validation_split = 0.0, batch_size = 1, workers = 1, hogwild = False,
+            checkpoint_path = None, checkpoint_every = 1, initial_epoch = 0, validation_batch_size = 1024,
+            validation_freq = 1, validation_subsample = None, validation_mode = None, shuffle = False,
+            prefetch = 0, augment = None, pruning = None, callbacks = None):
+        """
+        Performs forward pass, backpropagation, weightupdation for all layers, for the entire dataset.
+        Repeats the process for the number of epochs set by the user. Epochs is set 1 by default.
+        Data is processed in mini-batches of "batch_size" samples. Each batch goes through the layers
+        as a single matrix and the weights are updated once per batch, using gradients averaged over the batch.
+        
+        Input:
+        -----
+        x: numpy.matrix or pipeline.DataLoader
+            Independent variables of the data, or a DataLoader yielding batches of (samples, classes). 
+            A DataLoader brings its own batch size, shuffling, prefetching and augmentation (See pipeline.py),
+            and can't be combined with validation_split or workers.
+        y: numpy.matrix
+            Dependent variables of the data (Usually the class names). None when x is a DataLoader.
+        epochs: int
+            Number of times data should be fit.
+        validation_split: double
+            The percentage of training data that should be reserved for validation. 
+            The trailing "validation_split"% of data is reserved for validation, before any shuffling.
+        batch_size: int
+            Number of samples processed together in one forward pass, backpropagation and weight
+            updation. Default = 1 (One update per sample). The last batch of an epoch may be smaller.
+        workers: int
+            Number of worker processes for data parallel training (See parallel.py). Each batch is split
+            between the workers. Default = 1 (No worker processes)
+        hogwild: bool
+            With more than one worker, let each worker train on its own part of the data and update the
+            shared weights asynchronously (Hogwild), instead of averaging the gradients of each batch. 
+            Every worker updates the weights with its own copy of the optimizer. Default = False
+        checkpoint_path: str
+            If given, the network is saved to this file (See save()) every "checkpoint_every" epochs.
+            Default = None
+        checkpoint_every: int
+            Number of epochs between checkpoints. Default = 1
+        initial_epoch: int
+            Epoch to start counting from, to resume training a network loaded from a checkpoint:
+            Eg. fit(x, y, epochs = 5, initial_epoch = nw.epoch) trains the remaining epochs. With shuffle,
+            the epochs use the same orders of samples as training without interruption. Default = 0
+        validation_batch_size: int
+            Number of validation samples passed through the network at once. Default = 1024
+        validation_freq: int
+            Validate every "validation_freq" epochs. Default = 1
+        validation_subsample: int or double
+            Validate on a fixed random subset of the validation data: the number of samples (int), or the 
+            fraction of the validation data (double). Default = None (all validation data)
+        validation_mode: str
+            None: validate before the next epoch starts. "thread" or "process": validate a snapshot of 
+            the weights in a background thread or forked process, while the next epoch trains (See 
+            evaluation.py). Default = None
+        shuffle: bool
+            Train on the samples in a new random order every epoch. Default = False
+        prefetch: int
+            Number of batches prepared ahead by a background thread while the current batch trains. 
+            Default = 0 (batches are prepared when needed)
+        augment: callable
+            Called as augment(x, y) on every training batch, returns the augmented (x, y). y is one hot 
+            encoded. Default = None
+        pruning: pruning.GradualPruning
+            Prunes the weights gradually while training: its step() is called after every batch (See 
+            pruning.py). Not supported with hogwild. Default = None
+        callbacks: list
+            Callbacks called at the start and end of training, of every epoch and after every batch (only
+            at epoch boundaries with hogwild), Eg. early stopping or a time budget (See callbacks.py). 
+            Training stops after the current batch when one of them sets self.stop_training. Default = None
+            
+        Output:
+        -------
+            None
+            
+        """
+        if isinstance(x, pipeline.DataLoader) and (validation_split != 0.0 or workers > 1):
+            raise Exception("validation_split and workers are not supported when training from a DataLoader")
+        if workers > 1 and (shuffle or prefetch or augment is not None):
+            raise Exception("shuffle, prefetch and augment are not supported with workers")
+        if pruning is not None and workers > 1 and hogwild:
+            raise Exception("pruning is not supported with hogwild")
+        
+        if validation_split != 0.0:
+            split = int((1-validation_split) * x.shape[0])
+            val_x = x[split:]
+            val_y = y[split:]
+            x = x[:split]
+            y = y[:split]
+        
+        print("\nBeginning Training...")
+        print("=================================================================================")
+        print("Number of epochs: "+str(epochs))
+        num_classes = self.layers[-1].output_size
+        if isinstance(x, pipeline.DataLoader):
+            loader = x
+        else:
+            #One hot encoding of the class labels
+            ohe_labels = self.one_hot(y)
+            loader = pipeline.DataLoader(x, ohe_labels, batch_size, shuffle, prefetch, augment = augment)
+            #A resumed training continues with the orders of the next epochs, not those of the first ones
+            loader.skip(initial_epoch)
+        print("Training dataset size: "+str(loader.num_samples() if loader.is_array() else "unknown"))
+        print("Batch size: "+str(loader.batch_size))
+        if workers > 1:
+            print("Workers: "+str(workers)+(" (Hogwild)" if hogwild else ""))
+        if validation_split != 0.0:
+            print("Validation dataset size: "+str(val_x.shape[0])+"\n")
+        
+        #Validation, in the foreground or in the background
+        evaluator = None
+        if validation_split != 0.0:
+            #Imported here, as multiprocessing and concurrent.futures take a while to import
+            from . import evaluation
+            evaluator = evaluation.Evaluator(self, val_x, val_y, validation_batch_size, validation_freq, 
+                                             validation_subsample, validation_mode)
+        
+        #Data parallel training: the worker processes are forked here, and share the weights with this process
+        trainer = None
+        if workers > 1:
+            from . import parallel
+            trainer = parallel.ParallelTrainer(self, x, ohe_labels, workers, hogwild)
+        
+        callbacks = callbacks or []
+        self.stop_training = False
+        for callback in callbacks:
+            callback.on_train_begin(self)
+        
+        total_start = time.time()        
+        try:
+            for e in range(initial_epoch, epochs):
+                print("Epoch: "+str(e)+"/"+str(epochs))
+                for callback in callbacks:
+                    callback.on_epoch_begin(self, e)
+                start = time.time()
+                temp_error = 0
+                num_samples = 0
+                progress = "###" #shows a progress bar. Only for asthetics
+                num_batches = loader.num_batches() or 400
+                if trainer is not None:
+                    trainer.reset_stats()
+                if trainer is not None and hogwild:
+                    #Every worker trains on its own part of the data for the whole epoch
+                    temp_error = trainer.train_epoch(batch_size)
+                    num_samples = x.shape[0]
+                elif trainer is not None:
+                    for b in range(num_batches):
+                        error = trainer.train_batch(b*batch_size, (b+1)*batch_size)
+                        temp_error += error
+                        size = min(batch_size, x.shape[0] - num_samples)
+                        num_samples += size
+                        if pruning is not None:
+                            pruning.step(self)
+                        for callback in callbacks:
+                            callback.on_batch_end(self, b, error, size)
+                        if self.stop_training:
+                            break
+                        if b % max(num_batches//20, 1) == 0:
+                            print(progress,end = "\r")
+                else:
+                    for b, (batch_x, batch_y) in enumerate(loader):
+                        #Performs forward pass, backpropagation, weight updation for each batch of data samples and  
+                        #records cummulative loss for all data samples.
+                        if batch_y.ndim == 1:
+                            batch_y = metrics.one_hot(batch_y, num_classes, self.precision.compute_dtype)
+                        error = self.train_batch(batch_x, batch_y)
+                        temp_error += error
+                        num_samples += batch_x.shape[0]
+                        if pruning is not None:
+                            pruning.step(self)
+                        for callback in callbacks:
+                            callback.on_batch_end(self, b, error, batch_x.shape[0])
+                        if self.stop_training:
+                            break
+                    
+                        #Displaying the progress bar
+                        if b % max(num_batches//20, 1) == 0:
+                            print(progress,end = "\r")
+                
+                validated = len(self.epoch_acc)
+                self.end_epoch(start, temp_error, num_samples, trainer, evaluator)
+                logs = {"epoch_loss": self.epoch_loss[-1], "epoch_time": self.epoch_time[-1], "samples": num_samples,
+                        "epoch_acc": self.epoch_acc[-1] if len(self.epoch_acc) > validated else None}
+                for callback in callbacks:
+                    callback.on_epoch_end(self, e, logs)
+                
+                if checkpoint_path is not None and (e+1) % checkpoint_every == 0:
+                    self.save(checkpoint_path)
+                if self.stop_training:
+                    break
+            
+            if evaluator is not None:
+                self.record_validation(evaluator.collect(wait = True))
+        finally:
+            if trainer is not None:
+                trainer.close()
+            if evaluator is not None:
+                evaluator.close()
+        for callback in callbacks:
+            callback.on_train_end(self)
+
+        print("Time taken: "+str(round(time.time()-total_start,2))+" sec")
+    
+    def partial_fit(self,x = None,y = None,steps = 1,batch_size = None,replay = None,replay_samples = None):
+        """
+        Updates the network with a batch of new samples, Eg. labels that arrive continuously, without going
+        over the whole dataset again. Performs "steps" passes over the batch, each in mini-batches of
+        "batch_size" samples. The optimizer's state, the loss scale and pruning masks carry over between
+        calls, as between the batches of fit. Nothing is printed or plotted, and the per epoch history is
+        not changed.
+        
+        With a replay buffer (See pipeline.ReplayBuffer), every pass also trains on samples drawn from the 
+        buffer, so that the network doesn't forget older data, and the new samples are added to the buffer
+        afterwards, with their classes as ids. Without new samples, partial_fit trains on the buffer alone.
+        
+        Input:
+        -----
+        x: numpy.ndarray
+            New samples. Default = None (only samples from the replay buffer)
+        y: numpy.ndarray
+            Their classes, between 0 and the output size of the last layer - 1, or one hot encoded. The
+            number of classes is fixed by the last layer, so a batch may lack some of them.
+        steps: int
+            Number of passes over the batch. Default = 1
+        batch_size: int
+            Number of samples per update. Default = None (the whole batch in one update)
+        replay: pipeline.ReplayBuffer
+            Default = None
+        replay_samples: int
+            Number of samples drawn from the replay buffer for every pass. Default = None (as many as the
+            new samples, or batch_size without new samples)
+        
+        Output:
+        -------
+        loss: double
+            Average loss per sample of the last pass
+        """
+        if x is None and (replay is None or len(replay) == 0):
+            raise Exception("partial_fit needs new samples or a replay buffer that isn't empty")
+        if x is not None and y is None:
+            raise Exception("partial_fit needs the classes y of the new samples x")
+        if x is not None:
+            ohe_labels = self.one_hot(y)
+        if replay_samples is None:
+            replay_samples = x.shape[0] if x is not None else (batch_size or len(replay))
+        loss = 0.0
+        for step in range(steps):
+            batch_x = x
+            batch_y = ohe_labels if x is not None else None
+            if replay is not None and len(replay) > 0 and replay_samples > 0:
+                old_x, old_y = replay.sample(replay_samples)
+                old_y = self.one_hot(old_y)
+                batch_x = old_x if x is None else np.concatenate([x, old_x])
+                batch_y = old_y if x is None else np.concatenate([batch_y, old_y])
+            n = batch_x.shape[0]
+            size = batch_size or n
+            error = 0.0
+            for i in range(0, n, size):
+                error += self.train_batch(batch_x[i:i+size], batch_y[i:i+size])
+            loss = error / n
+        if replay is not None and x is not None:
+            #Class ids, whether y was given as ids or one hot encoded, so that calls can mix both
+            replay.add(x, ohe_labels.argmax(axis = 1))
+        return loss
+    
+    def one_hot(self,y):
+        """
+        One hot encodes class ids, with as many classes as the output size of the last layer
+        
+        Input:
+        -----
+        y: numpy.ndarray
+            Class ids, or one hot encoded labels (returned in the compute dtype)
+        
+        Output:
+        -------
+        ohe_labels: numpy.ndarray
+        """
+        num_classes = self.layers[-1].output_size
+        y = np.asarray(y)
+        if y.ndim == 1 and y.size and (y.min() < 0 or y.max() >= num_classes):
+            raise Exception("Class ids must be between 0 and "+str(num_classes - 1)+" (the output size of the last layer)")
+        return metrics.one_hot(y, num_classes, self.precision.compute_dtype).astype(self.precision.compute_dtype, copy = False)
+    
+    def end_epoch(self,start,temp_error,num_samples,trainer,evaluator):
+        """
+        Records and prints the statistics of an epoch: average loss, validation accuracy, time taken and
+        parallel speedup.
+        
+        Input:
+        -----
+        start: double
+            Time the epoch started at
+        temp_error: double
+            Cummulative loss of all training samples in the epoch
+        num_samples: int
+            Number of training samples
+        trainer: parallel.ParallelTrainer
+            The trainer used in data parallel training, else None
+        evaluator: evaluation.Evaluator
+            Validates the network if a validation set is used, else None
+        
+        Output:
+        -------
+            None
+        """
+        #Recording average loss for each epoch
+        self.epoch_loss.append(temp_error / num_samples)
+        
+        if evaluator is not None and evaluator.due(self.epoch):
+            print("\nValidating the model...")
+            evaluator.submit(self.epoch)
+            
+        #Recording time taken for each epoch
+        end = time.time()
+        self.epoch_time.append((end-start))
+        if trainer is not None:
+            self.epoch_efficiency.append(trainer.efficiency())
+            self.epoch_speedup.append(trainer.speedup())
+        if self.profiler is not None:
+            self.profiler.end_epoch(end-start)
+        self.epoch += 1
+        
+        print("Time taken: "+str(round(end-start,2))+" sec")
+        print("Time per input: "+str(round((end-start)/num_samples,3))+" sec")
+        print("Average training loss: "+str(round(temp_error/num_samples,3)))
+        if evaluator is not None:
+            self.record_validation(evaluator.collect())
+        if trainer is not None:
+            print("Speedup over 1 worker: "+str(round(trainer.speedup(),2))+"x (worker utilization "
+                  +str(round(trainer.efficiency(),2))+")")
+        print("=================================================================================\n")
+    
+    def record_validation(self,results):
+        """
+        Records and prints the validation accuracies returned by evaluation.Evaluator.collect()
+        
+        Input:
+        -----
+        results: list
+            List of (epoch, accuracy)
+        """
+        for epoch, val_acc in results:
+            self.epoch_acc.append(val_acc)
+            print("Validation Accuracy (epoch "+str(epoch)+") "+str(val_acc))
+    
+    def forward(self,x):
+        """
+        Performs the forward pass of a batch through all layers, keeping the state needed for backpropagation.
+        
+        Input:
+        -----
+        x: numpy.ndarray
+            Batch of samples
+        
+        Output:
+        -------
+        self.out: numpy.ndarray
+            Output of the last layer
+        """
+        if self.plan is not None:
+            self.out = self.plan.forward(x)
+            return self.out
+        data = x
+        for layer in self.layers:
+            #Set the input data for each layer, call the corresponding layer's compute() 
+            #method and pass the data to it. Passing data is redundant.
+            layer.data = data
+            data = layer.compute()
+        self.out = data
+        return self.out
+    
+    def forward_backward(self,x,ohe_labels):
+        """
+        Performs the forward pass and backpropagation of a batch, leaving the gradients in the layers 
+        without updating any weights.
+        
+        Input:
+        -----
+        x: numpy.ndarray
+            Batch of samples
+        ohe_labels: numpy.ndarray
+            One hot encoded labels of the batch
+        
+        Output:
+        -------
+        error: double
+            Summed loss of the batch
+        """
+        if self.plan is not None:
+            return self.plan.forward_backward(x, ohe_labels)
+        self.forward(x)
+        
+        #Calculating the loss of the batch. For a softmax output layer the loss is computed from its net output
+        #(the logits), fused with the softmax
+        last = self.layers[-1]
+        logits = last.net if getattr(last, "activation", None) == "softmax" else None
+        error = self.lossfunction(ohe_labels, self.out, logits)
+        
+        #Backpropagation. With loss scaling some steps overflow: update_wt() finds the non finite gradients
+        #and skips them, so numpy's warnings about them are silenced
+        scaled = self.precision.scaled()
+        with np.errstate(over = "ignore", invalid = "ignore") if scaled else np.errstate():
+            bp_data = self.out - ohe_labels
+            if scaled:
+                bp_data *= self.precision.loss_scale
+            for layer in self.layers[::-1]:
+                #Starting from the last layer, pass the calculated bp_data to backdrop(). This method
+                #returns an updated bp_data, which serves as an input to the next layer.
+                bp_data = layer.backprop(bp_data)
+        return error
+    
+    def train_batch(self,x,ohe_labels):
+        """
+        Performs forward pass, backpropagation and weight updation for one batch.
+        
+        Input:
+        -----
+        x: numpy.ndarray
+            Batch of samples
+        ohe_labels: numpy.ndarray
+            One hot encoded labels of the batch
+        
+        Output:
+        -------
+        error: double
+            Summed loss of the batch
+        """
+        error = self.forward_backward(x, ohe_labels)
+        self.update_wt()
+        return error
+    
+    def update_wt(self):
+        """
+        Updates the parameters of all layers after a backpropagation, with the network's optimizer 
+        if it has one, else by calling each layer's update_wt(). If the loss is scaled, the gradients
+        are unscaled first, the update is skipped if they overflowed, and it is applied to float32 master
+        copies of the parameters (See master_step()). Pruned weights stay 0.
+        With a parameter store (See pack_params()), all parameters are updated at once, and the 
+        gradients are clipped first if the store has a clip_norm.
+        """
+        store = self.store
+        params = self.params() if store is None else store.pairs()
+        if self.precision.scaled() and not self.precision.unscale(params):
+            return
+        if store is not None and store.clip_norm is not None:
+            store.clip_grad_norm(store.clip_norm)
+        if self.precision.scaled():
+            self.master_step(params)
+            return
+        if self.optimizer is not None:
+            self.optimizer.step(params)
+        else:
+            lrs = set(layer.lr for layer in self.layers if hasattr(layer, "lr"))
+            if store is None or len(lrs) != 1:
+                for layer in self.layers:
+                    layer.update_wt()
+                return
+            store.sgd_step(lrs.pop())
+        for layer in self.layers:
+            if getattr(layer, "mask", None) is not None:
+                layer.apply_mask()
+    
+    def master_step(self,params):
+        """
+        Weight update of mixed precision training. The optimizer (or each layer's gradient descent) updates 
+        float32 master copies of the parameters, which are then rounded into the float16 parameters the
+        layers compute with. Updates smaller than the float16 spacing of a weight accumulate in its master
+        copy instead of being rounded away.
+        
+        Input:
+        -----
+        params: list
+            List of (parameter, unscaled gradient) pairs, as given to the optimizer
+        """
+        master = self.master_params(params)
+        if self.optimizer is not None:
+            self.optimizer.step([(copy, grad) for copy, (param, grad) in zip(master, params)])
+        for layer, param_name, grad_name, copy in self.master_entries(master):
+            if self.optimizer is None:
+                copy -= np.multiply(getattr(layer, grad_name), layer.lr)
+            if param_name == "weight" and getattr(layer, "mask", None) is not None:
+                np.multiply(copy, layer.mask, out = copy)
+        for copy, (param, grad) in zip(master, params):
+            np.copyto(param, copy, casting = "same_kind")
+    
+    def master_params(self,params):
+        """
+        Returns the float32 master copies of the parameters, in the order of params. They are made from the
+        parameters the first time, and again when the parameters were repacked, the layers changed or 
+        reset_master() was called.
+        """
+        master = self.master
+        if master is None or len(master) != len(params) or any(copy.shape != param.shape for copy, (param, grad) in zip(master, params)):
+            self.master = master = [param.astype(np.float32) for param, grad in params]
+        return master
+    
+    def master_entries(self,master):
+        """
+        Yields (layer, parameter name, gradient name, master copy) for every parameter of every layer.
+        With a parameter store the master copies are views of one flat array.
+        """
+        if self.store is not None:
+            for layer, param_name, grad_name, offset, shape in self.store.entries:
+                yield layer, param_name, grad_name, master[0][offset:offset+int(np.prod(shape))].reshape(shape)
+            return
+        i = 0
+        for layer in self.layers:
+            for param_name, grad_name in zip(layer.param_names, layer.grad_names):
+                yield layer, param_name, grad_name, master[i]
+                i += 1
+    
+    def reset_master(self):
+        """
+        Drops the master copies of the parameters, so that they are made again from the parameters. Called
+        after the parameters were written in place (Eg. by callbacks.BestWeights).
+        """
+        self.master = None
+    
+    def params(self):
+        """
+        Returns the parameters of all layers together with their gradients
+        
+        Output:
+        -------
+        params: list
+            List of (parameter, gradient) pairs
+        """
+        params = []
+        for layer in self.layers:
+            params.extend(layer.params())
+        return params
+    
+    def pack_params(self,clip_norm = None):
+        """
+        Packs the parameters and gradients of all layers into two flat contiguous arrays (See 
+        parameters.py), so that the optimizer step, gradient clipping and norms, checkpoints and data 
+        parallel gradient reduction each work on one array. The optimizer's state is packed the same way.
+        Adding a layer unpacks the parameters; call pack_params() again afterwards.
+        
+        Input:
+        -----
+        clip_norm: double
+            If given, the gradients are scaled down to this norm before every update, when their norm is
+            larger. Default = None
+        
+        Output:
+        -------
+        store: parameters.ParameterStore
+        """
+        state = self.optimizer.state if self.optimizer is not None else None
+        if state is not None and self.store is None and len(state) == len(self.params()):
+            #Each state entry (Eg. the velocities) is concatenated in the order of the parameters
+            self.optimizer.state = [{key: np.concatenate([s[key].ravel() for s in state]) for key in state[0]}]
+        self.store = ParameterStore(self, clip_norm = clip_norm)
+        return self.store
+    
+    def compile(self,batch_size = 256):
+        """
+        Builds a static execution plan for the network (See compiler.py), used from then on by the forward 
+        pass, backpropagation and predict(). Activation functions are resolved once, Flatten layers are 
+        folded into the following Dense layer and all activation and error buffers come from one 
+        preallocated arena. Adding a layer discards the plan; call compile() again afterwards.
+        
+        Input:
+        -----
+        batch_size: int
+            Number of samples the arena is first allocated for. It grows if a larger batch comes.
+            Default = 256
+        
+        Output:
+        -------
+        plan: compiler.ExecutionPlan
+        """
+        from . import compiler
+        self.plan = compiler.ExecutionPlan(self, batch_size)
+        if self.profiler is not None:
+            #Re-attach, so that the plan is profiled too
+            self.profiler.detach()
+            self.profiler.attach(self)
+        return self.plan
+    
+    def snapshot(self):
+        """
+        Returns a copy of the network for inference, with copies of the current weights, so it can be
+        used (Eg. for validation in the background) while this network keeps training. The optimizer 
+        and the profiler are not copied.
+        
+        Output:
+        -------
+        nw: Network
+        """
+        #Shallow copies, without the methods the profiler wrapped on the instances
+        def copy(obj):
+            clone = object.__new__(type(obj))
+            clone.__dict__ = {k: v for k, v in vars(obj).items() if not isinstance(v, types.FunctionType)}
+            return clone
+        
+        nw = copy(self)
+        nw.optimizer = None
+        nw.profiler = None
+        nw.plan = None
+        nw.store = None
+        nw.master = None
+        nw.layers = []
+        nw.curr = None
+        for layer in self.layers:
+            layer = copy(layer)
+            for name in layer.param_names:
+                setattr(layer, name, getattr(layer, name).copy())
+            layer.prev = nw.curr
+            layer.next = None
+            if nw.curr is not None:
+                nw.curr.next = layer
+            nw.layers.append(layer)
+            nw.curr = layer
+        return nw
+    
+    def predict(self,x,batch_size = 256,probabilities = False):
+        """
+        Uses the trained neural network and predicts the output for each input sample.
+        Samples are run through the network in batches of "batch_size", see predict_batches().
+        
+        Input:
+        -----
+        x: numpy.matrix or pipeline.DataLoader
+            Independent variables of the test data.
+        batch_size: int
+            Number of samples passed through the network at once. Default = 256
+        probabilities: bool
+            If True, returns the output of the last layer (class probabilities) instead of 
+            the class with highest probability. Default = False
+            
+        Output:
+        -------
+        y_pred: numpy.ndarray
+            Predicted class for each input data sample, or an array of shape (samples, classes)
+            holding the probabilities if "probabilities" is True
+        """
+        if isinstance(x, pipeline.DataLoader):
+            num_samples = x.num_samples()
+            num_batches = x.num_batches() or 400
+        else:
+            num_samples = x.shape[0]
+            num_batches = math.ceil(x.shape[0] / batch_size)
+        y_pred = None
+        chunks = []
+        progress = "---" #shows a progress bar. Only for asthetics
+        i = 0
+        for b, pred in enumerate(self.predict_batches(x, batch_size, probabilities)):
+            #Displaying the progress bar
+            if b % max(num_batches//20, 1) == 0:
+                print(progress,end = "\r")
+            
+            if num_samples is None:
+                #Unknown number of samples (DataLoader over an iterable): the batches are joined at the end
+                chunks.append(pred)
+                continue
+            if y_pred is None:
+                y_pred = np.empty((num_samples,)+pred.shape[1:], dtype = pred.dtype)
+            y_pred[i:i+pred.shape[0]] = pred
+            i += pred.shape[0]
+        if num_samples is None:
+            y_pred = np.concatenate(chunks)
+
+        self.ypred =  y_pred
+        return y_pred
+    
+    def predict_batches(self,x,batch_size = 256,probabilities = False):
+        """
+        Generator that runs inference batch by batch and yields the predictions of each batch.
+        Every layer writes its output into a buffer that is allocated for the first batch and
+        reused for all following batches, and the layers' training state is left untouched.
+        Useful for inputs that are too large to hold in memory, as x can also be any iterable 
+        of chunks (Eg. read from disk), which are split into batches of at most "batch_size".
+        
+        Input:
+        -----
+        x: numpy.ndarray, iterable or pipeline.DataLoader
+            Independent variables of the test data, an iterable yielding chunks of them, or a DataLoader.
+        batch_size: int
+            Number of samples passed through the network at once. Default = 256
+        probabilities: bool
+            If True, yields the output of the last layer (class probabilities) instead of 
+            the class with highest probability. Default = False
+            
+        Output:
+        -------
+        y_pred: numpy.ndarray
+            Predictions for one batch, yielded once per batch
+        """
+        buffers = [None] * len(self.layers)
+        for batch in self.batches(x, batch_size):
+            n = batch.shape[0]
+            data = batch
+            #Forward Pass, through the compiled plan if there is one
+            plan = self.plan
+            if plan is not None:
+                data = plan.infer(batch)
+            for i, layer in enumerate(self.layers if plan is None else []):
+                #Reuse the layer's buffer if it is large enough, else let the layer allocate a
+                #new one and keep it for the following batches
+                if buffers[i] is not None and buffers[i].shape[0] >= n:
+                    data = layer.infer(data, buffers[i][:n])
+                else:
+                    data = layer.infer(data)
+                    buffers[i] = data
+            
+            if probabilities:
+                yield data.copy()
+            else:
+                #Recording the class with highest probability
+                yield np.argmax(data,axis = 1)
+    
+    def batches(self,x,batch_size):
+        """
+        Splits the data into batches of at most "batch_size" samples.
+        
+        Input:
+        -----
+        x: numpy.ndarray, iterable or pipeline.DataLoader
+            Array of samples, or an iterable yielding chunks (arrays) of samples, or a DataLoader, whose 
+            batches are used as they are (with the DataLoader's batch size).
+        batch_size: int
+            Maximum number of samples per batch
+            
+        Output:
+        -------
+        batch: numpy.ndarray
+            Yielded once per batch
+        """
+        if isinstance(x, pipeline.DataLoader):
+            for batch_x, batch_y in x:
+                yield batch_x
+            return
+        chunks = [x] if hasattr(x, "shape") else x
+        for chunk in chunks:
+            chunk = np.asarray(chunk)
+            for i in range(0, chunk.shape[0], batch_size):
+                yield chunk[i:i+batch_size]
+    
+    def accuracy(self,pred,true):
+        """
+        Calculates the accuracy of the predicted classes by comparing them to true classes
+        
+        Input:
+        -----
+        pred: numpy.ndarray or list
+            Predicted classes, or predicted probabilities (one row per sample)
+        true: numpy.ndarray or list
+            True classes, or one hot encoded true values
+            
+        Output:
+        -------
+        acc: double
+            Accuracy of the predicted classes.
+        """
+        return metrics.accuracy(pred, true)
+    
+    def evaluate(self,x,y,batch_size = 256):
+        """
+        Calculates the accuracy of the network on a dataset. The predictions are compared to the true
+        classes one batch at a time, so they are never all held in memory.
+        
+        Input:
+        -----
+        x: numpy.ndarray
+            Independent variables of the data
+        y: numpy.ndarray
+            True classes
+        batch_size: int
+            Number of samples passed through the network at once. Default = 256
+            
+        Output:
+        -------
+        acc: double
+            Accuracy of the predicted classes.
+        """
+        acc = metrics.Accuracy()
+        start = 0
+        for pred in self.predict_batches(x, batch_size):
+            acc.update(pred, y[start:start+pred.shape[0]])
+            start += pred.shape[0]
+        return acc.result()
+    
+    def plot(self,x,label,title):
+        """
+        Plots a per epoch statistic (Eg. self.epoch_loss). See plotting.py; matplotlib and seaborn are 
+        only imported when this is called.
+        """
+        from . import plotting
+        plotting.plot(x, label, title)
+
+    def lossfunction(self,true,pred,logits = None):
+        """
+        Calculates the loss using cross entropy (in bits, i.e. with log base 2), summed over all samples in the batch.
+        If the logits of the softmax layer are given, the loss is computed from them with log-sum-exp (See 
+        metrics.softmax_cross_entropy()), else from the predicted probabilities, clipped away from 0.
+        
+        Input:
+        -----
+        pred: numpy.ndarray
+            Predicted values, one row per sample
+        true: numpy.ndarray
+            True values (one hot encoded), one row per sample
+        logits: numpy.ndarray
+            Net output of the softmax layer, one row per sample. Default = None
+        
+        Outut:
+        ------
+        error double
+            loss calculated using cross entropy
+        """
+        if logits is not None:
+            loss = metrics.softmax_cross_entropy(logits, true)
+        else:
+            loss = metrics.cross_entropy(pred, true)
+        return float(loss.sum()) / math.log(2)
+    
+    def save(self,path):
+        """
+        Saves the network to a checkpoint file (See checkpoint.py): the layers and their configuration,
+        the precision policy, all weights and biases, the optimizer with its state, the epoch counter and
+        the per epoch history. The weights are stored contiguously, so load() can memory map them. Packed
+        parameters (See pack_params()) are stored as one array, and are packed again by load().
+        
+        Input:
+        -----
+        path: str
+        
+        Output:
+        -------
+            None
+        """
+        arrays = []
+        layers = []
+        flat = None
+        packed = set()
+        if self.store is not None:
+            #The packed parameters are written as one array
+            flat = {"index": 0, "clip_norm": self.store.clip_norm}
+            arrays.append(self.store.params)
+            packed = set((id(layer), name) for layer, name, grad, offset, shape in self.store.entries)
+        for layer in self.layers:
+            params = []
+            for name in layer.param_names:
+                if (id(layer), name) in packed:
+                    params.append(None)
+                    continue
+                params.append(len(arrays))
+                arrays.append(getattr(layer, name))
+            layers.append({"type": type(layer).__name__, "config": layer.get_config(), "params": params})
+        
+        optimizer = None
+        if self.optimizer is not None:
+            optimizer = optimizers.get_config(self.optimizer)
+            optimizer["iterations"] = self.optimizer.iterations
+            optimizer["state"] = None
+            if self.optimizer.state is not None:
+                optimizer["state"] = []
+                for state in self.optimizer.state:
+                    optimizer["state"].append({key: len(arrays) + i for i, key in enumerate(state)})
+                    arrays.extend(state.values())
+        
+        header = {
+            "precision": {"name": self.precision.name, "loss_scale": self.precision.loss_scale, 
+                          "growth_interval": self.precision.growth_interval, 
+                          "good_steps": self.precision.good_steps},
+            "layers": layers,
+            "flat_params": flat,
+            "optimizer": optimizer,
+            "epoch": self.epoch,
+            "history": {"epoch_loss": [float(v) for v in self.epoch_loss], 
+                        "epoch_acc": [float(v) for v in self.epoch_acc],
+                        "epoch_time": self.epoch_time, 
+                        "epoch_efficiency": self.epoch_efficiency,
+                        "epoch_speedup": self.epoch_speedup},
+        }
+        checkpoint.save(path, header, arrays)
+    
+    @classmethod
+    def load(cls,path,mmap_mode = "r"):
+        """
+        Loads a network saved with save(). 
+        
+        Input:
+        -----
+        path: str
+        mmap_mode: str
+            "r": weights are read only, zero copy views of the file, shared between all processes that 
+                 load it. For inference.
+            "c": weights are copy on write views of the file. Training them doesn't change the file.
+            None: weights are read into memory.
+            Default = "r"
+        
+        Output:
+        -------
+        nw: Network
+        """
+        header, arrays = checkpoint.load(path, mmap_mode)
+        
+        prec = header["precision"]
+        precision = Precision(prec["name"], prec["loss_scale"], prec["growth_interval"])
+        precision.good_steps = prec["good_steps"]
+        
+        optimizer = None
+        if header["optimizer"] is not None:
+            optimizer = optimizers.from_config(header["optimizer"])
+            optimizer.iterations = header["optimizer"]["iterations"]
+            if header["optimizer"]["state"] is not None:
+                #Optimizer state is always updated in place, so it is copied out of the file
+                optimizer.state = [{key: np.array(arrays[i]) for key, i in state.items()} 
+                                   for state in header["optimizer"]["state"]]
+        
+        nw = cls(optimizer = optimizer, precision = precision)
+        for spec in header["layers"]:
+            if spec["type"] not in LAYER_TYPES:
+                raise Exception("Unknown layer type: "+str(spec["type"]))
+            layer = LAYER_TYPES[spec["type"]](**spec["config"])
+            nw.add(layer)
+            for name, i in zip(layer.param_names, spec["params"]):
+                if i is not None:
+                    setattr(layer, name, arrays[i])
+        flat = header.get("flat_params")
+        if flat is not None:
+            #The layers' parameters become views of the flat array read from the file
+            nw.store = ParameterStore(nw, params = arrays[flat["index"]], copy = False, clip_norm = flat["clip_norm"])
+        
+        nw.epoch = header["epoch"]
+        nw.epoch_loss = header["history"]["epoch_loss"]
+        nw.epoch_acc = header["history"]["epoch_acc"]
+        nw.epoch_time = header["history"]["epoch_time"]
+        nw.epoch_efficiency = header["history"]["epoch_efficiency"]
+        nw.epoch_speedup = header["history"].get("epoch_speedup", [])
+        return nw
+    
+    def profile(self,enabled = True,track_memory = False):
+        """
+        Turns the profiler on or off. While on, every layer's forward pass, backpropagation and weight
+        updation, the optimizer, the loss function and validation are timed, and the timings are aggregated
+        per epoch (See profiler.py). Should be turned on after all layers and the optimizer are set.
+        
+        Input:
+        -----
+        enabled: bool
+            Turn the profiler on (True) or off (False). Default = True
+        track_memory: bool
+            Also record the bytes allocated by each call. Slows down training. Default = False
+        
+        Output:
+        -------
+        profiler: profiler.Profiler
+            The profiler, holding the records. Still readable after the profiler is turned off.
+        """
+        prof = self.profiler
+        if prof is not None:
+            prof.detach()
+            self.profiler = None
+        if enabled:
+            self.profiler = profiler.Profiler(track_memory)
+            self.profiler.attach(self)
+            return self.profiler
+        return prof
+    
+    def describe(self):
+        print("Precision: "+self.precision.name)
+        header = "Layer Type\tInput\tOutput\tMACs"
+        if self.profiler is not None:
+            header += "\t\tGFLOP/s"
+        print(header)
+        print("=============================================================")
+        total = 0
+        for i, layer in enumerate(self.layers):
+            ltype = layer.name
+            try:
+                if hasattr(layer, "macs"):
+                    #Convolution and pooling layers, (channels, rows, cols) per sample
+                    ipsize = "x".join(str(d) for d in layer.input_shape)
+                    opsize = "x".join(str(d) for d in layer.output_shape)
+                    macs = str(layer.macs())
+                else:
+                    ipsize = str(layer.input_size)
+                    opsize = str(layer.output_size)
+                    #Sparse layers only multiply their stored weights
+                    macs = str(layer.nnz if hasattr(layer, "nnz") else layer.input_size*layer.output_size)
+            except (AttributeError, TypeError):
+                ipsize = "--"
+                opsize = "--"
+                macs = "--"
+            line = ltype+"\t\t"+ipsize+"\t  "+opsize+"\t  "+macs
+            if self.profiler is not None:
+                #Achieved GFLOP/s of the forward and backward passes, measured by the profiler
+                gflops = self.profiler.layer_gflops(str(i)+":"+layer.name)
+                line += "\t\t"+("--" if gflops is None else str(round(gflops,2)))
+            print(line)
+            total += int(macs) if macs.isdigit() else 0
+        print("=============================================================")
+        print("Total MACs per sample: "+str(total))
@@ -0,0 +1,340 @@
+"""
+Optimizers and learning rate schedules
+---
+
+An optimizer is owned by the Network and updates the parameters of all layers after each backpropagation.
+Every layer exposes its parameters as a list of (parameter, gradient) pairs through params(), and the
+optimizer updates each parameter in place. Any state (velocities, moment estimates) and scratch space
+is allocated once, the first time a parameter is seen, so a step doesn't allocate any new arrays.
+
+```
+nw = Network(optimizer = Adam(lr = 0.001, schedule = WarmupSchedule(500, CosineSchedule(5000))))
+```
+
+Available optimizers: SGD (with optional momentum and Nesterov momentum), Adam, RMSProp
+Available schedules: StepSchedule, CosineSchedule, WarmupSchedule
+"""
+
+import math
+import numpy as np
+
+################################################################################
+#
+# OPTIMIZERS
+#
+################################################################################
+
+class Optimizer:
+    """
+    Base class of all optimizers. Subclasses define init_state() and update().
+
+    Parameters:
+    -----------
+    lr: double
+        Base learning rate
+    schedule: callable
+        Optional learning rate schedule, called as schedule(lr, iterations) before every step.
+        Default = None (constant learning rate)
+    iterations: int
+        Number of steps taken so far
+    state: list
+        State of each parameter (dict of numpy.ndarray), in the order the parameters are passed to step()
+    """
+
+    def __init__(self,lr = 0.01,schedule = None):
+        self.lr = lr
+        self.schedule = schedule
+        self.iterations = 0
+        self.state = None
+
+    def current_lr(self):
+        """
+        Returns the learning rate used for the next step, after applying the schedule
+        """
+        if self.schedule is None:
+            return self.lr
+        return self.schedule(self.lr, self.iterations)
+
+    def step(self,params):
+        """
+        Updates all parameters in place, using their gradients.
+
+        Input:
+        -----
+        params: list
+            List of (parameter, gradient) pairs. Must be the same parameters, in the same order, on every call.
+
+        Output:
+        -------
+            None
+        """
+        if self.state is None or len(self.state) != len(params):
+            self.state = [self.init_state(param) for param, grad in params]
+        lr = self.current_lr()
+        self.iterations += 1
+        for (param, grad), state in zip(params, self.state):
+            self.update(param, grad, state, lr)
+
+    def init_state(self,param):
+        """
+        Allocates the state of one parameter.
+
+        Input:
+        -----
+        param: numpy.ndarray
+
+        Output:
+        -------
+        state: dict
+        """
+        return {"scratch": self.zeros(param)}
+
+    def zeros(self,param):
+        """
+        Allocates a zero array the shape of param. State is kept in at least float32, even for float16 parameters.
+        """
+        return np.zeros(param.shape, dtype = np.result_type(param.dtype, np.float32))
+
+    def update(self,param,grad,state,lr):
+        """
+        Updates one parameter in place.
+
+        Input:
+        -----
+        param: numpy.ndarray
+        grad: numpy.ndarray
+        state: dict
+            State returned by init_state() for this parameter
+        lr: double
+            Learning rate for this step
+        """
+        raise NotImplementedError
+
+class SGD(Optimizer):
+    """
+    Stochastic gradient descent, with optional (Nesterov) momentum.
+
+    Parameters:
+    -----------
+    momentum: double
+        Momentum factor. Default = 0.0 (plain SGD)
+    nesterov: bool
+        Use Nesterov momentum. Default = False
+    """
+
+    def __init__(self,lr = 0.01,momentum = 0.0,nesterov = False,schedule = None):
+        super().__init__(lr, schedule)
+        self.momentum = momentum
+        self.nesterov = nesterov
+
+    def init_state(self,param):
+        state = super().init_state(param)
+        if self.momentum:
+            state["velocity"] = self.zeros(param)
+        return state
+
+    def update(self,param,grad,state,lr):
+        scratch = state["scratch"]
+        np.multiply(grad, lr, out = scratch)
+        if not self.momentum:
+            param -= scratch
+            return
+
+        #v = momentum * v - lr * grad
+        velocity = state["velocity"]
+        velocity *= self.momentum
+        velocity -= scratch
+        if self.nesterov:
+            #param += momentum * v - lr * grad
+            param -= scratch
+            np.multiply(velocity, self.momentum, out = scratch)
+            param += scratch
+        else:
+            param += velocity
+
+class Adam(Optimizer):
+    """
+    Adam optimizer
+
+    Parameters:
+    -----------
+    beta1: double
+        Decay rate of the first moment estimate. Default = 0.9
+    beta2: double
+        Decay rate of the second moment estimate. Default = 0.999
+    epsilon: double
+        Added to the denominator for numerical stability. Default = 1e-8
+    """
+
+    def __init__(self,lr = 0.001,beta1 = 0.9,beta2 = 0.999,epsilon = 1e-8,schedule = None):
+        super().__init__(lr, schedule)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+
+    def init_state(self,param):
+        state = super().init_state(param)
+        state["m"] = self.zeros(param)
+        state["v"] = self.zeros(param)
+        return state
+
+    def update(self,param,grad,state,lr):
+        scratch, m, v = state["scratch"], state["m"], state["v"]
+
+        #m = beta1 * m + (1 - beta1) * grad
+        m *= self.beta1
+        np.multiply(grad, 1 - self.beta1, out = scratch)
+        m += scratch
+
+        #v = beta2 * v + (1 - beta2) * grad^2
+        v *= self.beta2
+        np.multiply(grad, grad, out = scratch)
+        scratch *= 1 - self.beta2
+        v += scratch
+
+        #param -= lr_t * m / (sqrt(v) + epsilon), with the bias correction folded into lr_t
+        t = self.iterations
+        lr_t = lr * math.sqrt(1 - self.beta2 ** t) / (1 - self.beta1 ** t)
+        np.sqrt(v, out = scratch)
+        scratch += self.epsilon
+        np.divide(m, scratch, out = scratch)
+        scratch *= lr_t
+        param -= scratch
+
+class RMSProp(Optimizer):
+    """
+    RMSProp optimizer
+
+    Parameters:
+    -----------
+    rho: double
+        Decay rate of the moving average of squared gradients. Default = 0.9
+    epsilon: double
+        Added to the denominator for numerical stability. Default = 1e-8
+    """
+
+    def __init__(self,lr = 0.001,rho = 0.9,epsilon = 1e-8,schedule = None):
+        super().__init__(lr, schedule)
+        self.rho = rho
+        self.epsilon = epsilon
+
+    def init_state(self,param):
+        state = super().init_state(param)
+        state["square_avg"] = self.zeros(param)
+        return state
+
+    def update(self,param,grad,state,lr):
+        scratch, square_avg = state["scratch"], state["square_avg"]
+
+        #square_avg = rho * square_avg + (1 - rho) * grad^2
+        square_avg *= self.rho
+        np.multiply(grad, grad, out = scratch)
+        scratch *= 1 - self.rho
+        square_avg += scratch
+
+        #param -= lr * grad / (sqrt(square_avg) + epsilon)
+        np.sqrt(square_avg, out = scratch)
+        scratch += self.epsilon
+        np.divide(grad, scratch, out = scratch)
+        scratch *= lr
+        param -= scratch
+
+################################################################################
+#
+# LEARNING RATE SCHEDULES
+#
+################################################################################
+
+class StepSchedule:
+    """
+    Multiplies the learning rate by "gamma" every "step_size" iterations.
+    """
+
+    def __init__(self,step_size,gamma = 0.1):
+        self.step_size = step_size
+        self.gamma = gamma
+
+    def __call__(self,lr,iterations):
+        return lr * self.gamma ** (iterations // self.step_size)
+
+class CosineSchedule:
+    """
+    Decays the learning rate from lr to "min_lr" along a half cosine over "total_steps" iterations,
+    and keeps it at "min_lr" afterwards.
+    """
+
+    def __init__(self,total_steps,min_lr = 0.0):
+        self.total_steps = total_steps
+        self.min_lr = min_lr
+
+    def __call__(self,lr,iterations):
+        progress = min(iterations / self.total_steps, 1.0)
+        return self.min_lr + (lr - self.min_lr) * 0.5 * (1 + math.cos(math.pi * progress))
+
+class WarmupSchedule:
+    """
+    Increases the learning rate linearly from 0 to lr over "warmup_steps" iterations. After that, the
+    learning rate is given by "schedule" (counting iterations from the end of the warmup), or stays at lr.
+    """
+
+    def __init__(self,warmup_steps,schedule = None):
+        self.warmup_steps = warmup_steps
+        self.schedule = schedule
+
+    def __call__(self,lr,iterations):
+        if iterations < self.warmup_steps:
+            return lr * (iterations + 1) / self.warmup_steps
+        if self.schedule is None:
+            return lr
+        return self.schedule(lr, iterations - self.warmup_steps)
+
+################################################################################
+#
+# SERIALIZATION
+#
+################################################################################
+
+def get_config(obj):
+    """
+    Describes an optimizer or schedule as a JSON serializable dict, holding its class name and its
+    hyperparameters. Nested schedules are described recursively. The optimizer's state and iteration
+    count are not included (See Network.save()).
+
+    Input:
+    -----
+    obj: Optimizer or schedule
+
+    Output:
+    -------
+    config: dict
+    """
+    config = {}
+    for key, value in vars(obj).items():
+        if key in ("state", "iterations"):
+            continue
+        if value is not None and not isinstance(value, (int, float, bool, str)):
+            value = get_config(value)
+        config[key] = value
+    return {"type": type(obj).__name__, "config": config}
+
+def from_config(config):
+    """
+    Creates an optimizer or schedule from a dict returned by get_config()
+
+    Input:
+    -----
+    config: dict
+
+    Output:
+    -------
+    obj: Optimizer or schedule
+    """
+    classes = {cls.__name__: cls for cls in (SGD, Adam, RMSProp, StepSchedule, CosineSchedule, WarmupSchedule)}
+    if config["type"] not in classes:
+        raise Exception("Unknown optimizer or schedule: "+str(config["type"]))
+    kwargs = {}
+    for key, value in config["config"].items():
+        if isinstance(value, dict):
+            value = from_config(value)
+        kwargs[key] = value
+    return classes[config["type"]](**kwargs)
@@ -0,0 +1,313 @@
+"""
+Data parallel training
+---
+
+Runs Network.fit on several CPU cores. A pool of worker processes is forked from the training process,
+so every worker inherits the network and the training data without anything being pickled.
+
+The parameters of all layers are moved into one multiprocessing.shared_memory block, which the training
+process and all workers see, and every worker gets its own slot in a second shared block for its gradients
+(See parameters.py: the network's ParameterStore, or a new one, is bound to the shared blocks).
+
+Synchronous mode (default): each batch is split into one shard per worker. Every worker runs the forward
+pass and backpropagation over its shard and writes its gradients into its slot. The training process
+reduces the slots into one batch gradient with a single matrix-vector product and updates the weights
+(with the network's optimizer) in place, where the workers see them for the next batch.
+
+Hogwild mode: the training data is split into one partition per worker for the whole epoch, and every
+worker updates the shared weights with its own gradients after each of its batches, without any locking.
+The update is the network's (Network.update_wt()): its optimizer if it has one, else the layers' plain
+gradient descent. Every worker keeps its own copy of the optimizer's state (Eg. Adam's moments), which
+starts from the state the network had when the workers were forked.
+
+The speedup reported for every epoch is the training throughput (samples per second) divided by the
+throughput of one process training the same network with the same batch size, measured on a copy of the
+network before the first batch (See reference_throughput()).
+
+```
+nw.fit(x = train_data, y = train_labels, epochs = 5, batch_size = 256, workers = 8)
+```
+
+Workers are forked, so this only works on platforms with the "fork" start method (Eg. Linux). Limiting
+each process' BLAS threads (Eg. OMP_NUM_THREADS=1) avoids oversubscribing the cores.
+"""
+
+import copy
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from .parameters import ParameterStore
+
+class ParallelTrainer:
+    """
+    Pool of worker processes training one network on shards of each batch.
+
+    Parameters:
+    -----------
+    network: Network
+        The network to train. Its parameters are moved into shared memory until close() is called.
+    x: numpy.ndarray
+        Training data
+    ohe_labels: numpy.ndarray
+        One hot encoded training labels
+    workers: int
+        Number of worker processes
+    hogwild: bool
+        Use asynchronous Hogwild updates instead of synchronous gradient reduction. Default = False
+    busy_time: double
+        Seconds spent computing by all workers since the last reset_stats()
+    wall_time: double
+        Seconds spent waiting for the workers since the last reset_stats()
+    train_time: double
+        Seconds spent in train_batch() and train_epoch(), including the weight updates, since the last
+        reset_stats()
+    samples: int
+        Number of samples trained on since the last reset_stats()
+    reference: double
+        Samples per second of one process, measured by reference_throughput(). Default = None (not 
+        measured yet)
+    """
+
+    def __init__(self,network,x,ohe_labels,workers,hogwild = False):
+        if hogwild and network.precision.scaled():
+            raise Exception("Hogwild training doesn't support loss scaling ("+network.precision.name+")")
+        self.network = network
+        self.x = x
+        self.ohe_labels = ohe_labels
+        self.workers = workers
+        self.hogwild = hogwild
+        self.busy_time = 0.0
+        self.wall_time = 0.0
+        self.train_time = 0.0
+        self.samples = 0
+        self.reference = None
+
+        #Shared parameter block, and one gradient slot per worker. The training process' own gradients
+        #(the reduced ones) are private.
+        params = network.params()
+        self.sizes = [param.size for param, grad in params]
+        total = sum(self.sizes)
+        param_dtype = params[0][0].dtype if params else np.dtype(np.float32)
+        grad_dtype = network.precision.compute_dtype
+        self.param_shm = shared_memory.SharedMemory(create = True, size = max(total * param_dtype.itemsize, 1))
+        self.grad_shm = shared_memory.SharedMemory(create = True, size = max(workers * total * grad_dtype.itemsize, 1))
+        self.flat_params = np.ndarray((total,), dtype = param_dtype, buffer = self.param_shm.buf)
+        self.worker_grads = np.ndarray((workers, total), dtype = grad_dtype, buffer = self.grad_shm.buf)
+        self.worker_grads.fill(0)
+        self.flat_grads = np.zeros(total, dtype = grad_dtype)
+        if network.store is not None:
+            self.store = network.store
+            self.store.bind(self.flat_params, self.flat_grads, copy = True)
+        else:
+            self.store = ParameterStore(network, self.flat_params, self.flat_grads)
+
+        #Fork the workers. They inherit the network, now pointing at the shared parameters.
+        context = multiprocessing.get_context("fork")
+        self.conns = []
+        self.processes = []
+        for rank in range(workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target = self.worker, args = (rank, child_conn), daemon = True)
+            process.start()
+            child_conn.close()
+            self.conns.append(parent_conn)
+            self.processes.append(process)
+
+    def worker(self,rank,conn):
+        """
+        Main loop of a worker process. Receives commands from the training process until it gets None.
+
+        Input:
+        -----
+        rank: int
+            Index of the worker, and of its gradient slot
+        conn: multiprocessing.connection.Connection
+        """
+        network = self.network
+        self.store.bind(self.flat_params, self.worker_grads[rank], copy = False)
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            start, stop, batch_size, loss_scale = msg
+            #The training process adjusts the loss scale after the workers were forked
+            network.precision.loss_scale = loss_scale
+            begin = time.perf_counter()
+            loss = 0.0
+            if batch_size is None:
+                #Synchronous: compute the gradients of one shard
+                if stop > start:
+                    loss = network.forward_backward(self.x[start:stop], self.ohe_labels[start:stop])
+                else:
+                    self.worker_grads[rank].fill(0)
+            else:
+                #Hogwild: train on the whole partition, updating the shared weights after every batch
+                for i in range(start, stop, batch_size):
+                    j = min(i + batch_size, stop)
+                    loss += network.train_batch(self.x[i:j], self.ohe_labels[i:j])
+            conn.send((float(loss), time.perf_counter() - begin))
+        conn.close()
+
+    def run(self,ranges,batch_size = None):
+        """
+        Sends one (start, stop) range to each worker, with the current loss scale, and waits for all of
+        them.
+
+        Output:
+        -------
+        loss: double
+            Summed loss of all samples
+        """
+        begin = time.perf_counter()
+        loss_scale = self.network.precision.loss_scale
+        for conn, (start, stop) in zip(self.conns, ranges):
+            conn.send((start, stop, batch_size, loss_scale))
+        loss = 0.0
+        for conn in self.conns:
+            worker_loss, busy = conn.recv()
+            loss += worker_loss
+            self.busy_time += busy
+        self.wall_time += time.perf_counter() - begin
+        return loss
+
+    def split(self,start,stop):
+        """
+        Splits the range [start, stop) into one contiguous shard per worker.
+        """
+        bounds = np.linspace(start, stop, self.workers + 1).astype(int)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def train_batch(self,start,stop):
+        """
+        Synchronous step: every worker computes the gradients of its shard of samples [start, stop),
+        the gradients are averaged (weighted by shard size) and the network's weights are updated.
+
+        Input:
+        -----
+        start: int
+        stop: int
+            Range of training samples in the batch
+
+        Output:
+        -------
+        loss: double
+            Summed loss of all samples in the batch
+        """
+        stop = min(stop, self.x.shape[0])
+        if self.reference is None:
+            self.reference = self.reference_throughput(stop - start)
+        begin = time.perf_counter()
+        ranges = self.split(start, stop)
+        loss = self.run(ranges)
+        counts = np.array([b - a for a, b in ranges], dtype = self.flat_grads.dtype)
+        np.dot(counts / (stop - start), self.worker_grads, out = self.flat_grads)
+        self.network.update_wt()
+        self.train_time += time.perf_counter() - begin
+        self.samples += stop - start
+        return loss
+
+    def train_epoch(self,batch_size):
+        """
+        Hogwild epoch: every worker trains on its partition of the training data, updating the shared
+        weights without synchronization.
+
+        Input:
+        -----
+        batch_size: int
+
+        Output:
+        -------
+        loss: double
+            Summed loss of all samples
+        """
+        if self.reference is None:
+            self.reference = self.reference_throughput(batch_size)
+        begin = time.perf_counter()
+        loss = self.run(self.split(0, self.x.shape[0]), batch_size)
+        self.train_time += time.perf_counter() - begin
+        self.samples += self.x.shape[0]
+        return loss
+
+    def reference_throughput(self,batch_size,min_time = 0.2):
+        """
+        Samples per second of one process training the network (forward pass, backpropagation and weight
+        update) with batches of batch_size samples. Measured on a copy of the network, with a copy of the
+        optimizer, so the network itself isn't changed.
+
+        Input:
+        -----
+        batch_size: int
+        min_time: double
+            Batches are timed until this many seconds were measured (at least 5 batches), after 2
+            untimed ones. Default = 0.2
+
+        Output:
+        -------
+        throughput: double
+        """
+        network = self.network
+        nw = network.snapshot()
+        nw.optimizer = copy.deepcopy(network.optimizer)
+        nw.precision = copy.copy(network.precision)
+        for layer in nw.layers:
+            #The copies share the gradient buffers of the network's layers
+            for name in layer.grad_names:
+                setattr(layer, name, None)
+        if network.plan is not None:
+            nw.compile(network.plan.batch_size)
+        batch_size = max(min(batch_size, self.x.shape[0]), 1)
+        batches = 0
+        samples = 0
+        elapsed = 0.0
+        while batches < 7 or elapsed < min_time:
+            start = (batches * batch_size) % max(self.x.shape[0] - batch_size + 1, 1)
+            begin = time.perf_counter()
+            nw.train_batch(self.x[start:start+batch_size], self.ohe_labels[start:start+batch_size])
+            if batches >= 2:
+                elapsed += time.perf_counter() - begin
+                samples += batch_size
+            batches += 1
+        return samples / elapsed
+
+    def speedup(self):
+        """
+        Throughput since the last reset_stats() relative to the throughput of one process (See 
+        reference_throughput()). Eg. 3.0 means the workers trained 3 times as many samples per second as
+        a single process would.
+        """
+        if self.train_time == 0 or not self.reference:
+            return 0.0
+        return self.samples / self.train_time / self.reference
+
+    def efficiency(self):
+        """
+        Worker utilization since the last reset_stats(): the fraction of the available worker time 
+        (workers * wall time) spent computing. It doesn't measure the speedup, See speedup().
+        """
+        if self.wall_time == 0:
+            return 0.0
+        return self.busy_time / (self.workers * self.wall_time)
+
+    def reset_stats(self):
+        self.busy_time = 0.0
+        self.wall_time = 0.0
+        self.train_time = 0.0
+        self.samples = 0
+
+    def close(self):
+        """
+        Stops the workers, copies the parameters out of shared memory back into private arrays and
+        releases the shared memory.
+        """
+        for conn in self.conns:
+            conn.send(None)
+            conn.close()
+        for process in self.processes:
+            process.join()
+        self.store.bind(self.flat_params.copy(), self.flat_grads.copy(), copy = False)
+        del self.flat_params, self.worker_grads
+        self.param_shm.close()
+        self.param_shm.unlink()
+        self.grad_shm.close()
+        self.grad_shm.unlink()
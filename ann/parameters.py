@@ -0,0 +1,140 @@
+"""
+Parameter store
+---
+
+A ParameterStore packs the parameters of all layers into one contiguous flat array, and their gradients
+into a second one. The layers' attributes (Eg. Dense.weight, Dense.delta_wt) become views of the flat
+arrays, so the layers and backpropagation work on them as before, and everything that concerns all
+parameters at once is a single numpy operation on one array:
+
+- the optimizer step (Network.update_wt() passes the flat arrays to the optimizer as one parameter)
+- zeroing, clipping and the norm of the gradients
+- saving a checkpoint (the parameters are written as one array, See Network.save())
+- the gradient reduction of data parallel training (See parallel.py)
+
+```
+nw.pack_params(clip_norm = 5.0)
+```
+
+The flat arrays are laid out in the order of Network.params(). Layers without gradients (Flatten and the
+inference only layers) are not in the store.
+"""
+
+import numpy as np
+
+class ParameterStore:
+    """
+    The parameters and gradients of all layers of a network, in two flat contiguous arrays.
+
+    Parameters:
+    -----------
+    network: Network
+    params: numpy.ndarray
+        1D array with room for all parameters, Eg. in shared memory. Default = None (a new array)
+    grads: numpy.ndarray
+        1D array with room for all gradients. Default = None (a new array)
+    copy: bool
+        Copy the current parameter values into params. False if params already holds them (Eg. read
+        from a checkpoint). Default = True
+    clip_norm: double
+        If given, Network.update_wt() scales the gradients down to this norm before each step, when
+        their norm is larger. Default = None
+    entries: list
+        (layer, parameter name, gradient name, offset, shape) of every parameter
+    size: int
+        Total number of parameters
+    """
+
+    def __init__(self,network,params = None,grads = None,copy = True,clip_norm = None):
+        self.entries = []
+        offset = 0
+        for layer in network.layers:
+            for param_name, grad_name in zip(layer.param_names, layer.grad_names):
+                shape = getattr(layer, param_name).shape
+                self.entries.append((layer, param_name, grad_name, offset, shape))
+                offset += int(np.prod(shape))
+        self.size = offset
+        if params is None:
+            params = np.empty(self.size, dtype = network.precision.dtype)
+        if grads is None:
+            grads = np.zeros(self.size, dtype = network.precision.compute_dtype)
+        self.clip_norm = clip_norm
+        self.scratch = None
+        self.bind(params, grads, copy)
+
+    def bind(self,params,grads,copy):
+        """
+        Makes the parameters and gradients of all layers views of new flat arrays.
+
+        Input:
+        -----
+        params: numpy.ndarray
+            1D array with room for all parameters
+        grads: numpy.ndarray
+            1D array with room for all gradients
+        copy: bool
+            Copy the current parameter values into params
+        """
+        for layer, param_name, grad_name, offset, shape in self.entries:
+            size = int(np.prod(shape))
+            view = params[offset:offset+size].reshape(shape)
+            if copy:
+                view[...] = getattr(layer, param_name)
+            setattr(layer, param_name, view)
+            setattr(layer, grad_name, grads[offset:offset+size].reshape(shape))
+        self.params = params
+        self.grads = grads
+
+    def pairs(self):
+        """
+        The flat parameters and gradients as a single (parameter, gradient) pair, for an optimizer
+        """
+        return [(self.params, self.grads)]
+
+    def zero_grad(self):
+        self.grads.fill(0)
+
+    def grad_norm(self):
+        """
+        Euclidean norm of all gradients together
+        """
+        return float(np.sqrt(np.dot(self.grads, self.grads)))
+
+    def param_norm(self):
+        """
+        Euclidean norm of all parameters together
+        """
+        params = self.params.astype(self.grads.dtype, copy = False)
+        return float(np.sqrt(np.dot(params, params)))
+
+    def clip_grad_norm(self,max_norm):
+        """
+        Scales all gradients down, in place, so that their norm is at most max_norm.
+
+        Output:
+        -------
+        norm: double
+            Norm of the gradients before clipping
+        """
+        norm = self.grad_norm()
+        if norm > max_norm:
+            self.grads *= max_norm / norm
+        return norm
+
+    def clip_grad_value(self,value):
+        """
+        Clips every gradient to [-value, value], in place
+        """
+        np.clip(self.grads, -value, value, out = self.grads)
+
+    def sgd_step(self,lr):
+        """
+        Plain gradient descent on all parameters at once: params -= lr * grads
+        """
+        if self.scratch is None:
+            self.scratch = np.empty_like(self.grads)
+        np.multiply(self.grads, lr, out = self.scratch)
+        self.params -= self.scratch
+
+    def nbytes(self):
+        return self.params.nbytes + self.grads.nbytes
@@ -0,0 +1,303 @@
+"""
+Data pipeline
+---
+
+A DataLoader feeds batches to Network.fit and Network.predict. It reads from in-memory arrays, memory
+mapped arrays (Eg. from mnist.load_mnist()) or any iterable of (x, y) chunks, so the data doesn't have to
+fit in memory, and prepares batches in a background thread while the network trains on the current one:
+
+- Shuffling: every epoch draws a new permutation of the sample indices. Only the indices are shuffled;
+  each batch is gathered from the source with np.take into a preallocated buffer, so the dataset is
+  never copied.
+- Prefetching: a background thread gathers, normalizes and augments up to "prefetch" batches ahead. The
+  batch buffers are allocated once and reused in turn, so batches must not be kept after the next one
+  is requested (Network.fit and Network.predict never do).
+- Augmentation: any callable augment(x, y) -> (x, y), run in the background thread on every batch.
+
+```
+loader = DataLoader(train_data, train_labels, batch_size = 64, shuffle = True, prefetch = 2)
+nw.fit(x = loader, epochs = 5)
+```
+
+A ReplayBuffer keeps a bounded sample of a stream of batches, for Network.partial_fit.
+
+Iterable sources are not shuffled: each chunk is split into batches of at most batch_size samples, in order.
+Pass a callable returning a new iterable (Eg. a generator function) to train on it for several epochs.
+"""
+
+import queue
+import threading
+import numpy as np
+
+class DataLoader:
+    """
+    Iterable over the batches of a dataset. Each iteration is one epoch, yielding (x, y) batches.
+
+    Parameters:
+    -----------
+    x: numpy.ndarray, iterable or callable
+        Samples, an iterable of (x, y) chunks, or a callable returning such an iterable
+    y: numpy.ndarray
+        Labels (class ids or one hot encoded), when x is an array. Default = None (no labels; batches are
+        (x, None))
+    batch_size: int
+        Default = 64
+    shuffle: bool
+        Shuffle the samples of array sources every epoch. Default = False
+    prefetch: int
+        Number of batches prepared ahead in a background thread. 0 prepares every batch when it is
+        requested, in the calling thread. Default = 2
+    normalize: double
+        If given, samples are converted to float32 and divided by normalize (Eg. 255), in the background
+        thread. Default = None
+    augment: callable
+        Called as augment(x, y) on every batch after normalization; returns the augmented (x, y).
+        Default = None
+    seed: int
+        Seed of the shuffling. Default = 0
+    epoch: int
+        Number of epochs iterated so far
+    """
+
+    def __init__(self,x,y = None,batch_size = 64,shuffle = False,prefetch = 2,normalize = None,augment = None,seed = 0):
+        self.x = x
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.prefetch = prefetch
+        self.normalize = normalize
+        self.augment = augment
+        self.rng = np.random.RandomState(seed)
+        self.epoch = 0
+        self.buffers = None
+        self.norm_buffers = None
+
+    def is_array(self):
+        return hasattr(self.x, "shape")
+
+    def num_samples(self):
+        """
+        Number of samples per epoch, or None for iterable sources
+        """
+        return self.x.shape[0] if self.is_array() else None
+
+    def num_batches(self):
+        """
+        Number of batches per epoch, or None for iterable sources
+        """
+        if not self.is_array():
+            return None
+        return (self.x.shape[0] + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        """
+        Iterates over one epoch
+
+        Output:
+        -------
+        (x, y): tuple
+            One batch, yielded once per batch
+        """
+        self.epoch += 1
+        if self.prefetch <= 0:
+            return self.batches()
+        return self.prefetched()
+
+    def skip(self,epochs):
+        """
+        Advances the loader as if "epochs" epochs had been iterated, drawing their shuffled orders, so that
+        training resumed at a later epoch sees the same order of samples as training without interruption
+
+        Input:
+        -----
+        epochs: int
+        """
+        if self.shuffle and self.is_array():
+            for e in range(epochs):
+                self.rng.permutation(self.x.shape[0])
+        self.epoch += epochs
+
+    def batches(self):
+        """
+        Generator of the prepared batches of one epoch, in the calling thread
+        """
+        if self.is_array():
+            order = self.rng.permutation(self.x.shape[0]) if self.shuffle else None
+            for slot, start in enumerate(range(0, self.x.shape[0], self.batch_size)):
+                stop = min(start + self.batch_size, self.x.shape[0])
+                slot = slot % self.num_slots()
+                yield self.prepare(*self.gather(order, start, stop, slot), slot = slot)
+        else:
+            chunks = self.x() if callable(self.x) else self.x
+            for x, y in chunks:
+                x = np.asarray(x)
+                for start in range(0, x.shape[0], self.batch_size):
+                    yield self.prepare(x[start:start+self.batch_size], None if y is None else np.asarray(y)[start:start+self.batch_size])
+
+    def num_slots(self):
+        """
+        Number of batch buffers: one being used by the consumer, "prefetch" waiting in the queue and one
+        being filled by the background thread
+        """
+        return max(self.prefetch, 0) + 2
+
+    def gather(self,order,start,stop,slot):
+        """
+        Copies samples [start, stop) of the epoch into the buffers of slot "slot". With shuffling, the
+        samples are order[start:stop], read in increasing index order.
+        """
+        n = stop - start
+        if order is None and self.prefetch <= 0:
+            #Nothing is prepared ahead, so consecutive samples can be passed on as views of the source
+            return self.x[start:stop], None if self.y is None else self.y[start:stop]
+        if self.buffers is None:
+            self.buffers = [[np.empty((self.batch_size,) + arr.shape[1:], dtype = arr.dtype) for arr in (self.x, self.y) if arr is not None]
+                            for i in range(self.num_slots())]
+        bufs = self.buffers[slot]
+        if order is None:
+            x = bufs[0][:n]
+            x[...] = self.x[start:stop]
+            if self.y is None:
+                return x, None
+            y = bufs[1][:n]
+            y[...] = self.y[start:stop]
+            return x, y
+        idx = np.sort(order[start:stop])
+        x = np.take(self.x, idx, axis = 0, out = bufs[0][:n])
+        if self.y is None:
+            return x, None
+        return x, np.take(self.y, idx, axis = 0, out = bufs[1][:n])
+
+    def prepare(self,x,y,slot = None):
+        """
+        Normalizes and augments a batch. Batches of array sources are normalized into the float32 buffer
+        of their slot.
+        """
+        if self.normalize is not None and slot is not None:
+            if self.norm_buffers is None:
+                self.norm_buffers = [np.empty((self.batch_size,) + self.x.shape[1:], dtype = np.float32) 
+                                     for i in range(self.num_slots())]
+            x = np.divide(x, self.normalize, out = self.norm_buffers[slot][:x.shape[0]])
+        elif self.normalize is not None:
+            x = np.divide(x, self.normalize, dtype = np.float32)
+        if self.augment is not None:
+            x, y = self.augment(x, y)
+        return x, y
+
+    def prefetched(self):
+        """
+        Generator of the batches of one epoch, prepared by a background thread
+        """
+        batches = queue.Queue(maxsize = self.prefetch)
+        stop = threading.Event()
+
+        def produce():
+            try:
+                for batch in self.batches():
+                    while not stop.is_set():
+                        try:
+                            batches.put(("batch", batch), timeout = 0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stop.is_set():
+                        return
+                batches.put(("end", None))
+            except Exception as e:
+                batches.put(("error", e))
+
+        thread = threading.Thread(target = produce, daemon = True)
+        thread.start()
+        try:
+            while True:
+                kind, item = batches.get()
+                if kind == "end":
+                    break
+                if kind == "error":
+                    raise item
+                yield item
+        finally:
+            #Also reached when the consumer stops early: unblock the producer and wait for it
+            stop.set()
+            while thread.is_alive():
+                try:
+                    batches.get(timeout = 0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+class ReplayBuffer:
+    """
+    Bounded buffer of past samples for Network.partial_fit. Holds at most "capacity" samples in arrays
+    allocated on the first add(), in the dtype of the samples (Eg. uint8 pixels), so memory use is fixed.
+    partial_fit adds the labels as class ids.
+
+    ```
+    buffer = ReplayBuffer(10000)
+    for x, y in stream:
+        nw.partial_fit(x, y, replay = buffer)
+    ```
+
+    Parameters:
+    -----------
+    capacity: int
+        Largest number of samples kept
+    policy: str
+        "reservoir": once the buffer is full, every sample of the stream has the same chance to be kept
+        (reservoir sampling), so the buffer is a uniform sample of everything seen.
+        "fifo": the oldest samples are replaced, so the buffer holds the most recent ones.
+        Default = "reservoir"
+    seed: int
+        Seed of the replacements and of sample(). Default = 0
+    seen: int
+        Number of samples added so far
+    """
+
+    def __init__(self,capacity,policy = "reservoir",seed = 0):
+        if policy not in ("reservoir", "fifo"):
+            raise Exception("Unsupported replay policy: "+str(policy))
+        self.capacity = capacity
+        self.policy = policy
+        self.rng = np.random.RandomState(seed)
+        self.x = None
+        self.y = None
+        self.size = 0
+        self.seen = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self,x,y):
+        """
+        Adds a batch of samples and their labels (class ids or one hot encoded)
+        """
+        x = np.asarray(x)
+        y = np.asarray(y)
+        n = x.shape[0]
+        if self.x is None:
+            self.x = np.empty((self.capacity,) + x.shape[1:], dtype = x.dtype)
+            self.y = np.empty((self.capacity,) + y.shape[1:], dtype = y.dtype)
+        if self.policy == "fifo":
+            slots = (self.seen + np.arange(n)) % self.capacity
+        else:
+            #Sample number t (from 0) fills an empty slot, or replaces a random one with probability capacity/(t+1)
+            t = self.seen + np.arange(n)
+            slots = np.where(t < self.capacity, t, (self.rng.random_sample(n) * (t + 1)).astype(np.int64))
+        keep = slots < self.capacity
+        self.x[slots[keep]] = x[keep]
+        self.y[slots[keep]] = y[keep]
+        self.seen += n
+        self.size = min(self.seen, self.capacity)
+
+    def sample(self,n):
+        """
+        n samples drawn at random (with replacement), as copies
+
+        Output:
+        -------
+        (x, y): tuple
+        """
+        if self.size == 0:
+            raise Exception("The replay buffer is empty")
+        index = self.rng.randint(self.size, size = n)
+        return np.take(self.x, index, axis = 0), np.take(self.y, index, axis = 0)
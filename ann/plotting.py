@@ -0,0 +1,67 @@
+"""
+Plotting
+---
+
+Plots of the training history and of predictions. matplotlib and seaborn are imported when a plot is
+made, not when the package is imported, so they are only needed by programs that plot.
+
+```
+nw.fit(x = train_data, y = train_labels, epochs = 5, validation_split = 0.10, batch_size = 64)
+plotting.plot_history(nw)
+```
+"""
+
+def plot(x,label,title):
+    """
+    Plots a per epoch statistic
+
+    Input:
+    -----
+    x: list
+        One value per epoch
+    label: str
+    title: str
+    """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    plt.figure()
+    sns.lineplot(x = range(len(x)),y = x)
+    plt.legend(labels=[label])
+    plt.ylabel(label)
+    plt.xlabel("Epoch")
+    plt.title(title)
+
+def plot_history(network):
+    """
+    Plots the loss and validation accuracy of every epoch the network was trained for
+    """
+    plot(network.epoch_loss,"Loss","Epoch v/s Loss")
+    plot(network.epoch_acc,"Accuracy","Epoch v/s Accuracy")
+
+def show_predictions(images,true,pred,rows,cols,figsize):
+    """
+    Shows the first rows*cols images in a grid, titled with their true and predicted classes
+
+    Input:
+    -----
+    images: numpy.ndarray
+        Images, (N, rows, cols) or (N, 1, rows, cols)
+    true: numpy.ndarray
+        True classes
+    pred: numpy.ndarray
+        Predicted classes
+    rows: int
+    cols: int
+        Size of the grid
+    figsize: tuple
+        Size of the figure in inches (width, height)
+    """
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=figsize)
+    ax  = []
+    for i in range(rows*cols):
+        img = images[i].reshape(images.shape[-2:])
+        ax.append(fig.add_subplot(rows, cols, i + 1))
+        ax[-1].set_title('True: ' + str(true[i]) + ' xNN: ' + str(pred[i]))
+        plt.imshow(img, cmap='Greys')
+    plt.show()
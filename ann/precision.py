@@ -0,0 +1,95 @@
+"""
+Precision policies
+---
+
+A Precision policy decides the dtype the parameters and activations of every layer are stored in, the
+dtype the matrix multiplications accumulate in, and (for mixed_float16) the dynamic loss scaling.
+"""
+
+import numpy as np
+
+################################################################################
+#
+# PRECISION
+#
+################################################################################
+
+class Precision:
+    """
+    Network-wide precision policy. Decides the dtype that parameters, activations and gradients are 
+    kept in, so that nothing is silently computed in float64.
+    
+    "float32" (default): everything in float32
+    "float64": everything in float64
+    "mixed_float16": weights and activations are stored in float16, halving the memory of the 
+        activations. Matrix multiplications, gradients and optimizer state use float32, and the updates
+        are applied to float32 master copies of the weights, which are rounded into the float16 weights
+        after every step (See Network.master_step()). The loss is multiplied by loss_scale before 
+        backpropagation, so that small gradients don't underflow in float16, and the gradients are 
+        divided by it again before the weights are updated. The scale is dynamic: it is halved (and the
+        step skipped) when the gradients overflow, and doubled after "growth_interval" steps without
+        overflow.
+    
+    Parameters:
+    -----------
+    name: str
+        One of "float32", "float64", "mixed_float16"
+    dtype: numpy.dtype
+        Storage type of parameters and activations
+    compute_dtype: numpy.dtype
+        Type that matrix multiplications accumulate in, and that gradients are kept in
+    loss_scale: double
+        Current loss scale. 1 unless name is "mixed_float16". Default = 2**15 for "mixed_float16"
+    growth_interval: int
+        Number of steps without overflow after which loss_scale is doubled. Default = 2000
+    """
+    
+    POLICIES = {
+        "float32": (np.float32, np.float32),
+        "float64": (np.float64, np.float64),
+        "mixed_float16": (np.float16, np.float32),
+    }
+    
+    def __init__(self,name = "float32",loss_scale = None,growth_interval = 2000):
+        if name not in Precision.POLICIES:
+            raise Exception("Unsupported precision: "+str(name))
+        self.name = name
+        self.dtype, self.compute_dtype = (np.dtype(t) for t in Precision.POLICIES[name])
+        if loss_scale is None:
+            loss_scale = 2.0**15 if self.scaled() else 1.0
+        self.loss_scale = loss_scale
+        self.growth_interval = growth_interval
+        self.good_steps = 0
+    
+    def scaled(self):
+        """
+        Returns True if the loss is scaled, i.e. parameters are stored in less than float32
+        """
+        return self.dtype.itemsize < 4
+    
+    def unscale(self,params):
+        """
+        Checks that the (scaled) gradients are finite and divides them by the loss scale, in place.
+        Updates the loss scale.
+        
+        Input:
+        -----
+        params: list
+            List of (parameter, gradient) pairs
+        
+        Output:
+        -------
+        finite: bool
+            False if any gradient overflowed, in which case the step should be skipped.
+        """
+        finite = all(np.isfinite(grad).all() for param, grad in params)
+        if not finite:
+            self.loss_scale /= 2
+            self.good_steps = 0
+            return False
+        for param, grad in params:
+            grad *= 1 / self.loss_scale
+        self.good_steps += 1
+        if self.good_steps % self.growth_interval == 0:
+            self.loss_scale *= 2
+        return True
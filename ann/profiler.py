@@ -0,0 +1,214 @@
+"""
+Training loop profiler
+---
+
+Records where the time of Network.fit goes. When attached to a network, the profiler wraps every layer's
+compute(), backprop() and update_wt(), the optimizer's step(), the loss function, predict() and evaluate()
+(used for validation), and records for each call the wall time, the floating point operations (from the layer's
+flops() method) and optionally the bytes allocated (with tracemalloc, which slows everything down).
+Everything else in an epoch (slicing batches, the progress bar, ...) is recorded as "other".
+
+The records are aggregated per epoch and can be exported as JSON or CSV. When the profiler is detached the
+wrappers are removed, so a network that isn't being profiled has no overhead at all.
+
+```
+prof = nw.profile()
+nw.fit(x = train_data, y = train_labels, epochs = 1, batch_size = 64)
+nw.describe()                 # now includes achieved GFLOP/s per layer
+prof.to_csv("profile.csv")
+nw.profile(False)
+```
+
+Calls made in worker processes during data parallel training are not recorded. For a compiled network
+(See Network.compile()) the forward pass and backpropagation are recorded as a whole, under "Plan".
+"""
+
+import csv
+import json
+import time
+import tracemalloc
+
+class Profiler:
+    """
+    Per layer, per phase timing of the training loop.
+
+    Parameters:
+    -----------
+    track_memory: bool
+        Record the bytes allocated by each call with tracemalloc. Default = False
+    epoch: int
+        Index of the epoch being recorded
+    records: dict
+        Maps (epoch, layer, phase) to [calls, seconds, flops, bytes]
+    network: Network
+        The network the profiler is attached to, or None
+    """
+
+    def __init__(self,track_memory = False):
+        self.track_memory = track_memory
+        self.epoch = 0
+        self.records = {}
+        self.network = None
+        self.wrapped = []
+
+    def attach(self,network):
+        """
+        Wraps the methods of the network, its layers and its optimizer, and starts recording.
+
+        Input:
+        -----
+        network: Network
+        """
+        self.network = network
+        for i, layer in enumerate(network.layers):
+            name = str(i)+":"+layer.name
+            self.wrap(layer, "compute", name, "forward", layer)
+            self.wrap(layer, "backprop", name, "backward", layer)
+            self.wrap(layer, "update_wt", name, "update", layer)
+        if network.plan is not None:
+            #A compiled network doesn't call the layers' compute() and backprop(), so only whole passes are recorded
+            self.wrap(network.plan, "forward", "Plan", "forward", None)
+            self.wrap(network.plan, "backward", "Plan", "backward", None)
+        if network.optimizer is not None:
+            self.wrap(network.optimizer, "step", "Optimizer", "update", None)
+        self.wrap(network, "lossfunction", "Network", "loss", None)
+        self.wrap(network, "predict", "Network", "predict", None)
+        self.wrap(network, "evaluate", "Network", "evaluate", None)
+        if self.track_memory:
+            tracemalloc.start()
+
+    def detach(self):
+        """
+        Removes all wrappers, restoring the original methods, and stops recording.
+        """
+        for obj, method in self.wrapped:
+            del obj.__dict__[method]
+        self.wrapped = []
+        self.network = None
+        if self.track_memory:
+            tracemalloc.stop()
+
+    def wrap(self,obj,method,layer_name,phase,layer):
+        """
+        Replaces obj.method with a wrapper that records every call. The wrapper is stored on the instance,
+        so deleting it restores the class' method.
+
+        Input:
+        -----
+        obj: object
+        method: str
+            Name of the method to wrap
+        layer_name: str
+            Name the calls are recorded under
+        phase: str
+            "forward", "backward", "update", "loss", "predict" or "evaluate"
+        layer: Flatten or Dense
+            Layer whose flops() method counts the operations of a call, or None
+        """
+        fn = getattr(obj, method)
+
+        def wrapped(*args, **kwargs):
+            if self.track_memory:
+                start_mem = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            allocated = tracemalloc.get_traced_memory()[1] - start_mem if self.track_memory else 0
+            flops = layer.flops(phase) if layer is not None and hasattr(layer, "flops") else 0
+            self.record(layer_name, phase, elapsed, flops, allocated)
+            return result
+
+        setattr(obj, method, wrapped)
+        self.wrapped.append((obj, method))
+
+    def record(self,layer_name,phase,seconds,flops = 0,allocated = 0):
+        """
+        Adds one call to the records of the current epoch.
+        """
+        key = (self.epoch, layer_name, phase)
+        rec = self.records.get(key)
+        if rec is None:
+            rec = self.records[key] = [0, 0.0, 0, 0]
+        rec[0] += 1
+        rec[1] += seconds
+        rec[2] += flops
+        rec[3] += allocated
+
+    def end_epoch(self,epoch_time):
+        """
+        Closes the current epoch: everything not covered by a wrapped call is recorded as "other".
+
+        Input:
+        -----
+        epoch_time: double
+            Wall time of the epoch
+        """
+        measured = sum(rec[1] for (epoch, layer, phase), rec in self.records.items() if epoch == self.epoch)
+        self.record("Network", "other", max(epoch_time - measured, 0.0))
+        self.epoch += 1
+
+    def rows(self):
+        """
+        Returns the records as a list of dicts, one per (epoch, layer, phase), sorted by epoch.
+
+        Output:
+        -------
+        rows: list
+        """
+        rows = []
+        for (epoch, layer, phase), (calls, seconds, flops, allocated) in self.records.items():
+            rows.append({
+                "epoch": epoch,
+                "layer": layer,
+                "phase": phase,
+                "calls": calls,
+                "seconds": seconds,
+                "gflop": flops / 1e9,
+                "gflops_per_sec": flops / 1e9 / seconds if seconds > 0 else 0.0,
+                "bytes_allocated": allocated,
+            })
+        rows.sort(key = lambda row: row["epoch"])
+        return rows
+
+    def layer_gflops(self,layer_name):
+        """
+        Achieved GFLOP/s of a layer over all recorded epochs, forward and backward passes combined.
+
+        Input:
+        -----
+        layer_name: str
+            Name the layer is recorded under ("index:name")
+
+        Output:
+        -------
+        gflops: double
+            None if the layer hasn't been recorded
+        """
+        flops = 0
+        seconds = 0.0
+        for (epoch, layer, phase), rec in self.records.items():
+            if layer == layer_name and phase in ("forward", "backward"):
+                seconds += rec[1]
+                flops += rec[2]
+        if seconds == 0:
+            return None
+        return flops / 1e9 / seconds
+
+    def to_json(self,path):
+        """
+        Writes the records to path as a JSON list of rows (see rows())
+        """
+        with open(path, "w") as f:
+            json.dump(self.rows(), f, indent = 1)
+
+    def to_csv(self,path):
+        """
+        Writes the records to path as CSV, one row per (epoch, layer, phase)
+        """
+        rows = self.rows()
+        fields = ["epoch", "layer", "phase", "calls", "seconds", "gflop", "gflops_per_sec", "bytes_allocated"]
+        with open(path, "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = fields)
+            writer.writeheader()
+            writer.writerows(rows)
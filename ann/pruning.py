@@ -0,0 +1,396 @@
+"""
+Pruning
+---
+
+Magnitude pruning of Dense layers, and smaller networks for inference made from the pruned ones.
+
+- prune() sets the given fraction of each layer's weights with the smallest magnitude to 0, and keeps
+  them at 0 while the network trains on (the layer's mask is applied after every weight update).
+  With structure = "neurons", whole neurons (the columns of the weights) are pruned instead.
+- GradualPruning prunes a trained network step by step while fit() fine tunes it, which loses much
+  less accuracy than pruning to the final sparsity at once
+- sparsify() makes a copy of the network with SparseDense layers, which store and multiply only the
+  non zero weights. Unstructured sparsity shrinks the model several-fold, but the sparse products are
+  only faster than numpy's BLAS matrix multiplications for very sparse weights and small batches, so
+  only the layers whose density is below the measured break even density (See
+  sparse.break_even_density()) for the batch size predictions are made with are converted. The others
+  stay Dense layers.
+- compact() makes a copy of the network without the pruned neurons. Its layers are smaller Dense
+  layers, so it is faster for any batch size.
+- report() compares the size and the prediction speed of two networks
+
+```
+nw.fit(x, y, epochs = 2, batch_size = 64, pruning = pruning.GradualPruning(0.99, end_step = 1500))
+pruning.report(nw, pruning.sparsify(nw, batch_size = 1), test_x, batch_size = 1)
+```
+"""
+
+import time
+import numpy as np
+from .activations import get_activation
+from .layers import Dense, SparseDense, LAYER_TYPES
+from .sparse import break_even_density
+
+STRUCTURES = ("weights", "neurons")
+
+def magnitude_mask(weight,sparsity):
+    """
+    Mask of the weights to keep: 0 for the "sparsity" fraction of weights with the smallest magnitude,
+    1 for the others.
+
+    Input:
+    -----
+    weight: numpy.ndarray
+    sparsity: double
+        Fraction of the weights to prune, between 0 and 1
+
+    Output:
+    -------
+    mask: numpy.ndarray
+        Same shape and dtype as weight
+    """
+    if not 0 <= sparsity <= 1:
+        raise Exception("sparsity must be between 0 and 1, got "+str(sparsity))
+    mask = np.ones(weight.shape, dtype = weight.dtype)
+    k = int(round(sparsity * weight.size))
+    if k > 0:
+        #Exactly k weights are pruned, even if several have the same magnitude (Eg. already pruned ones)
+        smallest = np.argpartition(np.abs(weight).ravel(), k - 1)[:k]
+        mask.ravel()[smallest] = 0
+    return mask
+
+def neuron_mask(weight,sparsity):
+    """
+    Mask of the neurons to keep: 0 for the columns of the "sparsity" fraction of neurons whose incoming
+    weights have the smallest norm, 1 for the others.
+
+    Input:
+    -----
+    weight: numpy.ndarray
+        (input_size, output_size)
+    sparsity: double
+        Fraction of the neurons to prune, between 0 and 1
+
+    Output:
+    -------
+    mask: numpy.ndarray
+        Same shape and dtype as weight
+    """
+    columns = magnitude_mask(np.linalg.norm(weight, axis = 0, keepdims = True), sparsity)
+    return np.broadcast_to(columns, weight.shape).copy()
+
+def dense_layers(network,layers = None):
+    """
+    The Dense layers of the network, or the layers at the given indices
+    """
+    if layers is None:
+        return [layer for layer in network.layers if isinstance(layer, Dense)]
+    return [network.layers[i] for i in layers]
+
+def prune(network,sparsity,layers = None,structure = "weights"):
+    """
+    Prunes the weights with the smallest magnitude of each layer, and sets the layers' masks so they
+    stay pruned while training. Biases are not pruned.
+
+    Input:
+    -----
+    network: Network
+    sparsity: double
+        Fraction of each layer's weights to prune
+    layers: list
+        Indices of the layers to prune. Default = None (all Dense layers)
+    structure: str
+        "weights": prune single weights. "neurons": prune whole neurons, the "sparsity" fraction of
+        each layer's neurons. The neurons of the last layer (the classes) are never pruned.
+        Default = "weights"
+
+    Output:
+    -------
+        None
+    """
+    if structure not in STRUCTURES:
+        raise Exception("Unknown pruning structure: "+str(structure)+". Use one of "+str(STRUCTURES))
+    for layer in dense_layers(network, layers):
+        if structure == "weights":
+            layer.mask = magnitude_mask(layer.weight, sparsity)
+        elif layer is not network.layers[-1]:
+            layer.mask = neuron_mask(layer.weight, sparsity)
+        else:
+            continue
+        layer.apply_mask()
+
+def remove(network):
+    """
+    Removes the masks, so that the pruned weights are trained again
+    """
+    for layer in network.layers:
+        if getattr(layer, "mask", None) is not None:
+            layer.mask = None
+
+def sparsity(network):
+    """
+    Fraction of zero weights of each Dense and SparseDense layer
+
+    Output:
+    -------
+    sparsity: dict
+        {layer index: fraction of zero weights}
+    """
+    result = {}
+    for i, layer in enumerate(network.layers):
+        if isinstance(layer, Dense):
+            result[i] = 1 - np.count_nonzero(layer.weight) / layer.weight.size
+        elif isinstance(layer, SparseDense):
+            result[i] = 1 - layer.nnz / (layer.input_size * layer.output_size)
+    return result
+
+class GradualPruning:
+    """
+    Prunes the network gradually while it trains, from "initial_sparsity" to "final_sparsity" between
+    batch "begin_step" and "end_step", every "frequency" batches. The sparsity follows a cubic schedule
+    (Zhu and Gupta, 2017), pruning fast at first and slowly towards the end, so the network can recover:
+        s = final + (initial - final) * (1 - (step - begin_step) / (end_step - begin_step)) ** 3
+    Passed to Network.fit(pruning = ...), which calls step() after every batch. The batch count continues
+    over several calls of fit().
+
+    Parameters:
+    -----------
+    final_sparsity: double
+        Fraction of the weights pruned at the end
+    begin_step: int
+        Batch at which pruning starts. Default = 0
+    end_step: int
+        Batch at which the final sparsity is reached. Default = 1000
+    frequency: int
+        Number of batches between two pruning steps. Default = 100
+    initial_sparsity: double
+        Sparsity of the first pruning step. Default = 0.0
+    layers: list
+        Indices of the layers to prune. Default = None (all Dense layers)
+    structure: str
+        "weights" or "neurons", see prune(). Default = "weights"
+    iterations: int
+        Number of batches seen so far
+    """
+
+    def __init__(self,final_sparsity,begin_step = 0,end_step = 1000,frequency = 100,initial_sparsity = 0.0,layers = None,
+                 structure = "weights"):
+        if end_step <= begin_step:
+            raise Exception("end_step must be larger than begin_step")
+        self.final_sparsity = final_sparsity
+        self.begin_step = begin_step
+        self.end_step = end_step
+        self.frequency = frequency
+        self.initial_sparsity = initial_sparsity
+        self.layers = layers
+        self.structure = structure
+        self.iterations = 0
+
+    def sparsity_at(self,step):
+        """
+        Target sparsity at a batch
+        """
+        progress = min(max((step - self.begin_step) / (self.end_step - self.begin_step), 0.0), 1.0)
+        return self.final_sparsity + (self.initial_sparsity - self.final_sparsity) * (1 - progress) ** 3
+
+    def step(self,network):
+        """
+        Called after every batch. Prunes the network if a pruning step is due.
+
+        Input:
+        -----
+        network: Network
+
+        Output:
+        -------
+        pruned: bool
+            True if the network was pruned
+        """
+        step = self.iterations
+        self.iterations += 1
+        if step < self.begin_step or step > self.end_step:
+            return False
+        if (step - self.begin_step) % self.frequency != 0 and step != self.end_step:
+            return False
+        prune(network, self.sparsity_at(step), self.layers, self.structure)
+        return True
+
+def sparsify(network,layers = None,sparse_input = False,batch_size = 256,threshold = None):
+    """
+    Makes a copy of the network for inference, in which the Dense layers that are sparse enough for the
+    sparse product to be faster are replaced by SparseDense layers. The other layers are copied, and the
+    copy is compiled if the network is. The network itself is not changed.
+
+    Input:
+    -----
+    network: Network
+    layers: list
+        Indices of the Dense layers to consider. Default = None (all Dense layers)
+    sparse_input: bool
+        If the first of these layers is converted, let it also use the sparse input product, for mostly
+        zero inputs (See SparseDense). Default = False
+    batch_size: int
+        Number of samples the copy will predict at once. Default = 256
+    threshold: double
+        Layers with a smaller fraction of non zero weights are converted. Default = None (measured for 
+        every layer's shape and batch_size by sparse.break_even_density())
+
+    Output:
+    -------
+    sparse_nw: Network
+    """
+    convert = dense_layers(network, layers)
+    sparse_nw = type(network)(precision = network.precision.name)
+    for layer in network.layers:
+        if not any(layer is l for l in convert):
+            sparse_nw.add(copy_layer(layer))
+            continue
+        first = layer is convert[0]
+        limit = threshold
+        if limit is None:
+            limit = break_even_density(layer.output_size, layer.input_size, batch_size)
+        density = np.count_nonzero(layer.weight) / layer.weight.size
+        if density < limit:
+            sparse_nw.add(SparseDense.from_dense(layer, sparse_input and first))
+        else:
+            sparse_nw.add(copy_layer(layer))
+    if network.plan is not None:
+        sparse_nw.compile(network.plan.batch_size)
+    return sparse_nw
+
+def copy_layer(layer):
+    """
+    Copy of a layer with copies of its parameters, without its training state and mask
+    """
+    copy = LAYER_TYPES[type(layer).__name__](**layer.get_config())
+    for name in layer.param_names:
+        setattr(copy, name, np.array(getattr(layer, name)))
+    return copy
+
+def compact(network):
+    """
+    Makes a copy of the network for inference without the pruned neurons: the neurons of a Dense layer
+    whose incoming weights are all 0 (Eg. pruned with structure = "neurons") are removed if the next 
+    layer is a Dense layer too. Such a neuron always outputs activation(bias), which is folded into the 
+    next layer's bias, so the copy computes the same outputs. The copy is compiled if the network is.
+    The network itself is not changed.
+
+    Input:
+    -----
+    network: Network
+
+    Output:
+    -------
+    compact_nw: Network
+    """
+    layers = [copy_layer(layer) for layer in network.layers]
+    for layer, following in zip(layers, layers[1:]):
+        if not isinstance(layer, Dense) or not isinstance(following, Dense) or layer.activation == "softmax":
+            continue
+        keep = np.any(layer.weight != 0, axis = 0)
+        if keep.all():
+            continue
+        removed = ~keep
+        activation = get_activation(layer.activation)[0]
+        constant = activation(layer.bias[:, removed].astype(layer.compute_dtype))
+        following.bias = (following.bias + np.dot(constant, following.weight[removed])).astype(following.bias.dtype)
+        layer.weight = np.ascontiguousarray(layer.weight[:, keep])
+        layer.bias = layer.bias[:, keep]
+        layer.output_size = layer.weight.shape[1]
+        following.weight = np.ascontiguousarray(following.weight[keep])
+        following.input_size = following.weight.shape[0]
+    compact_nw = type(network)(precision = network.precision.name)
+    for layer in layers:
+        compact_nw.add(layer)
+    if network.plan is not None:
+        compact_nw.compile(network.plan.batch_size)
+    return compact_nw
+
+def layer_bytes(layer):
+    """
+    Bytes a layer keeps in memory: its parameters, and the arrays it made from them and keeps between
+    calls (See cache_names, Eg. the dense copy of the weights of a SparseDense layer with sparse_input)
+    """
+    arrays = [getattr(layer, name) for name in layer.param_names + getattr(layer, "cache_names", ())]
+    return sum(array.nbytes for array in arrays if array is not None)
+
+def layer_weights(layer):
+    """
+    Number of weights a layer stores: the non zero ones for SparseDense, all of them for Dense and
+    QuantizedDense
+    """
+    if isinstance(layer, SparseDense):
+        return layer.nnz
+    if hasattr(layer, "weight_q"):
+        return layer.weight_q.size
+    return layer.weight.size if hasattr(layer, "weight") else 0
+
+def report(network,sparse_network,x,batch_size = 256,repeat = 3,labels = ("dense", "sparse")):
+    """
+    Compares a network with its copy made by sparsify(), compact() or quantization.quantize(): the size of
+    every layer (See layer_bytes()), and the time predict() takes on x (the best of "repeat" runs, after an
+    untimed one, so both networks have their buffers allocated). Prints a table and returns the numbers.
+
+    Input:
+    -----
+    network: Network
+    sparse_network: Network
+    x: numpy.ndarray
+        Samples to predict
+    batch_size: int
+        Default = 256
+    repeat: int
+        Default = 3
+    labels: tuple
+        Prefixes of the keys of the two networks' numbers. Default = ("dense", "sparse")
+
+    Output:
+    -------
+    report: dict
+        With the default labels: "layers": list of {"name", "dense_weights", "sparse_weights", "dense_bytes",
+        "sparse_bytes"} for each layer, "dense_bytes", "sparse_bytes", "dense_time", "sparse_time", "speedup",
+        "memory_ratio" and "agreement" (fraction of samples both networks predict the same class for)
+    """
+    def best_time(nw):
+        nw.predict(x, batch_size = batch_size)
+        best = float("inf")
+        for i in range(repeat):
+            start = time.perf_counter()
+            pred = nw.predict(x, batch_size = batch_size)
+            best = min(best, time.perf_counter() - start)
+        return best, pred
+
+    first, second = labels
+    dense_time, dense_pred = best_time(network)
+    sparse_time, sparse_pred = best_time(sparse_network)
+
+    rows = []
+    for layer, sparse_layer in zip(network.layers, sparse_network.layers):
+        rows.append({"name": sparse_layer.name, first+"_weights": layer_weights(layer), 
+                     second+"_weights": layer_weights(sparse_layer), first+"_bytes": layer_bytes(layer),
+                     second+"_bytes": layer_bytes(sparse_layer)})
+    dense_bytes = sum(row[first+"_bytes"] for row in rows)
+    sparse_bytes = sum(row[second+"_bytes"] for row in rows)
+    result = {
+        "layers": rows,
+        first+"_bytes": dense_bytes,
+        second+"_bytes": sparse_bytes,
+        "memory_ratio": dense_bytes / sparse_bytes if sparse_bytes else float("inf"),
+        first+"_time": dense_time,
+        second+"_time": sparse_time,
+        "speedup": dense_time / sparse_time,
+        "agreement": float(np.mean(dense_pred == sparse_pred)),
+    }
+
+    print("Layer".ljust(16)+"Weights".rjust(10)+"Weights".rjust(10)+"KB".rjust(10)+"KB".rjust(10))
+    print("==========================================================")
+    for row in rows:
+        print(row["name"].ljust(16)+str(row[first+"_weights"]).rjust(10)+str(row[second+"_weights"]).rjust(10)
+              +str(round(row[first+"_bytes"]/1024, 1)).rjust(10)+str(round(row[second+"_bytes"]/1024, 1)).rjust(10))
+    print("==========================================================")
+    print("Model size: "+str(round(dense_bytes/1024, 1))+" KB -> "+str(round(sparse_bytes/1024, 1))+" KB ("
+          +str(round(result["memory_ratio"], 2))+"x smaller)")
+    print("Prediction time: "+str(round(dense_time*1e3, 2))+" ms -> "+str(round(sparse_time*1e3, 2))+" ms ("
+          +str(round(result["speedup"], 2))+"x faster)")
+    print("Same prediction for "+str(round(result["agreement"]*100, 2))+"% of the samples")
+    return result
@@ -0,0 +1,170 @@
+"""
+Quantization
+---
+
+Post-training int8 quantization: quantize() makes a copy of a trained network in which the Dense layers
+are replaced by QuantizedDense layers, with int8 weights (one scale per output channel) and uint8 inputs
+(one scale and zero point per layer, found by calibration on a sample of the training data). The
+weights take 4 times less memory, and the products are accumulated in int32 (See QuantizedDense).
+
+```
+quantized = quantization.quantize(nw, train_x[:2000])
+quantization.report(nw, quantized, test_x, test_y)
+```
+"""
+
+import numpy as np
+from .layers import Dense, QuantizedDense
+from . import pruning
+
+def quantize_weights(weight):
+    """
+    Symmetric int8 quantization of each column (output channel) of a weight matrix:
+    weight ~ weight_q * scale
+
+    Input:
+    -----
+    weight: numpy.ndarray
+        (input_size, output_size)
+
+    Output:
+    -------
+    weight_q: numpy.ndarray
+        int8, in [-127, 127]
+    scale: numpy.ndarray
+        float32, (1, output_size)
+    """
+    scale = np.max(np.abs(weight), axis = 0, keepdims = True).astype(np.float32) / 127
+    #Columns of zeros get any scale
+    scale[scale == 0] = 1
+    weight_q = np.clip(np.rint(weight / scale), -127, 127).astype(np.int8)
+    return weight_q, scale
+
+def input_quantization(low,high):
+    """
+    Scale and zero point of the uint8 quantization of values in [low, high]. The range is widened to
+    include 0, so that 0 is represented exactly (Eg. the zeros after a relu).
+
+    Output:
+    -------
+    scale: double
+    zero_point: int
+    """
+    low = min(low, 0.0)
+    high = max(high, 0.0)
+    scale = (high - low) / 255 if high > low else 1.0
+    zero_point = int(np.clip(round(-low / scale), 0, 255))
+    return scale, zero_point
+
+def calibrate(network,x,batch_size = 256,percentile = None,layers = None):
+    """
+    Runs samples through the network and records the range of the inputs of each Dense layer.
+
+    Input:
+    -----
+    network: Network
+    x: numpy.ndarray
+        Calibration samples, Eg. a few thousand training samples
+    batch_size: int
+        Default = 256
+    percentile: double
+        If given, the range is the "100 - percentile" to "percentile" percentiles of the inputs (averaged
+        over the batches) instead of their minimum and maximum, so that a few outliers don't waste most
+        of the 256 levels. Eg. 99.99. Default = None
+    layers: list
+        Indices of the layers. Default = None (all Dense layers)
+
+    Output:
+    -------
+    ranges: dict
+        {layer index: (low, high)}
+    """
+    if layers is None:
+        layers = [i for i, layer in enumerate(network.layers) if isinstance(layer, Dense)]
+    lows = {i: [] for i in layers}
+    highs = {i: [] for i in layers}
+    for batch in network.batches(x, batch_size):
+        data = batch
+        for i, layer in enumerate(network.layers):
+            if i in lows:
+                if percentile is None:
+                    lows[i].append(float(data.min()))
+                    highs[i].append(float(data.max()))
+                else:
+                    low, high = np.percentile(data, [100 - percentile, percentile])
+                    lows[i].append(float(low))
+                    highs[i].append(float(high))
+            data = layer.infer(data)
+    if percentile is None:
+        return {i: (min(lows[i]), max(highs[i])) for i in layers}
+    return {i: (float(np.mean(lows[i])), float(np.mean(highs[i]))) for i in layers}
+
+def quantize(network,x,batch_size = 256,percentile = None,layers = None):
+    """
+    Makes a copy of the network for inference, in which Dense layers are replaced by QuantizedDense
+    layers. The other layers are copied. The network itself is not changed.
+
+    Input:
+    -----
+    network: Network
+    x: numpy.ndarray
+        Calibration samples, Eg. a few thousand training samples
+    batch_size: int
+        Number of calibration samples run through the network at once. Default = 256
+    percentile: double
+        See calibrate(). Default = None (minimum and maximum)
+    layers: list
+        Indices of the Dense layers to quantize. Default = None (all Dense layers)
+
+    Output:
+    -------
+    quantized: Network
+    """
+    ranges = calibrate(network, x, batch_size, percentile, layers)
+    quantized = type(network)(precision = network.precision.name)
+    for i, layer in enumerate(network.layers):
+        if i not in ranges:
+            quantized.add(pruning.copy_layer(layer))
+            continue
+        qlayer = QuantizedDense(layer.input_size, layer.output_size, layer.activation, "Quantized"+layer.name)
+        qlayer.weight_q, qlayer.weight_scale = quantize_weights(layer.weight)
+        qlayer.bias = layer.bias.astype(np.float32)
+        scale, zero_point = input_quantization(*ranges[i])
+        qlayer.input_scale = np.array([scale], dtype = np.float32)
+        qlayer.input_zero_point = np.array([zero_point], dtype = np.int32)
+        quantized.add(qlayer)
+    return quantized
+
+def report(network,quantized,x,y,batch_size = 256,repeat = 3):
+    """
+    Compares a network with its quantized copy: the accuracy of both on (x, y), and the size and the
+    prediction time (See pruning.report(), with the labels "float" and "quantized"). Prints the comparison
+    and returns the numbers.
+
+    Input:
+    -----
+    network: Network
+    quantized: Network
+    x: numpy.ndarray
+        Test samples
+    y: numpy.ndarray
+        Their classes
+    batch_size: int
+        Default = 256
+    repeat: int
+        Default = 3
+
+    Output:
+    -------
+    report: dict
+        "layers": list of {"name", "float_weights", "quantized_weights", "float_bytes", "quantized_bytes"}
+        for each layer, "float_bytes", "quantized_bytes", "float_time", "quantized_time", "speedup",
+        "memory_ratio", "agreement", "float_accuracy", "quantized_accuracy" and "accuracy_drop"
+    """
+    result = pruning.report(network, quantized, x, batch_size, repeat, labels = ("float", "quantized"))
+    result["float_accuracy"] = network.evaluate(x, y, batch_size)
+    result["quantized_accuracy"] = quantized.evaluate(x, y, batch_size)
+    result["accuracy_drop"] = result["float_accuracy"] - result["quantized_accuracy"]
+    print("Accuracy: "+str(round(result["float_accuracy"]*100, 2))+"% -> "
+          +str(round(result["quantized_accuracy"]*100, 2))+"%")
+    return result
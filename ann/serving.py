@@ -0,0 +1,324 @@
+"""
+Inference server
+---
+
+An in-process inference server with dynamic batching. Clients submit requests of one or a few samples
+from any number of threads (predict(), submit()) or asyncio tasks (predict_async()). The requests wait
+in a queue, and each worker thread takes as many as fit in one batch of at most "max_batch_size"
+samples, waiting at most "max_delay" seconds after the oldest request for more to arrive. The batch
+goes through the network as one matrix, and every request gets its own rows of the result.
+
+Even without any delay, the requests that arrive while a batch is running are batched together next,
+so batches grow with the load. A delay only helps when requests come in bursts faster than a batch
+runs; with clients that wait for each answer before sending the next request, it adds to the latency.
+
+All workers share one read-only copy of the weights (a snapshot of the network, so the network can go
+on training). numpy releases the GIL during the matrix multiplications, so the workers run in parallel
+on several cores.
+
+```
+with serving.InferenceServer(nw, max_batch_size = 64, workers = 2) as server:
+    classes = server.predict(images)                  # from any thread
+    classes = await server.predict_async(images)      # from asyncio
+    print(server.metrics())
+```
+
+metrics() returns the number of requests and batches, the queue depth, the batch sizes and the latency
+percentiles of the last "window" requests.
+"""
+
+import time
+import queue
+import asyncio
+import threading
+import collections
+from concurrent.futures import Future
+import numpy as np
+
+class Request:
+    """
+    Samples of one request, the Future its result is delivered to and the time it was submitted
+    """
+
+    def __init__(self,x):
+        self.x = x
+        self.future = Future()
+        self.time = time.perf_counter()
+
+class ServerMetrics:
+    """
+    Counters and recent measurements of an InferenceServer, updated by its workers.
+
+    Parameters:
+    -----------
+    window: int
+        Number of recent requests and batches the percentiles are computed over. Default = 10000
+    """
+
+    def __init__(self,window = 10000):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.samples = 0
+        self.batches = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.latencies = collections.deque(maxlen = window)
+        self.batch_sizes = collections.deque(maxlen = window)
+        self.queue_depths = collections.deque(maxlen = window)
+
+    def record_batch(self,requests,size,queue_depth,failed = False):
+        now = time.perf_counter()
+        with self.lock:
+            self.batches += 1
+            self.requests += len(requests)
+            self.samples += size
+            self.errors += len(requests) if failed else 0
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+            self.batch_sizes.append(size)
+            self.queue_depths.append(queue_depth)
+            self.latencies.extend(now - request.time for request in requests)
+
+    def summary(self):
+        """
+        Output:
+        -------
+        metrics: dict
+            requests, samples, batches, errors, throughput (samples per second since the start),
+            queue_depth (mean and max, seen when batches were formed), batch_size (mean, p50, max) and
+            latency_s (p50, p90, p99, max)
+        """
+        with self.lock:
+            latencies = np.array(self.latencies)
+            sizes = np.array(self.batch_sizes)
+            depths = np.array(self.queue_depths)
+            result = {
+                "requests": self.requests,
+                "samples": self.samples,
+                "batches": self.batches,
+                "errors": self.errors,
+                "throughput": self.samples / (time.perf_counter() - self.start),
+                "queue_depth": {"mean": float(depths.mean()) if depths.size else 0.0, "max": self.max_queue_depth},
+            }
+        result["batch_size"] = {"mean": float(sizes.mean()), "p50": float(np.percentile(sizes, 50)),
+                                "max": int(sizes.max())} if sizes.size else None
+        result["latency_s"] = {"p50": float(np.percentile(latencies, 50)), "p90": float(np.percentile(latencies, 90)),
+                               "p99": float(np.percentile(latencies, 99)), "max": float(latencies.max())} if latencies.size else None
+        return result
+
+class InferenceServer:
+    """
+    Serves predictions of a network to concurrent clients, batching their requests together.
+
+    Parameters:
+    -----------
+    network: Network
+        Trained network. The server works on a snapshot of its weights, taken when the server is made
+        (See Network.snapshot()), compiled if the network is. reload() serves a newer version.
+    max_batch_size: int
+        Largest number of samples put in one batch. A larger request is run as a batch by itself.
+        Default = 64
+    max_delay: double
+        Longest time, in seconds, a worker waits after the oldest request of a batch for more requests.
+        Default = 0.0 (batch the requests that are waiting)
+    workers: int
+        Number of worker threads. Default = 1
+    probabilities: bool
+        Return the output of the last layer instead of the classes. Default = False
+    max_queue: int
+        Largest number of waiting requests: submit() raises an Exception when the queue is full, instead
+        of letting the latency grow without bound. Default = 0 (no limit)
+    window: int
+        Number of recent requests the metrics are computed over. Default = 10000
+    """
+
+    def __init__(self,network,max_batch_size = 64,max_delay = 0.0,workers = 1,probabilities = False,
+                 max_queue = 0,window = 10000):
+        self.network = self.freeze(network)
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.num_workers = workers
+        self.probabilities = probabilities
+        self.queue = queue.Queue(max_queue)
+        self.stats = ServerMetrics(window)
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def freeze(self,network):
+        """
+        One read-only copy of the weights of a network, shared by all workers
+        """
+        frozen = network.snapshot()
+        for layer in frozen.layers:
+            for name in layer.param_names:
+                getattr(layer, name).flags.writeable = False
+        if network.plan is not None:
+            #The plan's inference buffers are per thread, so the workers can share it
+            frozen.compile(network.plan.batch_size)
+        return frozen
+
+    def reload(self,network):
+        """
+        Serves a new version of the network (Eg. after Network.partial_fit()) without stopping. Batches
+        that already started finish with the old weights.
+        """
+        self.network = self.freeze(network)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,*exc):
+        self.stop()
+
+    def start(self):
+        """
+        Starts the worker threads
+        """
+        with self.lock:
+            if self.threads:
+                return
+            self.stats = ServerMetrics(self.stats.latencies.maxlen)
+            for i in range(self.num_workers):
+                thread = threading.Thread(target = self.work, name = "InferenceServer-"+str(i), daemon = True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self):
+        """
+        Stops the worker threads, after the requests already in the queue are answered
+        """
+        with self.lock:
+            for thread in self.threads:
+                self.queue.put(None)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+
+    ################################################################################
+    #
+    # FRONT-ENDS
+    #
+    ################################################################################
+
+    def submit(self,x):
+        """
+        Queues a request.
+
+        Input:
+        -----
+        x: numpy.ndarray
+            One or more samples, with the batch dimension first (Eg. (1, 1, 28, 28) for one image)
+
+        Output:
+        -------
+        future: concurrent.futures.Future
+            Gets the predictions of the samples: their classes, or the outputs of the last layer if the
+            server returns probabilities
+        """
+        if not self.threads:
+            raise Exception("The inference server is not running, call start() first")
+        request = Request(np.asarray(x))
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            raise Exception("The inference server's queue is full ("+str(self.queue.maxsize)+" requests)")
+        return request.future
+
+    def predict(self,x,timeout = None):
+        """
+        Predicts the samples, waiting for the result. Can be called from any number of threads.
+
+        Input:
+        -----
+        x: numpy.ndarray
+            One or more samples, with the batch dimension first
+        timeout: double
+            Seconds to wait for the result at most. Default = None (no limit)
+
+        Output:
+        -------
+        y_pred: numpy.ndarray
+        """
+        return self.submit(x).result(timeout)
+
+    async def predict_async(self,x):
+        """
+        Same as predict(), for asyncio: the event loop keeps running while the request waits.
+        """
+        return await asyncio.wrap_future(self.submit(x))
+
+    def metrics(self):
+        """
+        Returns the server's metrics, See ServerMetrics.summary()
+        """
+        return self.stats.summary()
+
+    ################################################################################
+    #
+    # WORKERS
+    #
+    ################################################################################
+
+    def next_batch(self,pending):
+        """
+        Collects the requests of the next batch: the first request that comes, and the ones that come
+        until the batch is full or "max_delay" has passed since the first one was submitted.
+
+        Input:
+        -----
+        pending: list
+            A request left over from the previous batch, which didn't fit in it. Emptied.
+
+        Output:
+        -------
+        requests: list
+            None when the server stops
+        """
+        first = pending.pop() if pending else self.queue.get()
+        if first is None:
+            return None
+        requests = [first]
+        size = first.x.shape[0]
+        deadline = first.time + self.max_delay
+        while size < self.max_batch_size:
+            try:
+                remaining = deadline - time.perf_counter()
+                request = self.queue.get(timeout = remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                #Let the loop in work() see the stop signal after this batch
+                pending.append(request)
+                break
+            if size + request.x.shape[0] > self.max_batch_size:
+                pending.append(request)
+                break
+            requests.append(request)
+            size += request.x.shape[0]
+        return requests
+
+    def work(self):
+        """
+        Loop of a worker thread: forms batches and answers their requests
+        """
+        pending = []
+        while True:
+            requests = self.next_batch(pending)
+            if requests is None:
+                return
+            depth = self.queue.qsize()
+            try:
+                batch = requests[0].x if len(requests) == 1 else np.concatenate([r.x for r in requests])
+                pred = next(self.network.predict_batches(batch, batch.shape[0], self.probabilities))
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                self.stats.record_batch(requests, sum(r.x.shape[0] for r in requests), depth, failed = True)
+                continue
+            start = 0
+            for request in requests:
+                stop = start + request.x.shape[0]
+                request.future.set_result(pred[start:stop])
+                start = stop
+            self.stats.record_batch(requests, batch.shape[0], depth)
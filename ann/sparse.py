@@ -0,0 +1,218 @@
+"""
+Sparse matrices
+---
+
+A minimal CSR (compressed sparse row) matrix, used by SparseDense layers for pruned weights and for
+mostly zero inputs (Eg. MNIST pixels, about 80% of which are 0).
+
+Products are computed with scipy.sparse when scipy is installed. Without scipy a built-in vectorized
+numpy kernel is used (See CSRMatrix.dot_rows()): for a batch of dense rows, it gathers the elements
+matching every stored value with one np.take, scales them in place, and sums the values of each sparse
+row with one np.add.reduceat. Its cost is proportional to the number of stored values instead of the
+full matrix size, but every stored value costs much more than a multiply-add of a BLAS matrix
+multiplication, so it only pays off below a density that depends on the shape, the batch size and the
+machine. break_even_density() measures that density, and pruning.sparsify() only converts the layers
+below it.
+"""
+
+import time
+import numpy as np
+
+#Maximum number of elements of the temporary (rows x stored values) array of the built-in kernel.
+#Larger products are computed a block of rows at a time.
+BLOCK_ELEMENTS = 1 << 22
+
+#Density of the random matrix break_even_density() starts measuring with
+PROBE_DENSITY = 0.05
+
+#Densities measured by break_even_density(), by (rows, cols, batch size rounded up to a power of 2, scipy)
+BREAK_EVEN = {}
+
+#scipy.sparse, False if scipy isn't installed, None until scipy_sparse() looked for it
+SCIPY_SPARSE = None
+
+def scipy_sparse():
+    """
+    Returns the scipy.sparse module, or None if scipy isn't installed. Looked up once, as a failed import
+    is slow.
+    """
+    global SCIPY_SPARSE
+    if SCIPY_SPARSE is None:
+        try:
+            import scipy.sparse
+            SCIPY_SPARSE = scipy.sparse
+        except ImportError:
+            SCIPY_SPARSE = False
+    return SCIPY_SPARSE or None
+
+class CSRMatrix:
+    """
+    Sparse matrix in CSR format: the column indices and values of the non zero elements of row i are
+    indices[indptr[i]:indptr[i+1]] and data[indptr[i]:indptr[i+1]].
+
+    Parameters:
+    -----------
+    data: numpy.ndarray
+        Non zero values, (nnz,)
+    indices: numpy.ndarray
+        Column index of each value, (nnz,) int32
+    indptr: numpy.ndarray
+        Start of each row in data and indices, (rows + 1,) int64
+    shape: tuple
+        (rows, cols)
+    """
+
+    def __init__(self,data,indices,indptr,shape):
+        self.data = data
+        self.indices = indices
+        self.indptr = indptr
+        self.shape = tuple(shape)
+        self.scipy_matrix = None
+        self.nonempty = None
+        self.starts = None
+
+    @classmethod
+    def from_dense(cls,dense):
+        """
+        Builds a CSR matrix holding the non zero elements of a 2D array
+        """
+        rows, cols = np.nonzero(dense)
+        indptr = np.zeros(dense.shape[0] + 1, dtype = np.int64)
+        np.cumsum(np.bincount(rows, minlength = dense.shape[0]), out = indptr[1:])
+        return cls(dense[rows, cols], cols.astype(np.int32), indptr, dense.shape)
+
+    @property
+    def nnz(self):
+        return self.data.shape[0]
+
+    def density(self):
+        """
+        Fraction of the elements that are stored
+        """
+        size = self.shape[0] * self.shape[1]
+        return self.nnz / size if size else 0.0
+
+    def nbytes(self):
+        return self.data.nbytes + self.indices.nbytes + self.indptr.nbytes
+
+    def to_dense(self):
+        dense = np.zeros(self.shape, dtype = self.data.dtype)
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+    def scipy_csr(self):
+        """
+        The matrix as a scipy.sparse.csr_matrix sharing its arrays, or None if scipy isn't installed
+        """
+        sp = scipy_sparse()
+        if sp is not None and self.scipy_matrix is None:
+            self.scipy_matrix = sp.csr_matrix((self.data, self.indices, self.indptr), shape = self.shape)
+        return self.scipy_matrix
+
+    def dot_rows(self,dense):
+        """
+        Product of a batch of dense rows with the transpose of this matrix: dense @ self.T. For the transposed
+        weights of a SparseDense layer, this is the layer's product with a batch of inputs.
+
+        Input:
+        -----
+        dense: numpy.ndarray
+            (k, cols)
+
+        Output:
+        -------
+        result: numpy.ndarray
+            (k, rows)
+        """
+        matrix = self.scipy_csr()
+        if matrix is not None:
+            return np.asarray(matrix @ dense.T).T
+
+        dtype = np.result_type(self.data.dtype, dense.dtype)
+        result = np.zeros((dense.shape[0], self.shape[0]), dtype = dtype)
+        if self.nnz == 0:
+            return result
+        #reduceat needs the start of every non empty row, found once
+        if self.starts is None:
+            self.nonempty = np.nonzero(np.diff(self.indptr))[0]
+            self.starts = self.indptr[self.nonempty]
+        full = self.nonempty.shape[0] == self.shape[0]
+        #Blocks of rows of dense, so the temporary array of gathered elements stays below BLOCK_ELEMENTS
+        step = max(BLOCK_ELEMENTS // self.nnz, 1)
+        for i in range(0, dense.shape[0], step):
+            gathered = np.take(dense[i:i+step], self.indices, axis = 1).astype(dtype, copy = False)
+            np.multiply(gathered, self.data, out = gathered)
+            if full:
+                np.add.reduceat(gathered, self.starts, axis = 1, out = result[i:i+step])
+            else:
+                result[i:i+step, self.nonempty] = np.add.reduceat(gathered, self.starts, axis = 1)
+        return result
+
+    def matmul(self,dense):
+        """
+        Product of this matrix with a dense 2D array: self @ dense
+
+        Input:
+        -----
+        dense: numpy.ndarray
+            (cols, k)
+
+        Output:
+        -------
+        result: numpy.ndarray
+            (rows, k)
+        """
+        return self.dot_rows(np.ascontiguousarray(dense.T)).T
+
+def best_time(fn,repeat = 3):
+    """
+    Shortest of "repeat" timed calls of fn, after one untimed call
+    """
+    fn()
+    best = float("inf")
+    for i in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def break_even_density(rows,cols,batch_size,repeat = 3):
+    """
+    Measures the density below which the sparse product of a batch of batch_size rows with a (rows, cols)
+    CSR matrix (CSRMatrix.dot_rows()) is faster than the dense matrix multiplication. The sparse product
+    is timed on a random matrix, first of PROBE_DENSITY, then of the density estimated from it, as its
+    cost is proportional to the number of stored values. Measured once per shape and batch size (rounded 
+    up to a power of 2), and kept in BREAK_EVEN.
+
+    Input:
+    -----
+    rows, cols: int
+        Shape of the sparse matrix, Eg. (output_size, input_size) of a SparseDense layer
+    batch_size: int
+    repeat: int
+        Default = 3
+
+    Output:
+    -------
+    density: double
+        Between 0 and 1
+    """
+    batch_size = 1 << max(int(batch_size) - 1, 0).bit_length()
+    key = (rows, cols, batch_size, scipy_sparse() is not None)
+    if key not in BREAK_EVEN:
+        rng = np.random.RandomState(0)
+        dense = rng.uniform(-1, 1, size = (rows, cols)).astype(np.float32)
+        x = rng.uniform(0, 1, size = (batch_size, cols)).astype(np.float32)
+        dense_time = best_time(lambda: np.dot(x, dense.T), repeat)
+        uniform = rng.uniform(0, 1, size = (rows, cols))
+        density = PROBE_DENSITY
+        for probe in range(2):
+            matrix = CSRMatrix.from_dense(np.where(uniform < density, dense, 0))
+            sparse_time = best_time(lambda: matrix.dot_rows(x), repeat)
+            estimate = min(matrix.density() * dense_time / sparse_time, 1.0)
+            if estimate >= density:
+                break
+            density = max(estimate, 1e-3)
+        BREAK_EVEN[key] = estimate
+    return BREAK_EVEN[key]
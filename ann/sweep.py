@@ -0,0 +1,581 @@
+"""
+Hyperparameter sweeps
+---
+
+Trains many configurations of a network, several at a time in a pool of worker processes, and records
+the results in a local results store.
+
+A search space maps names to the values to try. build(config) makes the Network of one configuration,
+Eg. from its layer widths, learning rate and activation. Entries named like arguments of Network.fit
+(Eg. batch_size, shuffle) are also passed to fit.
+
+```
+space = {"hidden": [100, 300, 1000], "lr": sweep.LogUniform(1e-3, 1e-1), "activation": ["relu", "linear"]}
+
+def build(config):
+    nw = Network(optimizer = optimizers.SGD(lr = config["lr"], momentum = 0.9))
+    nw.add(Flatten(normalize = 255))
+    nw.add(Dense(784, config["hidden"], activation = config["activation"]))
+    nw.add(Dense(config["hidden"], 10, activation = "softmax"))
+    return nw
+
+s = sweep.Sweep(build, train_data, train_labels, "sweep_results", workers = 4, patience = 2)
+s.run(sweep.random_search(space, 20), epochs = 10)     # or sweep.grid(space)
+s.hyperband(space, max_epochs = 27)                   # or s.successive_halving(configs, 1, 27)
+s.summary()
+```
+
+Search strategies:
+
+- run(): trains every configuration for the same number of epochs.
+- successive_halving(): trains all configurations for a few epochs, keeps the best 1/eta of them, trains
+  those eta times longer, and so on, so most of the compute goes to the promising configurations.
+- hyperband(): several rounds of successive halving on random configurations, from many configurations
+  trained briefly to a few trained for max_epochs.
+
+A trial is stopped early when its metric ("epoch_acc", the validation accuracy, or "epoch_loss", the
+training loss) hasn't improved for "patience" epochs, when it is worse than the median of the finished
+trials at the same epoch ("median_stop"), or when its loss is not finite.
+
+Each worker process limits its BLAS library to "blas_threads" threads, so that "workers" trials use the
+cores without oversubscribing them. The limit is set with threadpoolctl when it is installed. Without it,
+only the OMP_NUM_THREADS (etc.) environment variables are set, which BLAS reads when numpy is first
+imported: this is enough for the "spawn" and "forkserver" start methods, but with "fork" (the default,
+which doesn't need build() to be importable) the workers keep the BLAS threads of the main process.
+
+The results store is a directory with one JSON line per finished trial (results.jsonl) and the latest
+checkpoint of every trial (See Network.save()). A sweep that was interrupted is resumed by running it
+again with the same store: finished trials are not trained again, and unfinished ones continue from
+their last epoch. Successive halving continues the promoted trials from their checkpoints too.
+"""
+
+import io
+import os
+import json
+import math
+import time
+import hashlib
+import inspect
+import itertools
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from .network import Network
+
+BLAS_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+                  "NUMEXPR_NUM_THREADS")
+METRICS = {"epoch_acc": max, "epoch_loss": min}
+
+################################################################################
+#
+# SEARCH SPACES
+#
+################################################################################
+
+class Uniform:
+    """
+    Values drawn uniformly from [low, high], by random_search(). Integers if both bounds are integers.
+    """
+
+    def __init__(self,low,high):
+        self.low = low
+        self.high = high
+
+    def sample(self,rng):
+        if isinstance(self.low, int) and isinstance(self.high, int):
+            return int(rng.randint(self.low, self.high + 1))
+        return float(rng.uniform(self.low, self.high))
+
+class LogUniform(Uniform):
+    """
+    Values whose logarithm is drawn uniformly, Eg. learning rates from 1e-4 to 1e-1
+    """
+
+    def sample(self,rng):
+        return float(np.exp(rng.uniform(np.log(self.low), np.log(self.high))))
+
+def grid(space):
+    """
+    All combinations of the values of a search space.
+
+    Input:
+    -----
+    space: dict
+        Maps each name to a list of values
+
+    Output:
+    -------
+    configs: list
+        List of dicts
+    """
+    names = sorted(space)
+    for name in names:
+        if not isinstance(space[name], (list, tuple)):
+            raise Exception("grid() needs a list of values for "+name)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[name] for name in names])]
+
+def random_search(space,n,seed = 0):
+    """
+    n random configurations of a search space. The same seed gives the same configurations, so a sweep
+    can be resumed.
+
+    Input:
+    -----
+    space: dict
+        Maps each name to a list of values (one is chosen), a Uniform or LogUniform, or a fixed value
+    n: int
+    seed: int
+        Default = 0
+
+    Output:
+    -------
+    configs: list
+    """
+    rng = np.random.RandomState(seed)
+    configs = []
+    for i in range(n):
+        config = {}
+        for name in sorted(space):
+            value = space[name]
+            if isinstance(value, (list, tuple)):
+                value = value[rng.randint(len(value))]
+            elif isinstance(value, Uniform):
+                value = value.sample(rng)
+            #numpy scalars aren't JSON serializable
+            config[name] = value.item() if isinstance(value, np.generic) else value
+        configs.append(config)
+    return configs
+
+def trial_id(config):
+    """
+    Identifier of a configuration in the results store
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys = True).encode()).hexdigest()[:12]
+
+################################################################################
+#
+# RESULTS STORE
+#
+################################################################################
+
+class ResultsStore:
+    """
+    Directory holding the results and checkpoints of the trials of a sweep.
+
+    Parameters:
+    -----------
+    path: str
+        Directory, created if it doesn't exist
+    records: dict
+        Latest record of every trial, by trial id
+    """
+
+    def __init__(self,path):
+        self.path = path
+        os.makedirs(os.path.join(path, "checkpoints"), exist_ok = True)
+        self.records = {}
+        results = os.path.join(path, "results.jsonl")
+        if os.path.exists(results):
+            with open(results) as f:
+                for line in f:
+                    line = line.strip()
+                    #A line cut off by an interruption is ignored
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[record["id"]] = record
+
+    def checkpoint(self,trial):
+        return os.path.join(self.path, "checkpoints", trial + ".ckpt")
+
+    def add(self,record):
+        """
+        Appends the record of a trial, which replaces any earlier record of the same trial
+        """
+        self.records[record["id"]] = record
+        with open(os.path.join(self.path, "results.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def finished(self,trial,epochs):
+        """
+        The record of a trial if it was trained for "epochs" epochs, or stopped or failed before, else None
+        """
+        record = self.records.get(trial)
+        if record is not None and (record["epochs"] >= epochs or record["status"] in ("stopped", "failed")):
+            return record
+        return None
+
+################################################################################
+#
+# WORKERS
+#
+################################################################################
+
+def limit_blas_threads(threads):
+    """
+    Limits the threads of the BLAS library of this process, with threadpoolctl if it is installed, and
+    sets the environment variables read by BLAS libraries loaded later
+    """
+    for name in BLAS_VARIABLES:
+        os.environ[name] = str(threads)
+    try:
+        import threadpoolctl
+    except ImportError:
+        return None
+    return threadpoolctl.threadpool_limits(threads)
+
+#Set in every worker process by init_worker()
+WORKER = {}
+
+def init_worker(sweep,threads):
+    WORKER["sweep"] = sweep
+    if threads is not None:
+        WORKER["limits"] = limit_blas_threads(threads)
+
+def run_trial(config,epochs,reference):
+    """
+    Runs a trial in a worker process, See Sweep.train()
+    """
+    return WORKER["sweep"].train(config, epochs, reference)
+
+class Sweep:
+    """
+    Trains configurations of a network in parallel and keeps the results in a ResultsStore.
+
+    Parameters:
+    -----------
+    build: callable
+        build(config) returns a new Network. Must be importable (module level) with the "spawn" and
+        "forkserver" start methods
+    x: numpy.ndarray
+        Training data
+    y: numpy.ndarray
+        Training classes
+    store: str or ResultsStore
+        Directory of the results store
+    workers: int
+        Number of trials trained at once. 1 trains in this process. Default = None (number of cores
+        divided by blas_threads)
+    blas_threads: int
+        Threads of the BLAS library in each worker process. Default = 1
+    metric: str
+        "epoch_acc" (validation accuracy, higher is better, needs validation_split) or "epoch_loss"
+        (average training loss, lower is better). Default = "epoch_acc"
+    validation_split: double
+        Passed to Network.fit. Default = 0.1
+    batch_size: int
+        Passed to Network.fit, unless the configuration has a batch_size. Default = 64
+    patience: int
+        Stop a trial when its metric hasn't improved by more than min_delta for this many epochs.
+        Default = None (never)
+    min_delta: double
+        Default = 0.0
+    median_stop: bool
+        Stop a trial when its best metric so far is worse than the median of the finished trials at the
+        same epoch. Default = False
+    grace_epochs: int
+        Number of epochs a trial is trained before the median rule applies. Default = 1
+    start_method: str
+        multiprocessing start method of the worker processes. Default = "fork"
+    fit_args: dict
+        Other arguments of Network.fit (Eg. {"shuffle": True}). Default = None
+    verbose: bool
+        Print a line for every finished trial. The output of fit is never printed. Default = True
+    """
+
+    def __init__(self,build,x,y,store,workers = None,blas_threads = 1,metric = "epoch_acc",validation_split = 0.1,
+                 batch_size = 64,patience = None,min_delta = 0.0,median_stop = False,grace_epochs = 1,
+                 start_method = "fork",fit_args = None,verbose = True):
+        if metric not in METRICS:
+            raise Exception("Unsupported metric: "+str(metric)+", use one of "+", ".join(METRICS))
+        if metric == "epoch_acc" and not validation_split:
+            raise Exception("The epoch_acc metric needs a validation_split")
+        self.build = build
+        self.x = x
+        self.y = y
+        self.store = store if isinstance(store, ResultsStore) else ResultsStore(store)
+        self.workers = workers if workers is not None else max((os.cpu_count() or 1) // blas_threads, 1)
+        self.blas_threads = blas_threads
+        self.metric = metric
+        self.best = METRICS[metric]
+        self.validation_split = validation_split
+        self.batch_size = batch_size
+        self.patience = patience
+        self.min_delta = min_delta
+        self.median_stop = median_stop
+        self.grace_epochs = grace_epochs
+        self.start_method = start_method
+        self.fit_args = fit_args or {}
+        self.verbose = verbose
+        self.fit_names = set(inspect.signature(Network.fit).parameters) - {"self", "x", "y", "epochs", "initial_epoch"}
+
+    ################################################################################
+    #
+    # TRIALS
+    #
+    ################################################################################
+
+    def score(self,history):
+        """
+        Metric of a trial: the best value reached in its history, None if it has none
+        """
+        values = [v for v in history[self.metric] if np.isfinite(v)]
+        return self.best(values) if values else None
+
+    def better(self,a,b,delta = 0.0):
+        return a > b + delta if self.best is max else a < b - delta
+
+    def should_stop(self,network,reference):
+        """
+        Reason to stop a trial after its last epoch, or None to go on
+        """
+        if not np.isfinite(network.epoch_loss[-1]):
+            return "diverged"
+        values = network.epoch_loss if self.metric == "epoch_loss" else network.epoch_acc
+        if self.patience is not None and len(values) > self.patience:
+            best_before = self.best(values[:-self.patience])
+            if not any(self.better(v, best_before, self.min_delta) for v in values[-self.patience:]):
+                return "no improvement for "+str(self.patience)+" epochs"
+        epoch = len(values) - 1
+        if self.median_stop and reference and epoch + 1 >= self.grace_epochs and epoch < len(reference):
+            if reference[epoch] is not None and self.better(reference[epoch], self.best(values)):
+                return "worse than the median"
+        return None
+
+    def train(self,config,epochs,reference = None):
+        """
+        Trains a configuration for up to "epochs" epochs, continuing from its checkpoint if it has one, and
+        saves it after every epoch. Runs in a worker process.
+
+        Input:
+        -----
+        config: dict
+        epochs: int
+        reference: list
+            Median metric of the finished trials at each epoch, for the median rule. Default = None
+
+        Output:
+        -------
+        record: dict
+            id, config, status ("completed", "stopped" or "failed"), reason, epochs trained, score, history
+            (epoch_loss, epoch_acc and epoch_time) and the time the trial took
+        """
+        trial = trial_id(config)
+        path = self.store.checkpoint(trial)
+        start = time.time()
+        record = {"id": trial, "config": config, "status": "completed", "reason": None}
+        fit_args = dict(self.fit_args, batch_size = self.batch_size, validation_split = self.validation_split)
+        fit_args.update((k, v) for k, v in config.items() if k in self.fit_names)
+        network = None
+        try:
+            #fit() prints its progress, which would interleave between the trials
+            with contextlib.redirect_stdout(io.StringIO()):
+                if os.path.exists(path):
+                    network = Network.load(path, mmap_mode = None)
+                else:
+                    network = self.build(config)
+                while network.epoch < epochs:
+                    network.fit(self.x, self.y, epochs = network.epoch + 1, initial_epoch = network.epoch, **fit_args)
+                    network.save(path)
+                    reason = self.should_stop(network, reference)
+                    if reason is not None:
+                        record["status"] = "stopped"
+                        record["reason"] = reason
+                        break
+        except Exception as e:
+            record["status"] = "failed"
+            record["reason"] = repr(e)
+        history = {"epoch_loss": [], "epoch_acc": [], "epoch_time": []}
+        if network is not None:
+            history = {"epoch_loss": [float(v) for v in network.epoch_loss], "epoch_acc": [float(v) for v in network.epoch_acc],
+                       "epoch_time": [float(v) for v in network.epoch_time]}
+        record["epochs"] = len(history["epoch_loss"])
+        record["score"] = self.score(history)
+        record["history"] = history
+        record["time"] = time.time() - start
+        return record
+
+    def reference(self):
+        """
+        Median metric of the finished trials (completed, or stopped by the median rule) at each epoch
+        """
+        curves = [r["history"][self.metric] for r in self.store.records.values() if r["status"] != "failed"]
+        length = max((len(c) for c in curves), default = 0)
+        reference = []
+        for epoch in range(length):
+            #Best value up to this epoch, so a trial is compared with what the others had reached
+            values = [self.best(c[:epoch+1]) for c in curves if len(c) > epoch]
+            reference.append(float(np.median(values)) if values else None)
+        return reference
+
+    ################################################################################
+    #
+    # SEARCH
+    #
+    ################################################################################
+
+    def run(self,configs,epochs):
+        """
+        Trains every configuration for "epochs" epochs (unless stopped early), "workers" at a time.
+        Trials already in the results store for this many epochs are not trained again.
+
+        Input:
+        -----
+        configs: list
+            Configurations, Eg. from grid() or random_search()
+        epochs: int
+
+        Output:
+        -------
+        records: list
+            Records of the configurations (See train()), best first
+        """
+        records = {}
+        todo = []
+        for config in configs:
+            trial = trial_id(config)
+            record = self.store.finished(trial, epochs)
+            if record is not None:
+                records[trial] = record
+            elif trial not in records and all(trial_id(c) != trial for c in todo):
+                todo.append(config)
+        if self.verbose:
+            print("Sweep: "+str(len(todo))+" trials to train for "+str(epochs)+" epochs, "
+                  +str(len(configs) - len(todo))+" already in the store")
+        if self.workers == 1 or len(todo) <= 1:
+            for config in todo:
+                self.finish(records, self.train(config, epochs, self.reference()))
+        else:
+            self.run_pool(todo, epochs, records)
+        return self.ranked([records[trial_id(config)] for config in configs if trial_id(config) in records])
+
+    def run_pool(self,todo,epochs,records):
+        """
+        Trains the configurations in a process pool. A trial is only submitted when a worker is free,
+        so the median rule compares it with all trials finished by then.
+        """
+        context = multiprocessing.get_context(self.start_method)
+        saved = {name: os.environ.get(name) for name in BLAS_VARIABLES}
+        #Read by the BLAS library of workers that import numpy anew ("spawn", "forkserver")
+        for name in BLAS_VARIABLES:
+            os.environ[name] = str(self.blas_threads)
+        try:
+            with ProcessPoolExecutor(self.workers, mp_context = context, initializer = init_worker,
+                                     initargs = (self, self.blas_threads)) as pool:
+                todo = list(todo)
+                running = set()
+                while todo or running:
+                    while todo and len(running) < self.workers:
+                        running.add(pool.submit(run_trial, todo.pop(0), epochs, self.reference()))
+                    done, running = wait(running, return_when = FIRST_COMPLETED)
+                    for future in done:
+                        self.finish(records, future.result())
+        finally:
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+    def finish(self,records,record):
+        self.store.add(record)
+        records[record["id"]] = record
+        if self.verbose:
+            score = "--" if record["score"] is None else str(round(record["score"], 4))
+            line = record["id"]+"  "+self.metric+" "+score+"  epochs "+str(record["epochs"])+"  "+record["status"]
+            if record["reason"]:
+                line += " ("+record["reason"]+")"
+            print(line+"  "+json.dumps(record["config"], sort_keys = True))
+
+    def ranked(self,records):
+        """
+        Records sorted best first. Failed trials, and trials without a score, come last.
+        """
+        sign = -1 if self.best is max else 1
+        return sorted(records, key = lambda r: (r["score"] is None, 0 if r["score"] is None else sign * r["score"]))
+
+    def successive_halving(self,configs,min_epochs = 1,max_epochs = 27,eta = 3):
+        """
+        Trains all configurations for min_epochs epochs, then the best 1/eta of them for eta times more
+        epochs, and so on up to max_epochs. Promoted trials continue from their checkpoints.
+
+        Input:
+        -----
+        configs: list
+        min_epochs: int
+            Default = 1
+        max_epochs: int
+            Default = 27
+        eta: int
+            Default = 3
+
+        Output:
+        -------
+        records: list
+            Records of the trials of the last round, best first
+        """
+        epochs = min_epochs
+        records = []
+        while configs:
+            records = self.run(configs, epochs)
+            if epochs >= max_epochs:
+                break
+            #Stopped trials aren't promoted
+            survivors = [r for r in records if r["status"] == "completed" and r["score"] is not None]
+            keep = max(len(configs) // eta, 1)
+            configs = [r["config"] for r in survivors[:keep]]
+            epochs = min(epochs * eta, max_epochs)
+        return records
+
+    def hyperband(self,space,max_epochs = 27,eta = 3,seed = 0):
+        """
+        Hyperband: successive halving on random configurations, with brackets that range from many
+        configurations starting at few epochs to a few configurations trained for max_epochs.
+
+        Input:
+        -----
+        space: dict
+            Search space, See random_search()
+        max_epochs: int
+            Default = 27
+        eta: int
+            Default = 3
+        seed: int
+            Seed of the random configurations. Default = 0
+
+        Output:
+        -------
+        records: list
+            Records of all trials in the store, best first
+        """
+        s_max = int(math.log(max_epochs) / math.log(eta) + 1e-9)
+        for s in range(s_max, -1, -1):
+            n = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+            min_epochs = max(int(round(max_epochs / eta ** s)), 1)
+            if self.verbose:
+                print("Hyperband bracket "+str(s_max - s + 1)+"/"+str(s_max + 1)+": "+str(n)+" configurations from "
+                      +str(min_epochs)+" epochs")
+            self.successive_halving(random_search(space, n, seed + s), min_epochs, max_epochs, eta)
+        return self.results()
+
+    def results(self):
+        """
+        Records of all trials in the store, best first
+        """
+        return self.ranked(list(self.store.records.values()))
+
+    def summary(self,top = 10):
+        """
+        Prints the best trials in the store
+        """
+        print("Trial\t\t"+self.metric+"\tEpochs\tStatus\t\tConfiguration")
+        print("=================================================================================")
+        for record in self.results()[:top]:
+            score = "--" if record["score"] is None else str(round(record["score"], 4))
+            print(record["id"]+"\t"+score+"\t\t"+str(record["epochs"])+"\t"+record["status"]+"\t"
+                  +json.dumps(record["config"], sort_keys = True))
+        print("=================================================================================")
@@ -0,0 +1,570 @@
+"""
+Numerical verification
+---
+
+Checks that the fast paths compute what the math says they should, so that an optimization can be
+adopted once it passes:
+
+- Gradient checks: the gradients of every layer type (Dense with every registered activation, Conv2D,
+  MaxPool2D, AvgPool2D, Flatten), of every activation, and of whole networks (fused softmax and cross
+  entropy included) are compared with central finite differences, in float64.
+- Equivalence checks: the outputs and gradients of a network (batched, compiled, float32, mixed_float16,
+  sparse, quantized, ...) are compared with a reference path: the same network copied to float64, run
+  one sample at a time. Tolerances depend on the network's dtype (See TOLERANCES).
+- Determinism: deterministic() seeds numpy and random and limits BLAS to one thread, so that training
+  gives bitwise identical weights; check_determinism() trains twice and compares them.
+
+```
+from ann import verification
+
+verification.verify()                                           # built-in suite, prints a report
+rows = verification.check_equivalence(nw, test_x[:64], test_y[:64])
+with verification.deterministic(seed = 0):
+    nw = build()
+```
+
+Every check returns a list of rows: dicts with "check", "error" (relative error, See compare()),
+"tolerance" and "passed". report() prints them.
+"""
+
+import io
+import os
+import random
+import hashlib
+import contextlib
+import numpy as np
+from .activations import ACTIVATIONS, get_activation
+from .precision import Precision
+from .layers import Flatten, Dense
+from .convolution import Conv2D, MaxPool2D, AvgPool2D
+from .network import Network
+from . import metrics
+from . import pruning
+from .sweep import BLAS_VARIABLES, limit_blas_threads
+
+#(rtol, atol) of equivalence checks against the float64 reference, by the dtype the network stores its
+#activations in
+TOLERANCES = {
+    np.dtype(np.float64): (1e-9, 1e-12),
+    np.dtype(np.float32): (1e-4, 1e-6),
+    np.dtype(np.float16): (2e-2, 1e-3),
+}
+#Of finite difference checks, which run in float64
+GRADIENT_TOLERANCE = (1e-6, 1e-9)
+
+def tolerance(dtype):
+    """
+    (rtol, atol) for a dtype, See TOLERANCES
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in TOLERANCES:
+        raise Exception("No tolerance for dtype "+str(dtype))
+    return TOLERANCES[dtype]
+
+def compare(check,value,reference,rtol,atol):
+    """
+    Compares an array with a reference. The error is the largest absolute difference relative to the
+    largest reference value, or to atol/rtol if that is larger, so that the check passes when
+    max|value - reference| <= max(rtol * max|reference|, atol).
+
+    Output:
+    -------
+    row: dict
+        check, error, tolerance and passed
+    """
+    value = np.asarray(value, dtype = np.float64)
+    reference = np.asarray(reference, dtype = np.float64)
+    if value.shape != reference.shape:
+        return {"check": check, "error": float("inf"), "tolerance": rtol, "passed": False}
+    diff = float(np.max(np.abs(value - reference))) if value.size else 0.0
+    scale = max(float(np.max(np.abs(reference))) if reference.size else 0.0, atol / rtol)
+    error = diff / scale
+    return {"check": check, "error": error, "tolerance": rtol, "passed": bool(error <= rtol)}
+
+def report(rows):
+    """
+    Prints rows returned by the checks
+
+    Output:
+    -------
+    passed: bool
+        True if all checks passed
+    """
+    print("Check"+" "*51+"Error\t\tStatus")
+    print("=================================================================================")
+    for row in rows:
+        status = "ok" if row["passed"] else "FAILED"
+        print(row["check"].ljust(56)+"{:.2e}".format(row["error"])+"\t"+status)
+    print("=================================================================================")
+    failed = sum(not row["passed"] for row in rows)
+    print(str(len(rows) - failed)+"/"+str(len(rows))+" checks passed")
+    return failed == 0
+
+################################################################################
+#
+# COPIES
+#
+################################################################################
+
+def copy_network(network,precision = "float64"):
+    """
+    Copy of a network with its parameters converted to another precision, without any training state,
+    plan or parameter store. Used as the reference.
+    """
+    copy = Network(precision = precision)
+    for layer in network.layers:
+        copy.add(pruning.copy_layer(layer))
+    return copy
+
+def one_hot(y,network):
+    return metrics.one_hot(np.asarray(y), network.layers[-1].output_size, network.precision.compute_dtype)
+
+################################################################################
+#
+# GRADIENT CHECKS
+#
+################################################################################
+
+def numerical_gradient(f,array,eps = 1e-6,indices = None):
+    """
+    Central finite differences of a scalar function with respect to the elements of an array, which is
+    changed in place and restored.
+
+    Input:
+    -----
+    f: callable
+        f() returns the function's value for the current contents of array
+    array: numpy.ndarray
+        float64
+    eps: double
+        Default = 1e-6
+    indices: list
+        Indices of the elements to differentiate. Default = None (all)
+
+    Output:
+    -------
+    grad: numpy.ndarray
+        Same shape as array. Only the elements at indices are filled, the others are 0.
+    """
+    grad = np.zeros(array.shape)
+    for index in (indices if indices is not None else np.ndindex(array.shape)):
+        old = array[index]
+        array[index] = old + eps
+        high = f()
+        array[index] = old - eps
+        low = f()
+        array[index] = old
+        grad[index] = (high - low) / (2 * eps)
+    return grad
+
+def sample_indices(shape,max_checks,rng):
+    """
+    At most max_checks random indices of an array of a shape, None for all of them
+    """
+    size = int(np.prod(shape))
+    if max_checks is None or size <= max_checks:
+        return None
+    return [np.unravel_index(i, shape) for i in rng.choice(size, max_checks, replace = False)]
+
+def check_gradients(check,f,analytic,arrays,eps,max_checks,rng):
+    """
+    Compares the analytic gradients of several arrays with finite differences of f
+    """
+    rtol, atol = GRADIENT_TOLERANCE
+    rows = []
+    for name, array in arrays:
+        indices = sample_indices(array.shape, max_checks, rng)
+        numeric = numerical_gradient(f, array, eps, indices)
+        grad = np.asarray(analytic[name], dtype = np.float64)
+        if indices is not None:
+            #Only the sampled elements are compared
+            mask = np.zeros(array.shape, dtype = bool)
+            for index in indices:
+                mask[index] = True
+            grad = np.where(mask, grad, 0)
+        rows.append(compare(check+" "+name, grad, numeric, rtol, atol))
+    return rows
+
+def check_layer(layer,x,eps = 1e-6,max_checks = 200,seed = 0):
+    """
+    Checks the gradients computed by a layer's backprop() against finite differences, for its
+    parameters and its input. The layer is copied to float64 first; the layer itself isn't changed.
+    The loss is the cross entropy with random classes for a softmax layer (whose backprop() takes the
+    fused gradient, output - true), else a random linear function of the output.
+
+    Input:
+    -----
+    layer: Dense, Conv2D, MaxPool2D, AvgPool2D, Flatten, ...
+    x: numpy.ndarray
+        Batch of inputs of the layer
+    eps: double
+        Step of the finite differences. Default = 1e-6
+    max_checks: int
+        Number of randomly chosen elements checked per array. Default = 200
+    seed: int
+        Default = 0
+
+    Output:
+    -------
+    rows: list
+    """
+    rng = np.random.RandomState(seed)
+    layer = pruning.copy_layer(layer)
+    layer.set_precision(Precision("float64"))
+    #The errors of the input are checked too, as if a layer with weights came before
+    layer.needs_input_grad = lambda: True
+    x = np.array(x, dtype = np.float64)
+    n = x.shape[0]
+    layer.data = x
+    out = layer.compute()
+    softmax = getattr(layer, "activation", None) == "softmax"
+    if softmax:
+        true = metrics.one_hot(rng.randint(out.shape[1], size = n), out.shape[1], np.float64)
+    else:
+        weights = rng.standard_normal(out.shape)
+
+    def loss():
+        layer.data = x
+        out = layer.compute()
+        if softmax:
+            return float(metrics.cross_entropy(out, true).sum()) / n
+        return float(np.sum(out * weights)) / n
+
+    loss()
+    bp_data = layer.output - true if softmax else weights
+    grad_in = layer.backprop(bp_data)
+    #Parameter gradients are averaged over the batch, input gradients are per sample
+    analytic = {name: getattr(layer, grad) for name, grad in zip(layer.param_names, layer.grad_names)}
+    analytic["input"] = np.asarray(grad_in).reshape(x.shape) / n
+    arrays = [(name, getattr(layer, name)) for name in layer.param_names] + [("input", x)]
+    activation = " ("+layer.activation+")" if hasattr(layer, "activation") else ""
+    return check_gradients(type(layer).__name__+activation, loss, analytic, arrays, eps, max_checks, rng)
+
+def check_activation(name,eps = 1e-6,seed = 0):
+    """
+    Checks the derivative of an activation function against finite differences. Softmax layers are
+    trained with the fused gradient of softmax and cross entropy (output - true), so for softmax that
+    gradient is checked instead.
+
+    Output:
+    -------
+    rows: list
+    """
+    rng = np.random.RandomState(seed)
+    function, derivative = get_activation(name)
+    x = rng.standard_normal((4, 6))
+    #Keep away from the kink of relu-like functions
+    x[np.abs(x) < 10 * eps] = 0.5
+    rtol, atol = GRADIENT_TOLERANCE
+    if name == "softmax":
+        true = metrics.one_hot(rng.randint(6, size = 4), 6, np.float64)
+        f = lambda: float(metrics.cross_entropy(function(x), true).sum())
+        numeric = numerical_gradient(f, x, eps)
+        return [compare("activation softmax (with cross entropy)", function(x) - true, numeric, rtol, atol)]
+    #Elementwise: the derivative of the sum of the outputs is the derivative of each element
+    numeric = numerical_gradient(lambda: float(np.sum(function(x))), x, eps)
+    return [compare("activation "+name, derivative(x), numeric, rtol, atol)]
+
+def check_network(network,x,y,eps = 1e-6,max_checks = 50,seed = 0):
+    """
+    Checks the gradients of a whole network (forward_backward(), with the loss fused into the last
+    layer) against finite differences of the mean cross entropy, on a float64 copy.
+
+    Input:
+    -----
+    network: Network
+    x: numpy.ndarray
+        Batch of samples
+    y: numpy.ndarray
+        Their classes
+    eps: double
+        Default = 1e-6
+    max_checks: int
+        Number of randomly chosen elements checked per parameter. Default = 50
+    seed: int
+        Default = 0
+
+    Output:
+    -------
+    rows: list
+    """
+    rng = np.random.RandomState(seed)
+    nw = copy_network(network)
+    true = one_hot(y, nw)
+    n = true.shape[0]
+
+    def loss():
+        out = x
+        for layer in nw.layers:
+            out = layer.infer(out)
+        return float(metrics.cross_entropy(out, true).sum()) / n
+
+    nw.forward_backward(x, true)
+    rows = []
+    for i, layer in enumerate(nw.layers):
+        analytic = {name: np.array(getattr(layer, grad)) for name, grad in zip(layer.param_names, layer.grad_names)}
+        arrays = [(name, getattr(layer, name)) for name in layer.param_names]
+        rows += check_gradients("network layer "+str(i)+" "+layer.name, loss, analytic, arrays, eps, max_checks, rng)
+    return rows
+
+################################################################################
+#
+# EQUIVALENCE
+#
+################################################################################
+
+def reference_outputs(network,x):
+    """
+    Outputs of the last layer for a float64 copy of the network, one sample at a time through the
+    layers' compute()
+    """
+    nw = copy_network(network)
+    return np.concatenate([nw.forward(x[i:i+1]).copy() for i in range(x.shape[0])])
+
+def reference_gradients(network,x,y):
+    """
+    Gradients of all parameters for a float64 copy of the network, computed one sample at a time and
+    averaged, in the order of network.params()
+    """
+    nw = copy_network(network)
+    true = one_hot(y, nw)
+    total = None
+    for i in range(x.shape[0]):
+        nw.forward_backward(x[i:i+1], true[i:i+1])
+        grads = [np.array(grad, dtype = np.float64) for param, grad in nw.params()]
+        total = grads if total is None else [t + g for t, g in zip(total, grads)]
+    return [t / x.shape[0] for t in total]
+
+def check_equivalence(network,x,y = None,rtol = None,atol = None,reference = None,name = None,batch_size = 256):
+    """
+    Compares a network's accelerated paths with the reference path: the predictions (predict(),
+    through the compiled plan if there is one), the training forward pass and, if y is given, the
+    gradients of forward_backward() (unscaled, for mixed_float16).
+
+    Input:
+    -----
+    network: Network
+    x: numpy.ndarray
+        Batch of samples
+    y: numpy.ndarray
+        Their classes. Default = None (no gradients are compared)
+    rtol, atol: double
+        Default = None (See tolerance(), for the network's dtype)
+    reference: Network
+        Network whose float64 copy is the reference, Eg. the float network a quantized or sparse one
+        was made from. Default = None (the network itself)
+    name: str
+        Prefix of the check names. Default = None (the network's precision)
+    batch_size: int
+        Default = 256
+
+    Output:
+    -------
+    rows: list
+        The "predict" row also has the fraction of samples with the same class ("agreement")
+    """
+    default_rtol, default_atol = tolerance(network.precision.dtype)
+    rtol = default_rtol if rtol is None else rtol
+    atol = default_atol if atol is None else atol
+    name = name or network.precision.name
+    reference = network if reference is None else reference
+    expected = reference_outputs(reference, x)
+    rows = []
+
+    pred = np.concatenate(list(network.predict_batches(x, batch_size, probabilities = True)))
+    row = compare(name+" predict", pred, expected, rtol, atol)
+    row["agreement"] = float(np.mean(np.argmax(pred, axis = 1) == np.argmax(expected, axis = 1)))
+    rows.append(row)
+    if not network.params():
+        #Inference only network
+        return rows
+    rows.append(compare(name+" forward", network.forward(x), expected, rtol, atol))
+    if y is not None:
+        grads = reference_gradients(reference, x, y)
+        network.forward_backward(x, one_hot(y, network))
+        scale = network.precision.loss_scale if network.precision.scaled() else 1.0
+        for i, (param, grad) in enumerate(network.params()):
+            rows.append(compare(name+" gradient "+str(i), np.asarray(grad, dtype = np.float64) / scale, grads[i], rtol, atol))
+    return rows
+
+def check_updates(network,x,y):
+    """
+    Checks that one training step changes every parameter of the network (Eg. that biases are trained,
+    and that a parameter store or optimizer hasn't lost track of an array). Trains a copy.
+
+    Output:
+    -------
+    rows: list
+        error is 1 for a parameter that didn't change at all, else 0
+    """
+    nw = copy_network(network, network.precision.name)
+    nw.optimizer = network.optimizer
+    before = [np.array(param) for param, grad in nw.params()]
+    nw.train_batch(x, one_hot(y, nw))
+    rows = []
+    for i, (old, (param, grad)) in enumerate(zip(before, nw.params())):
+        changed = bool(np.any(old != param))
+        rows.append({"check": "update parameter "+str(i)+" "+str(param.shape), "error": 0.0 if changed else 1.0,
+                     "tolerance": 0.0, "passed": changed})
+    return rows
+
+################################################################################
+#
+# DETERMINISM
+#
+################################################################################
+
+@contextlib.contextmanager
+def deterministic(seed = 0,threads = 1):
+    """
+    Context manager making training reproducible: seeds numpy's global generator (used to initialize
+    the weights) and the random module, and limits BLAS to "threads" threads (with threadpoolctl when
+    it is installed, See sweep.limit_blas_threads()), so that the order of floating point additions in
+    the matrix multiplications doesn't change between runs. Shuffling and validation subsets have seeds
+    of their own. Everything is restored on exit.
+    """
+    numpy_state = np.random.get_state()
+    python_state = random.getstate()
+    environ = {name: os.environ.get(name) for name in BLAS_VARIABLES}
+    np.random.seed(seed)
+    random.seed(seed)
+    limits = limit_blas_threads(threads)
+    try:
+        yield
+    finally:
+        if limits is not None:
+            limits.restore_original_limits()
+        for name, value in environ.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        np.random.set_state(numpy_state)
+        random.setstate(python_state)
+
+def fingerprint(network):
+    """
+    Hash of all parameters of a network, to compare networks bit for bit
+    """
+    digest = hashlib.sha256()
+    for param, grad in network.params():
+        digest.update(np.ascontiguousarray(param).tobytes())
+    return digest.hexdigest()[:16]
+
+def check_determinism(build,x,y,runs = 2,seed = 0,**fit_args):
+    """
+    Builds and trains a network "runs" times in deterministic mode, and checks that the weights are
+    bitwise identical. The output of fit is not printed.
+
+    Input:
+    -----
+    build: callable
+        build() returns a new Network
+    x, y: numpy.ndarray
+        Training data
+    runs: int
+        Default = 2
+    seed: int
+        Default = 0
+    fit_args:
+        Arguments of Network.fit (Eg. epochs, batch_size, shuffle)
+
+    Output:
+    -------
+    rows: list
+        error is the number of runs whose weights differ from the first run's
+    """
+    prints = []
+    for run in range(runs):
+        with deterministic(seed), contextlib.redirect_stdout(io.StringIO()):
+            network = build()
+            network.fit(x, y, **fit_args)
+        prints.append(fingerprint(network))
+    differ = sum(p != prints[0] for p in prints[1:])
+    return [{"check": "determinism ("+str(runs)+" runs)", "error": float(differ), "tolerance": 0.0, "passed": differ == 0}]
+
+################################################################################
+#
+# SUITE
+#
+################################################################################
+
+def verify(seed = 0,verbose = True):
+    """
+    Runs all checks on small random layers and networks: gradient checks of every layer type and
+    activation and of whole dense and convolutional networks, equivalence of the batched, compiled,
+    float32, mixed_float16, packed, sparse and quantized paths with the reference, parameter updates
+    and determinism.
+
+    Input:
+    -----
+    seed: int
+        Default = 0
+    verbose: bool
+        Print the report. Default = True
+
+    Output:
+    -------
+    rows: list
+    """
+    from . import quantization
+    rows = []
+    with deterministic(seed):
+        rng = np.random.RandomState(seed)
+        images = rng.randint(0, 256, size = (8, 1, 6, 6)).astype(np.uint8)
+        classes = rng.randint(0, 4, size = 8)
+
+        #Layers
+        for name in ACTIVATIONS:
+            rows += check_layer(Dense(5, 4, activation = name), rng.standard_normal((6, 5)), seed = seed)
+        rows += check_layer(Conv2D(2, 3, 3, padding = 1, activation = "relu"), rng.standard_normal((3, 2, 5, 5)), seed = seed)
+        rows += check_layer(Conv2D(2, 3, (2, 3), stride = 2, normalize = 4), rng.standard_normal((3, 2, 7, 6)), seed = seed)
+        rows += check_layer(MaxPool2D(2), rng.standard_normal((3, 2, 6, 6)), seed = seed)
+        rows += check_layer(AvgPool2D(3, stride = 2), rng.standard_normal((3, 2, 7, 7)), seed = seed)
+        rows += check_layer(Flatten(normalize = 255), rng.standard_normal((3, 2, 3, 3)), seed = seed)
+        for name in ACTIVATIONS:
+            rows += check_activation(name, seed = seed)
+
+        #Networks
+        def dense(precision = "float32"):
+            nw = Network(precision = precision)
+            nw.add(Flatten(normalize = 255))
+            nw.add(Dense(36, 16, activation = "relu"))
+            nw.add(Dense(16, 4, activation = "softmax"))
+            return nw
+
+        def cnn(precision = "float32"):
+            nw = Network(precision = precision)
+            nw.add(Conv2D(1, 3, 3, padding = 1, activation = "relu", normalize = 255, input_shape = (1, 6, 6)))
+            nw.add(MaxPool2D(2))
+            nw.add(Flatten())
+            nw.add(Dense(27, 4, activation = "softmax"))
+            return nw
+
+        rows += check_network(dense(), images, classes, seed = seed)
+        rows += check_network(cnn(), images, classes, seed = seed)
+
+        #Accelerated paths
+        for build in (dense, cnn):
+            kind = build.__name__
+            rows += check_equivalence(build(), images, classes, name = kind+" float32")
+            rows += check_equivalence(build("mixed_float16"), images, classes, name = kind+" mixed_float16")
+            compiled = build()
+            compiled.compile(4)
+            rows += check_equivalence(compiled, images, classes, name = kind+" compiled")
+            packed = build()
+            packed.pack_params()
+            rows += check_equivalence(packed, images, classes, name = kind+" packed")
+            rows += check_updates(build(), images, classes)
+        nw = dense()
+        pruning.prune(nw, 0.5)
+        rows += check_equivalence(pruning.sparsify(nw, threshold = 1.0), images, name = "sparse", reference = nw)
+        #int8 rounding: only the predicted classes and a loose bound on the probabilities
+        rows += check_equivalence(quantization.quantize(nw, images), images, name = "quantized", reference = nw, rtol = 0.1)
+        rows += check_determinism(dense, images, classes, epochs = 2, batch_size = 4, shuffle = True)
+    if verbose:
+        report(rows)
+    return rows
+
+if __name__ == "__main__":
+    verify()
@@ -0,0 +1,378 @@
+"""
+Benchmarks
+---
+
+Measures the speed and memory use of the network on synthetic MNIST shaped data (no download needed):
+
+- micro: the activation functions, Dense.compute(), Dense.backprop() and Dense.update_wt(), for several
+  layer widths and batch sizes
+- fit: end to end training throughput of Network.fit, in samples per second
+- predict: latency of Network.predict for batch sizes 1 to 4096 (p50 and p99)
+- serve: throughput and latency of concurrent clients sending one sample per request, calling
+  Network.predict directly and through the batching InferenceServer (See ann/serving.py)
+- sparse: latency of Network.predict for pruned copies of the network, made by pruning.sparsify()
+  (unstructured sparsity) and pruning.compact() (pruned neurons), with their speedup over the dense
+  network at the same batch size
+
+Every benchmark also records its peak memory: the largest amount of memory allocated (as seen by
+tracemalloc, which numpy reports its arrays to) during one extra, untimed run.
+
+```
+python bench.py run --output before.json
+... change something ...
+python bench.py run --output after.json
+python bench.py compare before.json after.json --threshold 0.10
+```
+
+"compare" lists every benchmark whose time got worse by more than the threshold (10% by default) and
+exits with status 1 if there is any. Use --quick for a shorter run with fewer repetitions and sizes.
+"""
+
+import io
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import tracemalloc
+import contextlib
+import numpy as np
+import ann
+
+MICRO_WIDTHS = [128, 1000]
+MICRO_BATCHES = [1, 64, 256]
+PREDICT_BATCHES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096]
+
+def synthetic_mnist(n,seed = 0):
+    """
+    Random uint8 images in NCHW format (n, 1, 28, 28) and int32 labels, like mnist.load_mnist() returns
+    """
+    rng = np.random.RandomState(seed)
+    x = rng.randint(0, 256, size = (n, 1, 28, 28)).astype(np.uint8)
+    y = rng.randint(0, 10, size = n).astype(np.int32)
+    return x, y
+
+def build_network(hidden = (1000, 100)):
+    """
+    The network of nn.py: 784 - 1000 - 100 - 10, with SGD and Nesterov momentum
+    """
+    nw = ann.Network(optimizer = ann.optimizers.SGD(lr = 0.01, momentum = 0.9, nesterov = True))
+    nw.add(ann.Flatten(normalize = 255))
+    sizes = (784,) + tuple(hidden)
+    for i in range(len(hidden)):
+        nw.add(ann.Dense(sizes[i], sizes[i+1], activation = "relu"))
+    nw.add(ann.Dense(sizes[-1], 10, activation = "softmax"))
+    return nw
+
+################################################################################
+#
+# MEASUREMENT
+#
+################################################################################
+
+def measure(fn,repeat = 20,warmup = 2,min_time = 0.0):
+    """
+    Times repeated calls of fn, and the peak memory of one more call.
+
+    Input:
+    -----
+    fn: callable
+        Called without arguments
+    repeat: int
+        Minimum number of timed calls
+    warmup: int
+        Number of untimed calls made first
+    min_time: double
+        Keep calling fn until at least this many seconds were measured. Default = 0.0
+
+    Output:
+    -------
+    result: dict
+        Median, p50, p99, minimum and total time of the calls (in seconds), number of calls and peak
+        memory (in bytes)
+    """
+    for i in range(warmup):
+        fn()
+    times = []
+    total = 0.0
+    while len(times) < repeat or total < min_time:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    return dict(summarize(times), peak_bytes = peak_memory(fn))
+
+def summarize(times):
+    times = np.array(times)
+    return {
+        "median_s": float(np.median(times)),
+        "p50_s": float(np.percentile(times, 50)),
+        "p99_s": float(np.percentile(times, 99)),
+        "min_s": float(times.min()),
+        "total_s": float(times.sum()),
+        "calls": int(times.size),
+    }
+
+def peak_memory(fn):
+    """
+    Peak bytes allocated during one call of fn, above what was allocated before the call
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+################################################################################
+#
+# BENCHMARKS
+#
+################################################################################
+
+def bench_micro(quick = False):
+    """
+    Microbenchmarks of the activations and of one Dense layer's compute(), backprop() and update_wt()
+    """
+    results = {}
+    repeat = 5 if quick else 20
+    rng = np.random.RandomState(0)
+    for width in MICRO_WIDTHS:
+        for batch in MICRO_BATCHES:
+            tag = "width="+str(width)+",batch="+str(batch)
+            x = rng.randn(batch, width).astype(np.float32)
+            out = np.empty_like(x)
+            for name in ("relu", "softmax", "linear"):
+                function, derivative = ann.get_activation(name)
+                results["micro/"+name+"/"+tag] = measure(lambda: function(x, out = out), repeat)
+                results["micro/"+name+"_der/"+tag] = measure(lambda: derivative(x, out = out), repeat)
+
+            #A hidden layer (width -> width) with a layer before it, so backprop computes the input errors too
+            prev = ann.Dense(width, width, activation = "relu")
+            layer = ann.Dense(width, width, activation = "relu")
+            prev.next = layer
+            layer.prev = prev
+            layer.data = x
+            layer.compute()
+            bp_data = rng.randn(batch, width).astype(np.float32)
+            results["micro/dense_compute/"+tag] = measure(layer.compute, repeat)
+            results["micro/dense_backprop/"+tag] = measure(lambda: layer.backprop(bp_data), repeat)
+            results["micro/dense_update_wt/"+tag] = measure(layer.update_wt, repeat)
+    return results
+
+def bench_fit(quick = False):
+    """
+    Samples per second of Network.fit on the network of nn.py
+    """
+    results = {}
+    n = 2000 if quick else 10000
+    x, y = synthetic_mnist(n)
+    for batch_size in ([64] if quick else [32, 64, 256]):
+        def fit():
+            nw = build_network()
+            with contextlib.redirect_stdout(io.StringIO()):
+                nw.fit(x = x, y = y, epochs = 1, batch_size = batch_size)
+        res = measure(fit, repeat = 1 if quick else 3, warmup = 0)
+        res["samples_per_s"] = n / res["median_s"]
+        results["fit/batch="+str(batch_size)] = res
+    return results
+
+def bench_predict(quick = False):
+    """
+    Latency of Network.predict for batch sizes 1 to 4096
+    """
+    results = {}
+    nw = build_network()
+    x, y = synthetic_mnist(PREDICT_BATCHES[-1], seed = 1)
+    for batch in (PREDICT_BATCHES[::3] if quick else PREDICT_BATCHES):
+        def predict():
+            with contextlib.redirect_stdout(io.StringIO()):
+                nw.predict(x[:batch], batch_size = batch)
+        res = measure(predict, repeat = 10 if quick else 100, min_time = 0.1 if quick else 1.0)
+        res["samples_per_s"] = batch / res["median_s"]
+        results["predict/batch="+str(batch)] = res
+    return results
+
+def bench_serve(quick = False):
+    """
+    Concurrent clients, each sending one sample per request, answered by Network.predict directly or
+    by an InferenceServer. The median time is the p50 latency of the requests.
+    """
+    from ann import serving
+    results = {}
+    nw = build_network()
+    clients = 8
+    requests = 25 if quick else 200
+    x, y = synthetic_mnist(clients * requests, seed = 2)
+
+    def run_clients(predict):
+        latencies = [[] for i in range(clients)]
+        def client(c):
+            for r in range(requests):
+                i = c * requests + r
+                start = time.perf_counter()
+                predict(x[i:i+1])
+                latencies[c].append(time.perf_counter() - start)
+        def run():
+            threads = [threading.Thread(target = client, args = (c,)) for c in range(clients)]
+            with contextlib.redirect_stdout(io.StringIO()):
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        start = time.perf_counter()
+        run()
+        res = summarize(sum(latencies, []))
+        res["samples_per_s"] = clients * requests / (time.perf_counter() - start)
+        #One more, untimed, run of all the clients, as tracemalloc slows down the allocations
+        res["peak_bytes"] = peak_memory(run)
+        return res
+
+    results["serve/direct,clients="+str(clients)] = run_clients(lambda batch: nw.predict(batch, batch_size = 1))
+    for workers in (1, 2):
+        with serving.InferenceServer(nw, max_batch_size = 64, workers = workers) as server:
+            res = run_clients(server.predict)
+            res["mean_batch_size"] = server.metrics()["batch_size"]["mean"]
+        results["serve/batched,clients="+str(clients)+",workers="+str(workers)] = res
+    return results
+
+def bench_sparse(quick = False):
+    """
+    Latency of Network.predict for the pruned inference copies of the network of nn.py, and their speedup
+    over the dense network ("speedup": dense median time / pruned median time)
+    """
+    from ann import pruning
+    results = {}
+    x, y = synthetic_mnist(256, seed = 3)
+    repeat = 10 if quick else 50
+    cases = [("weights", sparsity) for sparsity in ((0.99,) if quick else (0.9, 0.98, 0.99))]
+    cases += [("neurons", 0.75)]
+    for batch in (1, 256):
+        samples = x[:batch]
+        dense = build_network()
+        def predict(nw):
+            with contextlib.redirect_stdout(io.StringIO()):
+                nw.predict(samples, batch_size = batch)
+        dense_res = measure(lambda: predict(dense), repeat)
+        results["sparse/dense,batch="+str(batch)] = dense_res
+        for structure, sparsity in cases:
+            nw = build_network()
+            pruning.prune(nw, sparsity, structure = structure)
+            if structure == "weights":
+                pruned = pruning.sparsify(nw, batch_size = batch)
+            else:
+                pruned = pruning.compact(nw)
+            res = measure(lambda: predict(pruned), repeat)
+            res["speedup"] = dense_res["median_s"] / res["median_s"]
+            results["sparse/"+structure+"="+str(sparsity)+",batch="+str(batch)] = res
+    return results
+
+BENCHMARKS = {"micro": bench_micro, "fit": bench_fit, "predict": bench_predict, "serve": bench_serve,
+              "sparse": bench_sparse}
+
+def run(names = None,quick = False):
+    """
+    Runs the benchmarks.
+
+    Input:
+    -----
+    names: list
+        Names of the benchmark groups to run ("micro", "fit", "predict", "serve", "sparse"). Default = None (all)
+    quick: bool
+        Fewer repetitions and sizes. Default = False
+
+    Output:
+    -------
+    report: dict
+        {"meta": description of the machine, "results": {benchmark name: result of measure()}}
+    """
+    results = {}
+    for name in (names or list(BENCHMARKS)):
+        print("Running "+name+" benchmarks...")
+        results.update(BENCHMARKS[name](quick))
+    meta = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "quick": quick,
+    }
+    return {"meta": meta, "results": results}
+
+################################################################################
+#
+# COMPARISON
+#
+################################################################################
+
+def compare(old,new,threshold = 0.10):
+    """
+    Compares the median times of the benchmarks present in both reports.
+
+    Input:
+    -----
+    old: dict
+        Baseline report, returned by run()
+    new: dict
+        Report to compare with the baseline
+    threshold: double
+        Relative slowdown above which a benchmark is flagged. Default = 0.10 (10%)
+
+    Output:
+    -------
+    rows: list
+        (name, old median, new median, ratio new / old, flagged), sorted by ratio, slowest first
+    """
+    rows = []
+    for name, res in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before = old["results"][name]["median_s"]
+        after = res["median_s"]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    rows.sort(key = lambda row: -row[3])
+    return rows
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmarks of the network on synthetic MNIST shaped data")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    run_parser = commands.add_parser("run", help = "run the benchmarks")
+    run_parser.add_argument("--output", default = "bench_results.json", help = "JSON file to write the results to")
+    run_parser.add_argument("--only", nargs = "+", choices = list(BENCHMARKS), help = "benchmark groups to run")
+    run_parser.add_argument("--quick", action = "store_true", help = "fewer repetitions and sizes")
+    compare_parser = commands.add_parser("compare", help = "compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type = float, default = 0.10, help = "relative slowdown to flag")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run(args.only, args.quick)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 1)
+        for name, res in report["results"].items():
+            print(name.ljust(48)+str(round(res["median_s"]*1e3, 3)).rjust(12)+" ms"
+                  +str(round(res["peak_bytes"]/2**20, 2)).rjust(10)+" MiB"
+                  +(str(round(res["speedup"], 2)).rjust(8)+"x" if "speedup" in res else ""))
+        print("Results written to "+args.output)
+        return 0
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    rows = compare(old, new, args.threshold)
+    slower = [row for row in rows if row[4]]
+    for name, before, after, ratio, flagged in rows:
+        print(("SLOWER " if flagged else "       ")+name.ljust(48)+str(round(before*1e3, 3)).rjust(12)+" ms"
+              +str(round(after*1e3, 3)).rjust(12)+" ms"+str(round(ratio, 2)).rjust(8)+"x")
+    print(str(len(slower))+" of "+str(len(rows))+" benchmarks slower by more than "+str(round(args.threshold*100))+"%")
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
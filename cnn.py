@@ -0,0 +1,123 @@
+################################################################################
+#
+# LOGISTICS
+#
+#    Sumedh Pranab Sen
+#    NetID: XYZ000000
+#
+# DESCRIPTION
+#
+#    MNIST image classification with a CNN written and trained in Python
+#
+# INSTRUCTIONS
+#
+#    1. Go to Google Colaboratory: https://colab.research.google.com/notebooks/welcome.ipynb
+#    2. File - New Python 3 notebook
+#    3. Cut and paste this file into the cell (feel free to divide into multiple cells)
+#    4. Runtime - Run all
+#
+# NOTES
+#
+#    1. This does not use PyTorch, TensorFlow or any other xNN library
+#
+#    2. Include a short summary here in nn.py of what you did for the neural
+#       network portion of code
+#
+#    3. Include a short summary here in cnn.py of what you did for the
+#       convolutional neural network portion of code
+#
+#    4. Include a short summary here in extra.py of what you did for the extra
+#       portion of code
+#
+################################################################################
+
+"""# Convolutional Neural Network without Tensorflow, Keras, PyTorch
+---
+### Summary
+
+1.   Two convolution layers (3x3 filters, same padding, relu), each followed by 2x2 max pooling, then a small
+classifier of two Dense layers. The images stay in NCHW format (batch, channels, rows, cols) until the
+Flatten layer.
+2.   The convolutions don't loop over images or pixels: all 3x3 windows of a batch are a zero copy view of the
+images (numpy stride tricks), multiplied with the filters in a single matrix product.
+3.   About 333 thousand multiply-accumulates per image, against 885 thousand for the 784-1000-100-10 MLP of
+nn.py. describe() prints them per layer.
+
+
+```
+nw.add(Conv2D(1, 8, 3, padding = 1, activation = "relu", normalize = 255, input_shape = (1, 28, 28)))
+nw.add(MaxPool2D(2))
+```
+"""
+
+################################################################################
+#
+# IMPORT
+#
+################################################################################
+from ann import Network, Flatten, Dense, Conv2D, MaxPool2D, optimizers, mnist, plotting
+
+################################################################################
+#
+# PARAMETERS
+#
+################################################################################
+# data
+DATA_NUM_TRAIN         = 60000
+DATA_NUM_TEST          = 10000
+DATA_CHANNELS          = 1
+DATA_ROWS              = 28
+DATA_COLS              = 28
+DATA_CLASSES           = 10
+DATA_DIR               = '.'
+
+# model
+MODEL_FILTERS_1        = 8
+MODEL_FILTERS_2        = 16
+MODEL_HIDDEN           = 64
+
+# training
+TRAINING_EPOCHS        = 10
+TRAINING_BATCH_SIZE    = 64
+
+# display
+DISPLAY_ROWS   = 8
+DISPLAY_COLS   = 4
+DISPLAY_COL_IN = 10
+DISPLAY_ROW_IN = 25
+DISPLAY_NUM    = DISPLAY_ROWS*DISPLAY_COLS
+
+################################################################################
+#
+# TRAINING
+#
+################################################################################
+
+def main():
+    train_data, train_labels, test_data, test_labels = mnist.load_mnist(DATA_DIR)
+
+    nw = Network(optimizer = optimizers.SGD(lr = 0.01, momentum = 0.9, nesterov = True))
+    # 1x28x28 -> 8x28x28 -> 8x14x14
+    nw.add(Conv2D(DATA_CHANNELS, MODEL_FILTERS_1, 3, padding = 1, activation = "relu", normalize = 255,
+                  input_shape = (DATA_CHANNELS, DATA_ROWS, DATA_COLS)))
+    nw.add(MaxPool2D(2))
+    # 8x14x14 -> 16x14x14 -> 16x7x7
+    nw.add(Conv2D(MODEL_FILTERS_1, MODEL_FILTERS_2, 3, padding = 1, activation = "relu"))
+    nw.add(MaxPool2D(2))
+    nw.add(Flatten())
+    nw.add(Dense(MODEL_FILTERS_2*(DATA_ROWS//4)*(DATA_COLS//4), MODEL_HIDDEN, activation = "relu"))
+    nw.add(Dense(MODEL_HIDDEN, DATA_CLASSES, activation = "softmax"))
+    nw.describe()
+    nw.fit(x = train_data, y = train_labels, epochs = TRAINING_EPOCHS, validation_split = 0.10,
+           batch_size = TRAINING_BATCH_SIZE, shuffle = True)
+    plotting.plot_history(nw)
+    y_pred = nw.predict(test_data)
+
+    fin_accuracy = nw.accuracy(y_pred,test_labels)
+    print("Final accuracy: "+str(fin_accuracy))
+
+    plotting.show_predictions(test_data, test_labels, y_pred, DISPLAY_ROWS, DISPLAY_COLS, 
+                              (DISPLAY_COL_IN, DISPLAY_ROW_IN))
+
+if __name__ == "__main__":
+    main()